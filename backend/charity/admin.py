@@ -5,6 +5,7 @@ from .models import (
     DuaMessage,
     Juz,
     Khatma,
+    OutboxEvent,
     ParticipantProgress,
     ReferralAction,
     TasbeehCounter,
@@ -15,8 +16,8 @@ from .models import (
 
 @admin.register(Khatma)
 class KhatmaAdmin(admin.ModelAdmin):
-    list_display = ("number", "is_completed", "created_at", "completed_at")
-    list_filter = ("is_completed",)
+    list_display = ("number", "is_completed", "is_standby", "completed_count", "created_at", "completed_at")
+    list_filter = ("is_completed", "is_standby")
     search_fields = ("number",)
 
 
@@ -86,3 +87,11 @@ class TeamMembershipAdmin(admin.ModelAdmin):
     list_display = ("team", "participant", "joined_at")
     search_fields = ("team__name", "team__code", "participant__name")
     readonly_fields = ("joined_at",)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("event_type", "attempts", "available_at", "delivered_at", "created_at")
+    list_filter = ("event_type",)
+    search_fields = ("event_type", "last_error")
+    readonly_fields = ("created_at",)
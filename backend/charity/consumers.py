@@ -1,21 +1,74 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .realtime import DEFAULT_TOPICS, MAX_TOPICS_PER_SOCKET, dispatcher, resolve_topics, topic_group_name
+from .subscriptions import batch_frame, parse_since, parse_topics, prepare_subscription
 
 
 class LiveUpdatesConsumer(AsyncJsonWebsocketConsumer):
-    group_name = "live_updates"
+    """كل مقبس يشترك في مواضيع محددة (khatma:<n>، team:<code>، participant:<name>، tasbeeh...)
+    فلا يصله إلا ما يهمه. المواضيع الأولية تأتي من ?topics= ويمكن تعديلها عبر رسائل subscribe/unsubscribe.
+
+    العميل العائد يرسل ?since= بآخر نسخة طبقها لكل موضوع، فيستلم الأحداث الفائتة
+    أو لقطة مختصرة قبل رسالة subscribed بدل إعادة تحميل كل البيانات.
+    """
+
+    @classmethod
+    async def encode_json(cls, content):
+        return json.dumps(content, cls=DjangoJSONEncoder)
 
     async def connect(self):
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.topics: set[str] = set()
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        requested = parse_topics(query.get("topics", []))
+        since = parse_since(query.get("since", [""])[-1])
+        dispatcher.bind_loop(asyncio.get_running_loop())
         await self.accept()
-        await self.send_json({"type": "connected", "detail": "live_updates_connected"})
+        await self.subscribe(requested or DEFAULT_TOPICS, since)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def live_event(self, event):
-        await self.send_json(
-            {
-                "type": event.get("event_type", "update"),
-                "payload": event.get("payload", {}),
-            }
-        )
+        for topic in self.topics:
+            await self.channel_layer.group_discard(topic_group_name(topic), self.channel_name)
+        self.topics = set()
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get("action") if isinstance(content, dict) else None
+        topics = content.get("topics") if isinstance(content, dict) else None
+        if action not in {"subscribe", "unsubscribe"} or not isinstance(topics, list):
+            await self.send_json({"type": "error", "detail": "invalid_action"})
+            return
+
+        if action == "subscribe":
+            await self.subscribe(topics, parse_since(content.get("since")))
+        else:
+            await self.unsubscribe(topics)
+
+    async def subscribe(self, requested, since=None):
+        topics = []
+        for topic in await database_sync_to_async(resolve_topics)(requested):
+            if topic not in self.topics and len(self.topics) >= MAX_TOPICS_PER_SOCKET:
+                continue
+            # ننضم للمجموعة قبل قراءة النسخ حتى لا يضيع حدث بين القراءة والاشتراك.
+            await self.channel_layer.group_add(topic_group_name(topic), self.channel_name)
+            self.topics.add(topic)
+            topics.append(topic)
+
+        accepted, frames = await database_sync_to_async(prepare_subscription)(topics, since or {})
+        for frame in frames:
+            await self.send_json(frame)
+        await self.send_json({"type": "subscribed", "detail": "live_updates_connected", "topics": accepted})
+
+    async def unsubscribe(self, requested):
+        removed = [topic for topic in requested if topic in self.topics]
+        for topic in removed:
+            await self.channel_layer.group_discard(topic_group_name(topic), self.channel_name)
+            self.topics.discard(topic)
+        await self.send_json({"type": "unsubscribed", "topics": removed})
+
+    async def live_batch(self, event):
+        await self.send_json(batch_frame(event))
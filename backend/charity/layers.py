@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChannelLayerMessage
+
+
+class DatabaseChannelLayer(InMemoryChannelLayer):
+    """طبقة قنوات تعمل عبر عدة عمليات على نفس الخادم دون Redis.
+
+    عضوية المجموعات محلية لكل عملية (لأن المقابس محلية أصلًا)، بينما يُكتب كل
+    group_send في جدول ChannelLayerMessage، وتقرأ كل عملية لديها مشتركون الرسائل
+    الجديدة دوريًا وتوزعها على مقابسها المحلية.
+
+    المعرّف يُحجز عند الإدراج ويظهر عند الاعتماد، فقد تظهر رسالة بمعرّف أصغر من
+    آخر ما قرأناه. لذلك نعيد فحص ما تحت الحد الأعلى خلال visibility_grace ثانية
+    ونتجاهل ما سبق توزيعه.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = 0.25,
+        message_retention: int = 120,
+        batch_size: int = 500,
+        visibility_grace: float = 5,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.poll_interval = poll_interval
+        self.message_retention = message_retention
+        self.batch_size = batch_size
+        self.visibility_grace = visibility_grace
+        self._reader: asyncio.Task | None = None
+        self._last_id: int | None = None
+        self._seen: dict[int, datetime] = {}
+        self._polls = 0
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await database_sync_to_async(self._publish)(group, message)
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def flush(self):
+        await super().flush()
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+
+    async def close(self):
+        await self.flush()
+
+    async def deliver_pending(self) -> int:
+        if self._last_id is None:
+            self._last_id, self._seen = await database_sync_to_async(self._start_position)()
+
+        rows = await database_sync_to_async(self._fetch_pending)(self._last_id, set(self._seen))
+        for message_id, group, payload, created_at in rows:
+            self._seen[message_id] = created_at
+            self._last_id = max(self._last_id, message_id)
+            await InMemoryChannelLayer.group_send(self, group, payload)
+
+        cutoff = self._grace_cutoff()
+        self._seen = {message_id: created_at for message_id, created_at in self._seen.items() if created_at >= cutoff}
+        return len(rows)
+
+    async def _read_loop(self):
+        while self.groups:
+            try:
+                delivered = await self.deliver_pending()
+                self._polls += 1
+                if self._polls % 200 == 0:
+                    await database_sync_to_async(self._prune)()
+            except Exception:
+                # خلل مؤقت في قاعدة البيانات لا يجب أن يوقف القارئ نهائيًا.
+                delivered = 0
+            if delivered < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def _publish(self, group: str, message: dict) -> None:
+        ChannelLayerMessage.objects.create(group=group, payload=message)
+
+    def _grace_cutoff(self) -> datetime:
+        return timezone.now() - timedelta(seconds=self.visibility_grace)
+
+    def _start_position(self) -> tuple[int, dict[int, datetime]]:
+        # ما كان ظاهرًا قبل بدء القراءة لا يُوزع، حتى لو وقع داخل نافذة إعادة الفحص.
+        last_id = ChannelLayerMessage.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        recent = ChannelLayerMessage.objects.filter(id__lte=last_id, created_at__gte=self._grace_cutoff())
+        return last_id, dict(recent.values_list("id", "created_at"))
+
+    def _fetch_pending(self, last_id: int, seen: set[int]) -> list[tuple[int, str, dict, datetime]]:
+        late_ids = [
+            message_id
+            for message_id in ChannelLayerMessage.objects.filter(
+                id__lte=last_id, created_at__gte=self._grace_cutoff()
+            ).values_list("id", flat=True)
+            if message_id not in seen
+        ]
+        return list(
+            ChannelLayerMessage.objects.filter(Q(id__gt=last_id) | Q(id__in=late_ids))
+            .order_by("id")
+            .values_list("id", "group", "payload", "created_at")[: self.batch_size]
+        )
+
+    def _prune(self) -> None:
+        cutoff = timezone.now() - timedelta(seconds=self.message_retention)
+        ChannelLayerMessage.objects.filter(created_at__lt=cutoff).delete()
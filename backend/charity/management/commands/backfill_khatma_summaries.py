@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from charity.models import Khatma
+from charity.services import build_khatma_summary, bump_data_version
+
+
+class Command(BaseCommand):
+    help = "ينشئ ملخصات الختمات التي اكتملت قبل إضافة جدول KhatmaSummary، ليظهر سجلها كاملًا."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="إعادة بناء ملخصات كل الختمات المكتملة.")
+
+    def handle(self, *args, **options):
+        khatmas = Khatma.objects.filter(is_completed=True).order_by("number")
+        if not options["rebuild"]:
+            khatmas = khatmas.filter(summary__isnull=True)
+
+        written = 0
+        for khatma in khatmas.iterator():
+            with transaction.atomic():
+                build_khatma_summary(khatma)
+            written += 1
+
+        if written:
+            bump_data_version("khatma")
+        self.stdout.write(f"wrote {written} khatma summary(ies)")
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from charity.realtime import dispatcher
+from charity.services import (
+    ensure_standby_khatmas,
+    finalize_completed_khatmas,
+    next_reservation_expiry,
+    sweep_expired_reservations,
+)
+
+
+class Command(BaseCommand):
+    help = "يحرر الأجزاء عند انتهاء مهلة حجزها تمامًا، بدل تحريرها عند كل طلب قراءة."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="تنفيذ جولة واحدة ثم الخروج.")
+        parser.add_argument(
+            "--max-sleep",
+            type=float,
+            default=30.0,
+            help="أقصى مدة انتظار بالثواني بين جولتين، حتى تُلتقط الحجوزات الجديدة.",
+        )
+
+    def handle(self, *args, **options):
+        # هذه العملية لا تحمل مقابس: أحداثها تبقى في صندوق الصادر لتبثها عملية الخادم.
+        with dispatcher.detached():
+            self.sweep(once=options["once"], max_sleep=options["max_sleep"])
+
+    def sweep(self, *, once: bool, max_sleep: float):
+        while True:
+            close_old_connections()
+            released = sweep_expired_reservations()
+            if released:
+                self.stdout.write(f"released {released} expired reservation(s)")
+            finalized = finalize_completed_khatmas()
+            if finalized:
+                self.stdout.write(f"finalized {finalized} completed khatma(s)")
+            # الختمة التالية تُجهز هنا في الخلفية، فيبقى الإتمام الأخير تبديل علم فقط.
+            standby = ensure_standby_khatmas()
+            if standby:
+                self.stdout.write(f"prepared {standby} standby khatma(s)")
+            if once:
+                return
+
+            # ننام حتى أقرب موعد انتهاء فقط، فلا مسح دوري للجدول ولا تأخير في التحرير.
+            delay = max_sleep
+            next_expiry = next_reservation_expiry()
+            if next_expiry is not None:
+                delay = min(delay, max(0.0, (next_expiry - timezone.now()).total_seconds()))
+            time.sleep(delay)
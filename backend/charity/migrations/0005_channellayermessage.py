@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0004_liveevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChannelLayerMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("group", models.CharField(max_length=100)),
+                ("payload", models.JSONField(default=dict)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["created_at"], name="charity_cha_created_4cb889_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+def clear_live_events(apps, schema_editor):
+    # سجل البث مؤقت بطبيعته؛ النسخ القديمة العامة لا معنى لها بعد تقسيمه حسب الموضوع.
+    apps.get_model("charity", "LiveEvent").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0006_outboxevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LiveTopic",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=160, unique=True)),
+                ("last_version", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(clear_live_events, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="liveevent",
+            name="topic",
+            field=models.CharField(default="", max_length=160),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="liveevent",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="outboxevent",
+            name="topics",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddConstraint(
+            model_name="liveevent",
+            constraint=models.UniqueConstraint(
+                fields=("topic", "version"), name="unique_live_event_version_per_topic"
+            ),
+        ),
+    ]
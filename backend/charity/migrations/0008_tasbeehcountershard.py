@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0007_live_topics"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TasbeehCounterShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stripe", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+                (
+                    "counter",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="charity.tasbeehcounter",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="tasbeehcountershard",
+            constraint=models.UniqueConstraint(
+                fields=("counter", "stripe"), name="unique_tasbeeh_shard_stripe"
+            ),
+        ),
+    ]
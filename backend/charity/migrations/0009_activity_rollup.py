@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0008_tasbeehcountershard"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="activityevent",
+            name="count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="activityevent",
+            name="rollup_key",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddConstraint(
+            model_name="activityevent",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("rollup_key", ""), _negated=True),
+                fields=("rollup_key",),
+                name="unique_activity_rollup_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0009_activity_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "metric",
+                    models.CharField(
+                        choices=[
+                            ("tasbeeh", "تسبيح"),
+                            ("reserve", "حجز"),
+                            ("complete", "إنجاز"),
+                            ("dua", "دعاء"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("minute", "دقيقة"), ("hour", "ساعة")], max_length=10
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                ("stripe", models.PositiveSmallIntegerField(default=0)),
+                ("count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["bucket_start"],
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket_start"],
+                        name="charity_tre_resolut_1525b3_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="trendbucket",
+            constraint=models.UniqueConstraint(
+                fields=("metric", "resolution", "bucket_start", "stripe"),
+                name="unique_trend_bucket",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0010_trendbucket"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="juz",
+            index=models.Index(
+                condition=models.Q(
+                    ("completed_at__isnull", True), ("reserved_by__isnull", False)
+                ),
+                fields=["reservation_expires_at"],
+                name="juz_open_expiry_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:20
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_completed_count(apps, schema_editor):
+    Khatma = apps.get_model("charity", "Khatma")
+    done = Khatma.objects.annotate(done=Count("ajzaa", filter=Q(ajzaa__completed_at__isnull=False))).filter(done__gt=0)
+    for khatma in done:
+        Khatma.objects.filter(pk=khatma.pk).update(completed_count=khatma.done)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0012_waitlistentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="khatma",
+            name="completed_count",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="khatma",
+            name="is_standby",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_completed_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0013_khatma_standby_completed_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KhatmaSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("khatma_number", models.PositiveIntegerField(unique=True)),
+                ("started_at", models.DateTimeField()),
+                ("completed_at", models.DateTimeField()),
+                ("duration_seconds", models.PositiveIntegerField(default=0)),
+                ("completed_juz_count", models.PositiveSmallIntegerField(default=0)),
+                ("participants_count", models.PositiveIntegerField(default=0)),
+                ("top_readers", models.JSONField(blank=True, default=list)),
+                (
+                    "khatma",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="summary",
+                        to="charity.khatma",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-khatma_number"],
+            },
+        ),
+    ]
@@ -0,0 +1,156 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import Q
+import django.db.models.deletion
+
+# نسخة مجمدة من charity.names.name_key كما كانت عند كتابة هذا الترحيل؛ تعديل التطبيع لاحقًا
+# يحتاج ترحيلًا جديدًا، لا أن يغير ما يفعله هذا الترحيل.
+ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ALEF_FORMS = str.maketrans({"\u0622": "\u0627", "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627"})
+
+
+def name_key(name):
+    text = unicodedata.normalize("NFKC", name or "")
+    text = ARABIC_MARKS.sub("", text).translate(ALEF_FORMS)
+    return " ".join(text.casefold().split())
+
+
+COUNTER_FIELDS = ["reservations_count", "completions_count", "tasbeeh_count", "dua_count"]
+
+
+def merge_participant(apps, survivor, duplicate):
+    """يدمج مشاركًا قديمًا في مشارك آخر له نفس المفتاح: تُجمع العدادات وتُنقل كل العلاقات."""
+    ParticipantProgress = apps.get_model("charity", "ParticipantProgress")
+    ReferralAction = apps.get_model("charity", "ReferralAction")
+    TeamGroup = apps.get_model("charity", "TeamGroup")
+    TeamMembership = apps.get_model("charity", "TeamMembership")
+
+    for field in COUNTER_FIELDS:
+        setattr(survivor, field, getattr(survivor, field) + getattr(duplicate, field))
+    survivor.streak_days = max(survivor.streak_days, duplicate.streak_days)
+    survivor.best_streak_days = max(survivor.best_streak_days, duplicate.best_streak_days)
+    survivor.last_activity_date = max(
+        filter(None, [survivor.last_activity_date, duplicate.last_activity_date]), default=None
+    )
+    survivor.referral_code = survivor.referral_code or duplicate.referral_code
+    if survivor.referred_by_id in (None, duplicate.pk) and duplicate.referred_by_id != survivor.pk:
+        survivor.referred_by_id = duplicate.referred_by_id
+    if survivor.referred_by_id == duplicate.pk:
+        survivor.referred_by_id = None
+
+    ParticipantProgress.objects.filter(referred_by=duplicate).update(referred_by=survivor)
+    ReferralAction.objects.filter(inviter=duplicate).update(inviter=survivor)
+    ReferralAction.objects.filter(invited=duplicate).update(invited=survivor)
+    ReferralAction.objects.filter(inviter=survivor, invited=survivor).delete()
+    TeamGroup.objects.filter(created_by=duplicate).update(created_by=survivor)
+    if TeamMembership.objects.filter(participant=survivor).exists():
+        TeamMembership.objects.filter(participant=duplicate).delete()
+    else:
+        TeamMembership.objects.filter(participant=duplicate).update(participant=survivor)
+
+    duplicate.delete()
+    ParticipantProgress.objects.filter(pk=survivor.pk).update(
+        **{field: getattr(survivor, field) for field in COUNTER_FIELDS},
+        streak_days=survivor.streak_days,
+        best_streak_days=survivor.best_streak_days,
+        last_activity_date=survivor.last_activity_date,
+        referral_code=survivor.referral_code,
+        referred_by_id=survivor.referred_by_id,
+    )
+
+
+def backfill_participants(apps, schema_editor):
+    """يملأ مفاتيح المشاركين ويدمج المتصادمين، ثم يربط الحجوزات والإتمامات بهم عبر المفتاح."""
+    ParticipantProgress = apps.get_model("charity", "ParticipantProgress")
+    Juz = apps.get_model("charity", "Juz")
+
+    survivors = {}
+    for participant in ParticipantProgress.objects.order_by("id"):
+        key = name_key(participant.name)
+        if key in survivors:
+            # اسمان قديمان يختلفان بالتشكيل أو الهمزة فقط هما نفس المشارك: يُدمج الأحدث في الأقدم،
+            # فترتبط أجزاؤه أدناه بالأقدم عبر نفس المفتاح.
+            merge_participant(apps, survivors[key], participant)
+            continue
+        participant.name_key = key
+        survivors[key] = participant
+    ParticipantProgress.objects.bulk_update(list(survivors.values()), ["name_key"], batch_size=500)
+
+    participants = {key: participant.pk for key, participant in survivors.items()}
+
+    def participant_id(display_name):
+        # اسم قديم على جزء بلا سجل مشارك: ننشئ له مشاركًا.
+        key = name_key(display_name)
+        if key not in participants:
+            participants[key] = ParticipantProgress.objects.create(name=display_name, name_key=key).pk
+        return participants[key]
+
+    ajzaa = list(Juz.objects.filter(Q(reserved_by__isnull=False) | Q(completed_by__isnull=False)))
+    for juz in ajzaa:
+        if juz.reserved_by:
+            juz.reserved_by_participant_id = participant_id(juz.reserved_by)
+        if juz.completed_by:
+            juz.completed_by_participant_id = participant_id(juz.completed_by)
+    Juz.objects.bulk_update(ajzaa, ["reserved_by_participant", "completed_by_participant"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0014_khatmasummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="participantprogress",
+            name="name_key",
+            field=models.CharField(max_length=120, null=True),
+        ),
+        migrations.AddField(
+            model_name="juz",
+            name="completed_by_participant",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="charity.participantprogress",
+            ),
+        ),
+        migrations.AddField(
+            model_name="juz",
+            name="reserved_by_participant",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="charity.participantprogress",
+            ),
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="participantprogress",
+            name="name_key",
+            field=models.CharField(max_length=120, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="juz",
+            index=models.Index(
+                condition=models.Q(("completed_at__isnull", True)),
+                fields=["reserved_by_participant", "reservation_expires_at"],
+                name="juz_pending_reserver_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="juz",
+            index=models.Index(
+                condition=models.Q(("completed_at__isnull", False)),
+                fields=["completed_by_participant"],
+                name="juz_completer_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def mark_topics_published(apps, schema_editor):
+    # ما سُجّل قبل هذا الترحيل أُرسل بالفعل داخل معاملة التسجيل نفسها.
+    apps.get_model("charity", "LiveTopic").objects.update(published_version=F("last_version"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0015_participant_name_keys"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="livetopic",
+            name="published_version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="livetopic",
+            name="publish_after",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="livetopic",
+            name="publish_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_topics_published, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="livetopic",
+            index=models.Index(
+                condition=Q(("publish_after__isnull", False)),
+                fields=["publish_after"],
+                name="live_topic_unpublished_idx",
+            ),
+        ),
+    ]
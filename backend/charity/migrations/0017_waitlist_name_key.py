@@ -0,0 +1,60 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# نسخة مجمدة من charity.names.name_key، مثل 0015.
+ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ALEF_FORMS = str.maketrans({"\u0622": "\u0627", "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627"})
+
+
+def name_key(name):
+    text = unicodedata.normalize("NFKC", name or "")
+    text = ARABIC_MARKS.sub("", text).translate(ALEF_FORMS)
+    return " ".join(text.casefold().split())
+
+
+def backfill_waitlist_name_keys(apps, schema_editor):
+    WaitlistEntry = apps.get_model("charity", "WaitlistEntry")
+
+    pending = set()
+    entries = list(WaitlistEntry.objects.order_by("id"))
+    duplicates = []
+    for entry in entries:
+        entry.name_key = name_key(entry.name)
+        if entry.assigned_at is None:
+            # نفس المشارك منتظر مرتين بتشكيلين مختلفين: يبقى أقدم مكان ويُحذف التكرار الأحدث.
+            if entry.name_key in pending:
+                duplicates.append(entry.pk)
+            pending.add(entry.name_key)
+    WaitlistEntry.objects.bulk_update(entries, ["name_key"], batch_size=500)
+    WaitlistEntry.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("charity", "0016_live_topic_publish_state"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="waitlistentry",
+            name="one_pending_waitlist_per_name",
+        ),
+        migrations.AddField(
+            model_name="waitlistentry",
+            name="name_key",
+            field=models.CharField(default="", max_length=120),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_waitlist_name_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="waitlistentry",
+            constraint=models.UniqueConstraint(
+                condition=Q(("assigned_at__isnull", True)),
+                fields=("name_key",),
+                name="one_pending_waitlist_per_name",
+            ),
+        ),
+    ]
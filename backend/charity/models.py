@@ -3,10 +3,16 @@ from django.db import models
 from django.db.models import Q
 from django.utils import timezone
 
+from .names import name_key
+
 
 class Khatma(models.Model):
     number = models.PositiveIntegerField(unique=True)
     is_completed = models.BooleanField(default=False)
+    # ختمة احتياطية بأجزائها الثلاثين جاهزة مسبقًا؛ الانتقال إليها تبديل علم فقط.
+    is_standby = models.BooleanField(default=False)
+    # عداد الأجزاء المكتملة يُحدَّث مع كل إتمام بدل إعادة العد عند كل طلب.
+    completed_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
@@ -17,6 +23,25 @@ class Khatma(models.Model):
         return f"الختمة رقم {self.number}"
 
 
+class KhatmaSummary(models.Model):
+    """ملخص الختمة المكتملة يُكتب مرة عند إغلاقها، فيُقرأ السجل بمسح مرتب واحد بدل تجميع أجزاء كل ختمة."""
+
+    khatma = models.OneToOneField(Khatma, on_delete=models.CASCADE, related_name="summary")
+    khatma_number = models.PositiveIntegerField(unique=True)
+    started_at = models.DateTimeField()
+    completed_at = models.DateTimeField()
+    duration_seconds = models.PositiveIntegerField(default=0)
+    completed_juz_count = models.PositiveSmallIntegerField(default=0)
+    participants_count = models.PositiveIntegerField(default=0)
+    top_readers = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ["-khatma_number"]
+
+    def __str__(self) -> str:
+        return f"ملخص الختمة رقم {self.khatma_number}"
+
+
 class Juz(models.Model):
     khatma = models.ForeignKey(Khatma, on_delete=models.CASCADE, related_name="ajzaa")
     juz_number = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(30)])
@@ -25,6 +50,14 @@ class Juz(models.Model):
     reservation_expires_at = models.DateTimeField(null=True, blank=True)
     completed_by = models.CharField(max_length=120, null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # هوية الحاجز والمتمّ كمفتاح أجنبي؛ الحقلان النصيان أعلاه للعرض فقط. فهرسا المفتاحين هما
+    # الفهرسان الجزئيان أدناه بدل فهرس كامل على كل الصفوف.
+    reserved_by_participant = models.ForeignKey(
+        "ParticipantProgress", null=True, blank=True, on_delete=models.SET_NULL, related_name="+", db_index=False
+    )
+    completed_by_participant = models.ForeignKey(
+        "ParticipantProgress", null=True, blank=True, on_delete=models.SET_NULL, related_name="+", db_index=False
+    )
 
     class Meta:
         ordering = ["juz_number"]
@@ -35,6 +68,25 @@ class Juz(models.Model):
                 name="juz_reservation_consistency",
             ),
         ]
+        # فهارس جزئية لمرشحات الأجزاء الساخنة: الحجوزات القائمة حسب موعد انتهائها، وحجوزات/إنجازات
+        # مشارك بعينه بمفتاحه الأجنبي. تبقى صغيرة لأن الأجزاء الفارغة لا تدخلها.
+        indexes = [
+            models.Index(
+                fields=["reservation_expires_at"],
+                condition=Q(reserved_by__isnull=False, completed_at__isnull=True),
+                name="juz_open_expiry_idx",
+            ),
+            models.Index(
+                fields=["reserved_by_participant", "reservation_expires_at"],
+                condition=Q(completed_at__isnull=True),
+                name="juz_pending_reserver_idx",
+            ),
+            models.Index(
+                fields=["completed_by_participant"],
+                condition=Q(completed_at__isnull=False),
+                name="juz_completer_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"الجزء {self.juz_number} - الختمة {self.khatma.number}"
@@ -67,6 +119,25 @@ class TasbeehCounter(models.Model):
         return f"{self.phrase}: {self.count}"
 
 
+class TasbeehCounterShard(models.Model):
+    """شريحة من عداد الذكر؛ كل زيادة تذهب لشريحة عشوائية حتى لا تتزاحم الطلبات على صف واحد.
+
+    العدد الكلي = TasbeehCounter.count (الرصيد السابق للتقسيم) + مجموع الشرائح.
+    """
+
+    counter = models.ForeignKey(TasbeehCounter, on_delete=models.CASCADE, related_name="shards")
+    stripe = models.PositiveSmallIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["counter", "stripe"], name="unique_tasbeeh_shard_stripe"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.counter_id}#{self.stripe}: {self.count}"
+
+
 class ActivityEvent(models.Model):
     RESERVE = "reserve"
     COMPLETE = "complete"
@@ -95,6 +166,9 @@ class ActivityEvent(models.Model):
         blank=True,
         validators=[MinValueValidator(1), MaxValueValidator(30)],
     )
+    # أحداث التسبيح لنفس (المشارك، الذكر) داخل نافذة زمنية تُدمج في صف واحد بعدد مجمع.
+    count = models.PositiveIntegerField(default=1)
+    rollup_key = models.CharField(max_length=255, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -103,6 +177,13 @@ class ActivityEvent(models.Model):
             models.Index(fields=["-created_at"]),
             models.Index(fields=["event_type", "-created_at"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["rollup_key"],
+                condition=~Q(rollup_key=""),
+                name="unique_activity_rollup_key",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.message
@@ -123,6 +204,8 @@ class DuaMessage(models.Model):
 
 class ParticipantProgress(models.Model):
     name = models.CharField(max_length=120, unique=True)
+    # هوية المشارك للبحث: name_key(name)، يُحسب عند الحفظ.
+    name_key = models.CharField(max_length=120, unique=True)
     referral_code = models.CharField(max_length=16, unique=True, null=True, blank=True, default=None)
     referred_by = models.ForeignKey(
         "self",
@@ -147,6 +230,11 @@ class ParticipantProgress(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.name_key:
+            self.name_key = name_key(self.name)
+        super().save(*args, **kwargs)
+
 
 class ReferralAction(models.Model):
     RESERVE = "reserve"
@@ -214,3 +302,155 @@ class TeamMembership(models.Model):
             models.UniqueConstraint(fields=["team", "participant"], name="unique_team_member"),
             models.UniqueConstraint(fields=["participant"], name="one_team_per_participant"),
         ]
+
+
+class WaitlistEntry(models.Model):
+    """طابور انتظار لجزء متاح (أو جزء بعينه) يُخدم بالترتيب عند تحرير أي جزء."""
+
+    name = models.CharField(max_length=120)
+    # نفس مفتاح هوية المشارك، فلا يحجز الاسم مكانين بتشكيلين مختلفين.
+    name_key = models.CharField(max_length=120)
+    ref_code = models.CharField(max_length=16, blank=True, default="")
+    juz_number = models.PositiveSmallIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(30)]
+    )
+    assigned_juz = models.ForeignKey(Juz, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    assigned_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["id"], condition=Q(assigned_at__isnull=True), name="waitlist_pending_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name_key"], condition=Q(assigned_at__isnull=True), name="one_pending_waitlist_per_name"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ينتظر الجزء {self.juz_number or 'المتاح التالي'}"
+
+    def save(self, *args, **kwargs):
+        if not self.name_key:
+            self.name_key = name_key(self.name)
+        super().save(*args, **kwargs)
+
+
+class TrendBucket(models.Model):
+    """عدادات مجمعة لكل دقيقة/ساعة تُحدّث تدريجيًا من الخدمات لخدمة الرسوم البيانية دون مسح السجل."""
+
+    TASBEEH = "tasbeeh"
+    RESERVE = "reserve"
+    COMPLETE = "complete"
+    DUA = "dua"
+
+    METRIC_CHOICES = [
+        (TASBEEH, "تسبيح"),
+        (RESERVE, "حجز"),
+        (COMPLETE, "إنجاز"),
+        (DUA, "دعاء"),
+    ]
+
+    MINUTE = "minute"
+    HOUR = "hour"
+
+    RESOLUTION_CHOICES = [
+        (MINUTE, "دقيقة"),
+        (HOUR, "ساعة"),
+    ]
+
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    # التسبيح يوزع على شرائح مثل TasbeehCounterShard حتى لا يصبح صف الدقيقة نقطة تزاحم.
+    stripe = models.PositiveSmallIntegerField(default=0)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ["bucket_start"]
+        indexes = [models.Index(fields=["resolution", "bucket_start"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["metric", "resolution", "bucket_start", "stripe"],
+                name="unique_trend_bucket",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.metric}/{self.resolution} {self.bucket_start:%Y-%m-%d %H:%M}: {self.count}"
+
+
+class LiveTopic(models.Model):
+    name = models.CharField(max_length=160, unique=True)
+    last_version = models.PositiveBigIntegerField(default=0)
+    published_version = models.PositiveBigIntegerField(default=0)
+    publish_after = models.DateTimeField(null=True, blank=True)
+    publish_attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["publish_after"],
+                condition=Q(publish_after__isnull=False),
+                name="live_topic_unpublished_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.last_version}"
+
+
+class LiveEvent(models.Model):
+    topic = models.CharField(max_length=160)
+    version = models.PositiveBigIntegerField()
+    event_type = models.CharField(max_length=40)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["topic", "version"], name="unique_live_event_version_per_topic"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.topic} {self.event_type} #{self.version}"
+
+
+class ChannelLayerMessage(models.Model):
+    group = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.group} #{self.pk}"
+
+
+class OutboxEvent(models.Model):
+    event_type = models.CharField(max_length=40)
+    payload = models.JSONField(default=dict, blank=True)
+    topics = models.JSONField(default=list, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["available_at"],
+                condition=Q(delivered_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.event_type} #{self.pk}"
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+
+# التشكيل وعلامات القرآن الصغيرة والتطويل لا تغير هوية الاسم.
+ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+ALEF_FORMS = str.maketrans({"\u0622": "\u0627", "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627"})
+
+
+def name_key(name: str | None) -> str:
+    """مفتاح هوية المشارك: "أحمد" و"احمد" و"أَحْمَد" و"AHMED"/"ahmed" مفتاح واحد.
+
+    يُخزن في عمود مفهرس فتصير كل مطابقات الأسماء مساواة تامة بدل __iexact.
+    """
+    text = unicodedata.normalize("NFKC", name or "")
+    text = ARABIC_MARKS.sub("", text).translate(ALEF_FORMS)
+    return " ".join(text.casefold().split())
@@ -1,33 +1,409 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import itertools
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import timedelta
 from typing import Any
 
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Khatma, LiveEvent, LiveTopic, OutboxEvent
+from .names import name_key
+
 try:
-    from asgiref.sync import async_to_sync
+    from asgiref.sync import async_to_sync, sync_to_async
+    from channels.db import database_sync_to_async
     from channels.layers import get_channel_layer
 
     HAS_REALTIME = True
 except Exception:
     HAS_REALTIME = False
 
+TASBEEH_TOPIC = "tasbeeh"
+FEED_TOPIC = "feed"
+TEAMS_TOPIC = "teams"
+CURRENT_KHATMA_TOPIC = "khatma:current"
+DEFAULT_TOPICS = [CURRENT_KHATMA_TOPIC, TASBEEH_TOPIC, FEED_TOPIC, TEAMS_TOPIC]
+MAX_TOPICS_PER_SOCKET = 12
+TOPIC_PATTERN = re.compile(r"^(khatma:(\d+|current)|team:[A-Z0-9]{1,12}|participant:.{1,120}|tasbeeh|feed|teams)$")
+# نحتفظ بآخر الأحداث لكل موضوع فقط؛ رقم النسخة يتتبعه العميل لكل موضوع على حدة.
+LIVE_EVENTS_RETAIN = 1000
+# أحداث التسبيح لنفس الذكر تُدمج داخل نافذة التجميع، وكذلك أنشطة السجل بحد أقصى.
+COALESCED_ACTIVITY_LIMIT = 20
+# العميل العائد بعد انقطاع يستلم الأحداث الفائتة إن كانت ضمن هذا الحد، وإلا لقطة مختصرة.
+LIVE_REPLAY_LIMIT = 200
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETENTION = timedelta(hours=1)
+
+
+def khatma_topic(number: int) -> str:
+    return f"khatma:{number}"
+
+
+def team_topic(code: str) -> str:
+    return f"team:{code.upper()}"
+
+
+def participant_topic(name: str) -> str:
+    # نفس مفتاح الهوية في قاعدة البيانات، فتصل أحداث "أحمد" لمن اشترك باسم "احمد".
+    return f"participant:{name_key(name)}"
+
+
+def is_valid_topic(topic: str) -> bool:
+    return isinstance(topic, str) and bool(TOPIC_PATTERN.match(topic))
+
+
+def normalize_topic(topic: str) -> str:
+    kind, _, key = topic.strip().partition(":")
+    if kind == "team":
+        return team_topic(key)
+    if kind == "participant":
+        return participant_topic(key)
+    return topic.strip()
+
+
+def topic_group_name(topic: str) -> str:
+    # أسماء المجموعات في Channels محصورة في ASCII، والمواضيع قد تحمل أسماء عربية.
+    return f"live.{hashlib.sha1(topic.encode('utf-8')).hexdigest()[:24]}"
+
+
+def resolve_topics(requested: Iterable[str]) -> list[str]:
+    """يتحقق من المواضيع المطلوبة ويحوّل khatma:current إلى رقم الختمة المفتوحة."""
+    topics: list[str] = []
+    for topic in requested:
+        topic = normalize_topic(topic) if isinstance(topic, str) else ""
+        if not is_valid_topic(topic):
+            continue
+        if topic == CURRENT_KHATMA_TOPIC:
+            # نفس اختيار الخدمات: أصغر ختمة مفتوحة فيها جزء متاح، وإلا أصغر ختمة مفتوحة.
+            open_khatmas = (
+                Khatma.objects.filter(is_completed=False, is_standby=False)
+                .order_by("number")
+                .values_list("number", flat=True)
+            )
+            free = open_khatmas.filter(ajzaa__reserved_by__isnull=True, ajzaa__completed_at__isnull=True)
+            number = free.first() or open_khatmas.first()
+            if number is None:
+                continue
+            topic = khatma_topic(number)
+        if topic not in topics:
+            topics.append(topic)
+    return topics[:MAX_TOPICS_PER_SOCKET]
+
+
+def current_topic_versions(topics: Iterable[str]) -> dict[str, int]:
+    topics = list(topics)
+    versions = dict(LiveTopic.objects.filter(name__in=topics).values_list("name", "last_version"))
+    return {topic: versions.get(topic, 0) for topic in topics}
+
+
+def replay_live_events(topic: str, since: int, current: int) -> list[LiveEvent] | None:
+    """يرجع الأحداث بعد since، أو None إذا كانت الفجوة أكبر من المخزن وتلزم لقطة كاملة."""
+    if since == current:
+        return []
+    if since > current or current - since > LIVE_REPLAY_LIMIT:
+        return None
+
+    events = list(LiveEvent.objects.filter(topic=topic, version__gt=since, version__lte=current).order_by("version"))
+    if len(events) != current - since:
+        return None
+    return events
+
+
+def record_live_events(topic: str, events: list[tuple[str, dict[str, Any]]]) -> list[LiveEvent]:
+    live_topic, _ = LiveTopic.objects.get_or_create(name=topic)
+    live_topic = LiveTopic.objects.select_for_update().get(pk=live_topic.pk)
+    first_version = live_topic.last_version + 1
+    recorded = LiveEvent.objects.bulk_create(
+        [
+            LiveEvent(topic=topic, version=first_version + offset, event_type=event_type, payload=payload)
+            for offset, (event_type, payload) in enumerate(events)
+        ]
+    )
+    live_topic.last_version = first_version + len(events) - 1
+    if live_topic.publish_after is None:
+        live_topic.publish_after = timezone.now()
+    live_topic.save(update_fields=["last_version", "publish_after"])
+
+    if first_version // 100 != live_topic.last_version // 100:
+        LiveEvent.objects.filter(topic=topic, version__lte=live_topic.last_version - LIVE_EVENTS_RETAIN).delete()
+    return recorded
+
+
+def route_outbox_events(rows: list[OutboxEvent]) -> dict[str, list[tuple[str, dict[str, Any]]]]:
+    """يوزع كل حدث على مواضيعه، ويفصل أنشطة السجل في حدث activity_added لموضوع feed."""
+    routed: dict[str, list[tuple[str, dict[str, Any]]]] = defaultdict(list)
+    for row in rows:
+        payload = dict(row.payload)
+        activity = payload.pop("activity", [])
+        for topic in row.topics:
+            routed[topic].append((row.event_type, payload))
+        if activity:
+            routed[FEED_TOPIC].append(("activity_added", {"activity": activity}))
+    return routed
+
+
+def coalesce_window_seconds() -> float:
+    return max(0, int(getattr(settings, "LIVE_EVENTS_COALESCE_MS", 0))) / 1000
+
+
+def merge_live_payloads(event_type: str, previous: dict[str, Any], current: dict[str, Any]) -> dict[str, Any]:
+    if event_type == "activity_added":
+        return {"activity": [*previous["activity"], *current["activity"]][-COALESCED_ACTIVITY_LIMIT:]}
+    return current if current.get("count", 0) >= previous.get("count", 0) else previous
+
+
+def coalesce_live_events(events: list[tuple[str, dict[str, Any]]]) -> list[tuple[str, dict[str, Any]]]:
+    sequence = itertools.count()
+    merged: dict[tuple, tuple[str, dict[str, Any]]] = {}
+    for event_type, payload in events:
+        if event_type == "tasbeeh_incremented" and payload.get("phrase"):
+            key = (event_type, payload["phrase"])
+        elif event_type == "activity_added":
+            key = (event_type,)
+        else:
+            key = (event_type, next(sequence))
+
+        if key in merged:
+            payload = merge_live_payloads(event_type, merged[key][1], payload)
+        merged[key] = (event_type, payload)
+    return list(merged.values())
+
+
+def outbox_poll_seconds() -> float:
+    return max(50, int(getattr(settings, "LIVE_OUTBOX_POLL_MS", 1000))) / 1000
 
-def broadcast_live_event(event_type: str, payload: dict[str, Any] | None = None) -> None:
-    if not HAS_REALTIME:
-        return
 
-    try:
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2**attempts, 300))
+
+
+class LiveEventDispatcher:
+    """يسلّم أحداث صندوق الصادر (OutboxEvent) بعد اعتماد المعاملة.
+
+    الطلب يدفع فقط ثمن إدراج صف داخل نفس المعاملة، ثم يوقظ المرسل عبر
+    on_commit. المرسل يجمع الصفوف المعلقة خلال نافذة التجميع، يوزعها على
+    مواضيعها، يدمج أحداث التسبيح المتكررة ويعتمد نسخة لكل موضوع في LiveEvent.
+    بعد الاعتماد فقط يرسل إطارًا واحدًا لكل موضوع؛ الموضوع الذي فشل إرساله
+    يعيد إرسال نفس الأحداث المسجلة بتأخير متزايد دون تسجيلها من جديد.
+
+    الإرسال المؤجل يجري على حلقة الخادم التي تحمل المقابس (bind_loop)، لأن
+    InMemoryChannelLayer لا يوقظ مستمعيه إذا أُرسل إليه من حلقة أخرى.
+
+    العمليات التي لا تحمل مقابس (مثل sweep_reservations) تعمل داخل detached() فتترك
+    صفوفها في الصندوق، وتلتقطها عملية الخادم بقراءة دورية على حلقتها.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._scheduled = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._poller: asyncio.Task | None = None
+        self._detached = False
+        self._flushes = 0
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """يُستدعى من داخل حلقة الخادم عند أول مقبس؛ يبدأ عليها قراءة دورية للصندوق."""
+        if loop is self._loop:
+            return
+        with self._lock:
+            self._loop = loop
+            self._scheduled = False
+        self._poller = loop.create_task(self._poll_outbox())
+
+    @contextmanager
+    def detached(self) -> Iterator[None]:
+        self._detached = True
+        try:
+            yield
+        finally:
+            self._detached = False
+
+    def wake(self, delay: float | None = None) -> None:
+        if self._detached:
+            return
+        delay = coalesce_window_seconds() if delay is None else delay
+        if not delay:
+            self._flush_safely()
+            return
+
+        loop = self._loop
+        with self._lock:
+            if loop is not None and loop.is_running():
+                if self._scheduled:
+                    return
+                self._scheduled = True
+                loop.call_soon_threadsafe(loop.call_later, delay, self._start_flush_task, loop)
+                return
+
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(delay, self._flush_in_background)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> int:
         channel_layer = get_channel_layer()
         if channel_layer is None:
-            return
+            return 0
+
+        claimed = self._record_pending()
+        self._publish_pending(channel_layer)
+
+        self._flushes += 1
+        if self._flushes % 100 == 0:
+            OutboxEvent.objects.filter(delivered_at__lt=timezone.now() - OUTBOX_RETENTION).delete()
+        if len(claimed) == OUTBOX_BATCH_SIZE:
+            self.wake()
+        return len(claimed)
+
+    def _record_pending(self) -> list[OutboxEvent]:
+        """يثبت نسخ الأحداث المعلقة في LiveEvent ويعتمدها قبل أي إرسال."""
+        claimed: list[OutboxEvent] = []
+        try:
+            with transaction.atomic():
+                claimed = list(
+                    OutboxEvent.objects.select_for_update(skip_locked=True)
+                    .filter(delivered_at__isnull=True, available_at__lte=timezone.now())
+                    .order_by("id")[:OUTBOX_BATCH_SIZE]
+                )
+                if not claimed:
+                    return []
 
-        async_to_sync(channel_layer.group_send)(
-            "live_updates",
-            {
-                "type": "live_event",
-                "event_type": event_type,
-                "payload": payload or {},
-            },
+                for topic, events in sorted(route_outbox_events(claimed).items()):
+                    record_live_events(topic, coalesce_live_events(events))
+                OutboxEvent.objects.filter(pk__in=[row.pk for row in claimed]).update(delivered_at=timezone.now())
+        except Exception as exc:
+            self._schedule_retry(claimed, exc)
+            raise
+        return claimed
+
+    def _publish_pending(self, channel_layer) -> None:
+        """يرسل لكل موضوع الأحداث المسجلة بعد آخر نسخة أُرسلت؛ الإعادة ترسل نفس الصفوف ونفس النسخ.
+
+        حجز الموضوع ينتهي باعتماد قبل group_send: طبقة القنوات قد تستخدم قاعدة البيانات عبر
+        database_sync_to_async، وهذا يغلق اتصال الخيط إذا وجده داخل معاملة.
+        """
+        topics = list(
+            LiveTopic.objects.filter(publish_after__lte=timezone.now())
+            .order_by("publish_after")
+            .values_list("pk", flat=True)[:OUTBOX_BATCH_SIZE]
         )
-    except Exception:
-        # لا نسمح لأي خلل في WebSocket أن يعطل الاستجابة الأساسية.
+        failure: Exception | None = None
+        for pk in topics:
+            with transaction.atomic():
+                live_topic = (
+                    LiveTopic.objects.select_for_update(skip_locked=True)
+                    .filter(pk=pk, publish_after__isnull=False)
+                    .first()
+                )
+                if live_topic is None:
+                    continue
+
+                events = list(
+                    LiveEvent.objects.filter(
+                        topic=live_topic.name,
+                        version__gt=live_topic.published_version,
+                        version__lte=live_topic.last_version,
+                    ).order_by("version")
+                )
+                LiveTopic.objects.filter(pk=pk).update(published_version=live_topic.last_version, publish_after=None)
+
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    topic_group_name(live_topic.name),
+                    {
+                        "type": "live_batch",
+                        "topic": live_topic.name,
+                        "events": [
+                            {"event_type": event.event_type, "version": event.version, "payload": event.payload}
+                            for event in events
+                        ],
+                    },
+                )
+            except Exception as exc:
+                failure = exc
+                self._schedule_publish_retry(pk, live_topic.published_version)
+                continue
+            if live_topic.publish_attempts:
+                LiveTopic.objects.filter(pk=pk).update(publish_attempts=0)
+        if failure is not None:
+            raise failure
+
+    def _schedule_publish_retry(self, pk: int, unsent_after: int) -> None:
+        live_topic = LiveTopic.objects.get(pk=pk)
+        live_topic.published_version = min(live_topic.published_version, unsent_after)
+        live_topic.publish_attempts += 1
+        live_topic.publish_after = timezone.now() + retry_delay(live_topic.publish_attempts)
+        if live_topic.publish_attempts >= OUTBOX_MAX_ATTEMPTS:
+            # نتخلى عن هذه النسخ حتى لا يعلق الموضوع؛ العملاء سيكتشفون الفجوة ويطلبون لقطة.
+            live_topic.published_version = live_topic.last_version
+            live_topic.publish_after = None
+            live_topic.publish_attempts = 0
+        live_topic.save(update_fields=["published_version", "publish_after", "publish_attempts"])
+        if live_topic.publish_after is not None:
+            self.wake(delay=retry_delay(live_topic.publish_attempts).total_seconds())
+
+    def _schedule_retry(self, claimed: list[OutboxEvent], exc: Exception) -> None:
+        if not claimed:
+            return
+
+        now = timezone.now()
+        for row in claimed:
+            row.attempts += 1
+            row.available_at = now + retry_delay(row.attempts)
+            row.last_error = str(exc)[:255]
+            if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                # بعد استنفاد المحاولات نغلق الحدث حتى لا يعلق الصندوق؛ العملاء سيكتشفون الفجوة.
+                row.delivered_at = now
+        OutboxEvent.objects.bulk_update(claimed, ["attempts", "available_at", "last_error", "delivered_at"])
+        self.wake(delay=retry_delay(min(row.attempts for row in claimed)).total_seconds())
+
+    def _flush_safely(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            # لا نسمح لأي خلل في WebSocket أن يعطل الطلبات؛ الصفوف ستُعاد محاولتها.
+            pass
+
+    def _start_flush_task(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._scheduled = False
+        # نفس خيط الشيفرة المتزامنة الذي تستخدمه الطلبات، فيعود async_to_sync داخله إلى حلقة الخادم.
+        self._task = loop.create_task(sync_to_async(self._flush_safely)())
+
+    async def _poll_outbox(self) -> None:
+        # أحداث العمليات الأخرى (منظف الحجوزات مثلًا) لا توقظنا عبر on_commit.
+        while True:
+            await asyncio.sleep(outbox_poll_seconds())
+            await database_sync_to_async(self._flush_safely)()
+
+    def _flush_in_background(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            self._flush_safely()
+        finally:
+            connection.close()
+
+
+dispatcher = LiveEventDispatcher()
+
+
+def broadcast_live_event(event_type: str, payload: dict[str, Any] | None = None, *, topics: Iterable[str]) -> None:
+    if not HAS_REALTIME:
         return
+
+    OutboxEvent.objects.create(event_type=event_type, payload=payload or {}, topics=list(dict.fromkeys(topics)))
+    transaction.on_commit(dispatcher.wake)
@@ -4,6 +4,9 @@ from rest_framework import serializers
 
 from .models import ActivityEvent, DuaMessage, Juz, Khatma, ParticipantProgress, TasbeehCounter
 
+# أقصى عدد ضغطات يقبلها طلب تسبيح واحد (العميل يجمع الضغطات ويرسلها دفعة).
+MAX_TASBEEH_BATCH = 500
+
 
 class JuzSerializer(serializers.ModelSerializer):
     is_reserved = serializers.SerializerMethodField()
@@ -40,12 +43,17 @@ class JuzSerializer(serializers.ModelSerializer):
         return f"https://quran.com/juz/{obj.juz_number}"
 
 
-class KhatmaSerializer(serializers.ModelSerializer):
-    ajzaa = JuzSerializer(many=True)
-
+class KhatmaInfoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Khatma
-        fields = ["id", "number", "is_completed", "created_at", "completed_at", "ajzaa"]
+        fields = ["id", "number", "is_completed", "created_at", "completed_at"]
+
+
+class KhatmaSerializer(KhatmaInfoSerializer):
+    ajzaa = JuzSerializer(many=True)
+
+    class Meta(KhatmaInfoSerializer.Meta):
+        fields = [*KhatmaInfoSerializer.Meta.fields, "ajzaa"]
 
 
 class ReserveSerializer(serializers.Serializer):
@@ -68,6 +76,8 @@ class ReserveSerializer(serializers.Serializer):
         },
     )
     ref_code = serializers.CharField(max_length=16, required=False, allow_blank=True, default="")
+    # اختياري: عند تعدد الختمات المفتوحة يحدد العميل الختمة المعروضة، وإلا يختار الخادم.
+    khatma_number = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
 
     def validate_name(self, value: str) -> str:
         value = value.strip()
@@ -83,7 +93,20 @@ class CompleteJuzSerializer(ReserveSerializer):
     pass
 
 
+class ReserveNextSerializer(ReserveSerializer):
+    # رقم الجزء هنا تفضيل فقط؛ إن لم يكن متاحًا يُحجز أي جزء متاح آخر.
+    juz_number = serializers.IntegerField(min_value=1, max_value=30, required=False, allow_null=True, default=None)
+
+
+class WaitlistJoinSerializer(ReserveNextSerializer):
+    # في الانتظار: بدون رقم جزء يُخدم بأول جزء يتحرر، ومع رقم جزء ينتظر هذا الجزء بعينه.
+    pass
+
+
 class TasbeehCounterSerializer(serializers.ModelSerializer):
+    # الخدمة تملأ total_count (الرصيد + مجموع الشرائح) قبل التسلسل.
+    count = serializers.IntegerField(source="total_count", read_only=True)
+
     class Meta:
         model = TasbeehCounter
         fields = ["id", "phrase", "count"]
@@ -98,6 +121,17 @@ class TasbeehIncrementSerializer(serializers.Serializer):
             "max_length": "نص الذكر طويل جدًا.",
         },
     )
+    count = serializers.IntegerField(
+        min_value=1,
+        max_value=MAX_TASBEEH_BATCH,
+        required=False,
+        default=1,
+        error_messages={
+            "invalid": "عدد التسبيح غير صالح.",
+            "min_value": f"عدد التسبيح يجب أن يكون بين 1 و{MAX_TASBEEH_BATCH}.",
+            "max_value": f"عدد التسبيح يجب أن يكون بين 1 و{MAX_TASBEEH_BATCH}.",
+        },
+    )
     name = serializers.CharField(max_length=120, required=False, allow_blank=True, default="")
     ref_code = serializers.CharField(max_length=16, required=False, allow_blank=True, default="")
 
@@ -117,7 +151,7 @@ class TasbeehIncrementSerializer(serializers.Serializer):
 class ActivityEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = ActivityEvent
-        fields = ["id", "event_type", "message", "actor_name", "khatma_number", "juz_number", "created_at"]
+        fields = ["id", "event_type", "message", "actor_name", "khatma_number", "juz_number", "count", "created_at"]
 
 
 class DuaMessageSerializer(serializers.ModelSerializer):
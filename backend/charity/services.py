@@ -1,16 +1,25 @@
 from __future__ import annotations
 
+import atexit
 import json
 import os
+import random
 import secrets
+import sqlite3
+import threading
+import time
+from collections import defaultdict
 from datetime import timedelta
 from typing import TypedDict
 from urllib.error import HTTPError, URLError
 from urllib.request import Request, urlopen
 
+from django.conf import settings
 from django.core.cache import cache
-from django.db import IntegrityError, transaction
-from django.db.models import Count, F, Q, Sum
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Case, CharField, Count, F, Min, PositiveIntegerField, Q, Sum, Value, When, sql
+from django.db.models.functions import Cast, Concat, Greatest
+from django.utils.http import quote_etag
 from django.utils import timezone
 
 from .models import (
@@ -18,11 +27,33 @@ from .models import (
     DuaMessage,
     Juz,
     Khatma,
+    KhatmaSummary,
     ParticipantProgress,
     ReferralAction,
     TasbeehCounter,
+    TasbeehCounterShard,
+    TrendBucket,
     TeamGroup,
     TeamMembership,
+    WaitlistEntry,
+)
+from .names import name_key
+from .realtime import (
+    FEED_TOPIC,
+    TASBEEH_TOPIC,
+    TEAMS_TOPIC,
+    broadcast_live_event,
+    khatma_topic,
+    participant_topic,
+    team_topic,
+)
+from .serializers import (
+    ActivityEventSerializer,
+    DuaMessageSerializer,
+    JuzSerializer,
+    KhatmaInfoSerializer,
+    KhatmaSerializer,
+    TasbeehCounterSerializer,
 )
 
 DEFAULT_TASBEEH_PHRASES = [
@@ -70,6 +101,21 @@ DAILY_WIRD_ENTRIES = [
 CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
 REFERRAL_CODE_LENGTH = 8
 TEAM_CODE_LENGTH = 6
+DATA_VERSION_KEY = "data-version:{}"
+# الحجز التلقائي: حجم دفعة الأجزاء المرشحة وعدد الجولات قبل الاستسلام.
+RESERVE_NEXT_BATCH = 8
+RESERVE_NEXT_ATTEMPTS = 3
+# عدد أكثر القراء إنجازًا المحفوظين في ملخص كل ختمة.
+KHATMA_TOP_READERS = 3
+# دلاء الدقائق تكفي للرسوم القريبة فقط؛ دلاء الساعات تبقى للمقارنة بين الليالي.
+TREND_MINUTE_RETENTION = timedelta(hours=48)
+TREND_MAX_BUCKETS = {TrendBucket.MINUTE: 24 * 60, TrendBucket.HOUR: 24 * 90}
+
+
+class NoFreeJuzError(ValueError):
+    """لا يوجد أي جزء متاح للحجز التلقائي؛ العميل ينضم لطابور الانتظار عند هذا الخطأ فقط."""
+
+    code = "no_free_juz"
 
 
 class ReserveResult(TypedDict):
@@ -77,6 +123,8 @@ class ReserveResult(TypedDict):
     current_khatma: Khatma
     khatma_completed_now: bool
     next_khatma_number: int | None
+    expired_juz: list[Juz]
+    activity_events: list[ActivityEvent]
 
 
 class CompleteResult(TypedDict):
@@ -84,6 +132,17 @@ class CompleteResult(TypedDict):
     current_khatma: Khatma
     khatma_completed_now: bool
     next_khatma_number: int | None
+    activity_events: list[ActivityEvent]
+
+
+class TasbeehResult(TypedDict):
+    counter: TasbeehCounter
+    activity_event: ActivityEvent | None
+
+
+class DuaResult(TypedDict):
+    dua: DuaMessage
+    activity_event: ActivityEvent
 
 
 def normalize_name(name: str) -> str:
@@ -117,6 +176,39 @@ def reservation_expiry_hours() -> int:
         return 18
 
 
+def data_version(resource: str) -> int:
+    key = DATA_VERSION_KEY.format(resource)
+    version = cache.get(key)
+    if version is None:
+        # نبدأ من الوقت الحالي لا من 1، حتى لا تعود نسخة قديمة صالحة إذا طُرد المفتاح من الذاكرة.
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_data_version(*resources: str) -> None:
+    """ترفع عمليات الكتابة نسخة كل مورد تغيّر؛ اللقطات المخزنة ووسوم ETag مبنية على هذه النسخ."""
+
+    def bump():
+        for resource in resources:
+            key = DATA_VERSION_KEY.format(resource)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, int(time.time() * 1000), timeout=None)
+
+    # نرفع النسخة فورًا ثم مرة أخرى بعد الاعتماد، فأي قارئ خزّن الحالة قبل الاعتماد يُهمل تخزينه.
+    bump()
+    transaction.on_commit(bump)
+
+
+def data_etag(resources) -> str:
+    """وسم ETag من نسخ الموارد دون أي استعلام؛ الحقبة الزمنية تحد من بقاء وسم قديم إذا لم تكن الذاكرة المؤقتة مشتركة."""
+    epoch = int(time.time() // max(1, settings.ETAG_MAX_AGE_SECONDS))
+    return quote_etag("-".join([*(str(data_version(resource)) for resource in resources), str(epoch)]))
+
+
 def create_activity_event(
     event_type: str,
     message: str,
@@ -125,6 +217,7 @@ def create_activity_event(
     khatma_number: int | None = None,
     juz_number: int | None = None,
 ) -> ActivityEvent:
+    bump_data_version("activity")
     return ActivityEvent.objects.create(
         event_type=event_type,
         message=message,
@@ -175,20 +268,55 @@ def attach_referrer_if_possible(participant: ParticipantProgress, ref_code: str)
     )
 
 
-def mark_participant_activity(participant: ParticipantProgress) -> ParticipantProgress:
+def participant_activity_updates(field_name: str, amount: int) -> dict:
+    """زيادة العداد وتحديث سلسلة الأيام كتعابير SQL، فتُحسب من القيم المخزنة داخل جملة التحديث نفسها."""
     today = timezone.localdate()
-    if participant.last_activity_date == today:
-        return participant
+    streak = Case(
+        When(last_activity_date=today, then=F("streak_days")),
+        When(last_activity_date=today - timedelta(days=1), then=F("streak_days") + 1),
+        default=Value(1),
+        output_field=PositiveIntegerField(),
+    )
+    return {
+        field_name: F(field_name) + amount,
+        "streak_days": streak,
+        "best_streak_days": Greatest(F("best_streak_days"), streak),
+        "last_activity_date": today,
+        "updated_at": timezone.now(),
+    }
 
-    if participant.last_activity_date == today - timedelta(days=1):
-        participant.streak_days += 1
-    else:
-        participant.streak_days = 1
 
-    participant.last_activity_date = today
-    participant.best_streak_days = max(participant.best_streak_days, participant.streak_days)
-    participant.save(update_fields=["last_activity_date", "streak_days", "best_streak_days", "updated_at"])
-    return participant
+def supports_update_returning(using: str) -> bool:
+    vendor = connections[using].vendor
+    return vendor == "postgresql" or (vendor == "sqlite" and sqlite3.sqlite_version_info >= (3, 35))
+
+
+def update_returning(queryset, values: dict):
+    """UPDATE ... RETURNING: يطبق التحديث ويرجع الصف الجديد في جملة واحدة، بدل update ثم refresh_from_db."""
+    model = queryset.model
+    using = queryset.db
+    if not supports_update_returning(using):
+        instance = queryset.first()
+        if instance is None or not queryset.filter(pk=instance.pk).update(**values):
+            return None
+        instance.refresh_from_db()
+        return instance
+
+    query = queryset.query.chain(sql.UpdateQuery)
+    query.add_update_values(values)
+    compiler = query.get_compiler(using)
+    statement, params = compiler.as_sql()
+    fields = model._meta.concrete_fields
+    columns = ", ".join(compiler.quote_name_unless_alias(field.column) for field in fields)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"{statement} RETURNING {columns}", params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    converters = compiler.get_converters([field.get_col(model._meta.db_table) for field in fields])
+    row = next(iter(compiler.apply_converters([row], converters))) if converters else row
+    return model.from_db(using, [field.attname for field in fields], row)
 
 
 def participant_points(participant: ParticipantProgress) -> int:
@@ -206,7 +334,7 @@ def get_or_create_participant(name: str, *, ref_code: str = "") -> ParticipantPr
     if not safe_name:
         raise ValueError("الاسم مطلوب.")
 
-    participant = ParticipantProgress.objects.filter(name__iexact=safe_name).first()
+    participant = ParticipantProgress.objects.filter(name_key=name_key(safe_name)).first()
     if participant:
         ensure_participant_referral_code(participant)
         attach_referrer_if_possible(participant, ref_code)
@@ -218,6 +346,7 @@ def get_or_create_participant(name: str, *, ref_code: str = "") -> ParticipantPr
         referral_code=_generate_unique_code(ParticipantProgress, "referral_code", REFERRAL_CODE_LENGTH),
         referred_by=referrer,
     )
+    bump_data_version("participants")
     if referrer:
         create_activity_event(
             ActivityEvent.INVITE,
@@ -227,21 +356,45 @@ def get_or_create_participant(name: str, *, ref_code: str = "") -> ParticipantPr
     return participant
 
 
-def bump_participant_counter(name: str, field_name: str, *, ref_code: str = "") -> ParticipantProgress:
-    participant = get_or_create_participant(name, ref_code=ref_code)
-    ParticipantProgress.objects.filter(pk=participant.pk).update(**{field_name: F(field_name) + 1})
-    participant.refresh_from_db()
-    return mark_participant_activity(participant)
+def bump_participant_counter(
+    name: str,
+    field_name: str,
+    *,
+    ref_code: str = "",
+    amount: int = 1,
+    participant: ParticipantProgress | None = None,
+) -> ParticipantProgress:
+    """يزيد العداد ويحدث سلسلة الأيام ويرجع الصف بجملة واحدة للمشارك الموجود.
+
+    مسار الإنشاء (مشارك جديد، رمز إحالة ناقص، أو محيل لم يُربط بعد) نادر ويمر عبر get_or_create_participant.
+    """
+    updates = participant_activity_updates(field_name, amount)
+    if participant is not None:
+        queryset = ParticipantProgress.objects.filter(pk=participant.pk)
+    else:
+        queryset = ParticipantProgress.objects.filter(name_key=name_key(normalize_name(name)))
+
+    updated = update_returning(queryset, updates)
+    if updated is None:
+        participant = get_or_create_participant(name, ref_code=ref_code)
+        updated = update_returning(ParticipantProgress.objects.filter(pk=participant.pk), updates)
+    elif not updated.referral_code or (ref_code and not updated.referred_by_id):
+        ensure_participant_referral_code(updated)
+        attach_referrer_if_possible(updated, ref_code)
+    bump_data_version("participants")
+    return updated
 
 
-def record_referral_action(participant: ParticipantProgress, action_type: str) -> None:
+def record_referral_action(participant: ParticipantProgress, action_type: str, *, times: int = 1) -> None:
     if not participant.referred_by_id:
         return
 
-    ReferralAction.objects.create(
-        inviter_id=participant.referred_by_id,
-        invited=participant,
-        action_type=action_type,
+    bump_data_version("participants")
+    ReferralAction.objects.bulk_create(
+        [
+            ReferralAction(inviter_id=participant.referred_by_id, invited=participant, action_type=action_type)
+            for _ in range(times)
+        ]
     )
 
 
@@ -390,39 +543,146 @@ def build_certificate_payload(participant: ParticipantProgress, invite_count: in
     }
 
 
-def create_khatma_with_juz(number: int) -> Khatma:
-    khatma = Khatma.objects.create(number=number)
+def create_khatma_with_juz(number: int, *, standby: bool = False) -> Khatma:
+    khatma = Khatma.objects.create(number=number, is_standby=standby)
     Juz.objects.bulk_create([Juz(khatma=khatma, juz_number=i) for i in range(1, 31)])
     return khatma
 
 
-def get_or_create_current_khatma(lock: bool = False) -> Khatma:
-    for _ in range(2):
-        queryset = Khatma.objects.filter(is_completed=False)
-        if lock:
-            queryset = queryset.select_for_update()
+def khatma_pool_size() -> int:
+    return max(1, int(getattr(settings, "KHATMA_POOL_SIZE", 1)))
+
+
+def free_juz_filter(prefix: str = "") -> Q:
+    return Q(**{f"{prefix}reserved_by__isnull": True, f"{prefix}completed_at__isnull": True})
+
+
+def open_khatma_filter(prefix: str = "") -> Q:
+    """الختمات المفتوحة للحجز: غير مكتملة وليست احتياطية تنتظر دورها."""
+    return Q(**{f"{prefix}is_completed": False, f"{prefix}is_standby": False})
 
-        current = queryset.order_by("-number").first()
+
+def next_khatma_number() -> int:
+    return (Khatma.objects.order_by("-number").values_list("number", flat=True).first() or 0) + 1
+
+
+def activate_standby_khatma() -> Khatma | None:
+    """ينقل أصغر ختمة احتياطية إلى المفتوحة بتحديث مشروط واحد؛ لا إنشاء صفوف على مسار الطلب."""
+    standby = Khatma.objects.filter(is_standby=True, is_completed=False).order_by("number")
+    for pk in standby.values_list("pk", flat=True)[:3]:
+        if Khatma.objects.filter(pk=pk, is_standby=True).update(is_standby=False):
+            return Khatma.objects.get(pk=pk)
+    return None
+
+
+def ensure_standby_khatmas() -> int:
+    """يُستدعى من منظف الحجوزات: يجهز KHATMA_STANDBY_COUNT ختمات احتياطية بأجزائها مسبقًا."""
+    wanted = max(0, int(getattr(settings, "KHATMA_STANDBY_COUNT", 0)))
+    created = 0
+    while Khatma.objects.filter(is_standby=True, is_completed=False).count() < wanted:
+        try:
+            with transaction.atomic():
+                create_khatma_with_juz(next_khatma_number(), standby=True)
+        except IntegrityError:
+            # طلب متزامن أخذ الرقم نفسه؛ نعيد الحساب.
+            continue
+        created += 1
+    return created
+
+
+def get_or_create_current_khatma() -> Khatma:
+    """الختمة الحالية هي أصغر ختمة مفتوحة فيها جزء متاح، وإلا أصغر ختمة مفتوحة."""
+    for _ in range(2):
+        open_khatmas = Khatma.objects.filter(open_khatma_filter()).order_by("number")
+        current = open_khatmas.filter(free_juz_filter("ajzaa__")).first() or open_khatmas.first()
         if current:
             return current
 
-        last_number = Khatma.objects.order_by("-number").values_list("number", flat=True).first() or 0
+        current = activate_standby_khatma()
+        if current:
+            return current
         try:
-            return create_khatma_with_juz(last_number + 1)
+            with transaction.atomic():
+                return create_khatma_with_juz(next_khatma_number())
         except IntegrityError:
             continue
 
     raise RuntimeError("تعذر تحديد أو إنشاء الختمة الحالية.")
 
 
+def get_khatma_progress_counts(khatma: Khatma) -> dict:
+    return Juz.objects.filter(khatma=khatma).aggregate(
+        reserved_count=Count("id", filter=Q(reserved_by__isnull=False, completed_at__isnull=True)),
+        completed_count=Count("id", filter=Q(completed_at__isnull=False)),
+    )
+
+
+def pending_reservations():
+    return Juz.objects.filter(reserved_by__isnull=False, completed_at__isnull=True, reservation_expires_at__isnull=False)
+
+
+def get_khatma_snapshot(number: int | None = None) -> dict:
+    """حمولة /current-khatma/ كاملة من استعلام واحد، مخزنة مؤقتًا تحت نسخة ترفعها عمليات الحجز والإتمام والانتهاء.
+
+    الاستعلام يجلب أجزاء كل الختمات المفتوحة (حجم المجمع × 30 صفًا)، فتُحسب منه قائمة الختمات
+    النشطة وعداداتها، ثم تُعرض الختمة المطلوبة أو الختمة الحالية.
+    """
+    cache_key = f"khatma:snapshot:{data_version('khatma')}:{number or 'current'}"
+    snapshot = cache.get(cache_key)
+    if snapshot is not None:
+        return snapshot
+
+    open_ajzaa = Juz.objects.select_related("khatma").filter(open_khatma_filter("khatma__")).order_by("khatma__number", "juz_number")
+    rows = list(open_ajzaa.all())
+    if not rows:
+        get_or_create_current_khatma()
+        rows = list(open_ajzaa.all())
+
+    pool: dict[int, list[Juz]] = defaultdict(list)
+    for juz in rows:
+        pool[juz.khatma.number].append(juz)
+    active = [
+        {
+            "number": pool_number,
+            "reserved_count": sum(1 for juz in ajzaa if juz.reserved_by and juz.completed_at is None),
+            "completed_count": sum(1 for juz in ajzaa if juz.completed_at is not None),
+            "free_count": sum(1 for juz in ajzaa if not juz.reserved_by and juz.completed_at is None),
+        }
+        for pool_number, ajzaa in pool.items()
+    ]
+    if number not in pool:
+        number = next((item["number"] for item in active if item["free_count"]), active[0]["number"])
+    ajzaa = pool[number]
+    counts = next(item for item in active if item["number"] == number)
+
+    snapshot = {
+        "khatma": {**KhatmaInfoSerializer(ajzaa[0].khatma).data, "ajzaa": JuzSerializer(ajzaa, many=True).data},
+        "reserved_count": counts["reserved_count"],
+        "completed_count": counts["completed_count"],
+        "total_juz": 30,
+        "reservation_expiry_hours": reservation_expiry_hours(),
+        "active_khatmas": active,
+        "khatma_pool_size": khatma_pool_size(),
+    }
+
+    # is_expired يتغير مع الوقت دون كتابة، فلا نخزن اللقطة بعد أقرب موعد انتهاء.
+    timeout = settings.KHATMA_SNAPSHOT_CACHE_SECONDS
+    expiries = [juz.reservation_expires_at for juz in ajzaa if juz.reservation_expires_at and juz.completed_at is None]
+    if expiries:
+        timeout = min(timeout, int((min(expiries) - timezone.now()).total_seconds()))
+    if timeout > 0:
+        cache.set(cache_key, snapshot, timeout)
+    return snapshot
+
+
+def juz_by_participant(field: str, name: str):
+    """ربط بمفتاح أجنبي صحيح: مفتاح الاسم الفريد يحدد المشارك، ثم الفهرس الجزئي على Juz يحدد أجزاءه."""
+    return Juz.objects.filter(**{f"{field}_participant__name_key": name_key(name)})
+
+
 def release_expired_reservations(*, khatma: Khatma | None = None, lock: bool = False) -> list[Juz]:
     now = timezone.now()
-    queryset = Juz.objects.filter(
-        reserved_by__isnull=False,
-        completed_at__isnull=True,
-        reservation_expires_at__isnull=False,
-        reservation_expires_at__lte=now,
-    )
+    queryset = pending_reservations().filter(reservation_expires_at__lte=now)
     if khatma is not None:
         queryset = queryset.filter(khatma=khatma)
     if lock:
@@ -434,67 +694,294 @@ def release_expired_reservations(*, khatma: Khatma | None = None, lock: bool = F
 
     for juz in expired_juz:
         juz.reserved_by = None
+        juz.reserved_by_participant = None
         juz.reserved_at = None
         juz.reservation_expires_at = None
 
-    Juz.objects.bulk_update(expired_juz, ["reserved_by", "reserved_at", "reservation_expires_at"])
+    Juz.objects.bulk_update(expired_juz, ["reserved_by", "reserved_by_participant", "reserved_at", "reservation_expires_at"])
+    return expired_juz
+
+
+def record_expired_activity(khatma: Khatma, expired_juz: list[Juz]) -> list[ActivityEvent]:
+    return [
+        create_activity_event(
+            ActivityEvent.EXPIRE,
+            f"انتهت مهلة حجز الجزء {expired.juz_number} وأصبح متاحًا من جديد.",
+            khatma_number=khatma.number,
+            juz_number=expired.juz_number,
+        )
+        for expired in expired_juz
+    ]
+
+
+def build_khatma_delta(khatma: Khatma, ajzaa: list[Juz], activity_events: list[ActivityEvent]) -> dict:
+    """حمولة الفروقات التي يطبقها العميل مباشرة بدل إعادة تحميل اللوحة كاملة."""
+    return {
+        "khatma_number": khatma.number,
+        "ajzaa": JuzSerializer(ajzaa, many=True).data,
+        "counts": get_khatma_progress_counts(khatma),
+        "activity": ActivityEventSerializer(activity_events, many=True).data,
+    }
+
+
+@transaction.atomic
+def expire_reservations(*, khatma: Khatma) -> list[Juz]:
+    expired_juz = release_expired_reservations(khatma=khatma, lock=True)
+    if not expired_juz:
+        return []
+    bump_data_version("khatma")
+
+    activity_events = record_expired_activity(khatma, expired_juz)
+    broadcast_live_event(
+        "reservation_expired",
+        {"count": len(expired_juz), **build_khatma_delta(khatma, expired_juz, activity_events)},
+        topics=[khatma_topic(khatma.number)],
+    )
+    # الأجزاء المحررة تذهب أولًا لمن ينتظر، في نفس المعاملة.
+    assign_waitlist()
     return expired_juz
 
 
+def next_reservation_expiry():
+    """أقرب موعد انتهاء حجز قائم؛ الفهرس المرتب على reservation_expires_at يقوم مقام طابور الأولوية."""
+    return (
+        pending_reservations()
+        .filter(open_khatma_filter("khatma__"))
+        .order_by("reservation_expires_at")
+        .values_list("reservation_expires_at", flat=True)
+        .first()
+    )
+
+
+def sweep_expired_reservations() -> int:
+    """يحرر الحجوزات المنتهية في كل الختمات المفتوحة ويبث reservation_expired لكل ختمة."""
+    khatma_ids = (
+        pending_reservations()
+        .filter(open_khatma_filter("khatma__"), reservation_expires_at__lte=timezone.now())
+        .values_list("khatma_id", flat=True)
+        .distinct()
+    )
+    return sum(len(expire_reservations(khatma=khatma)) for khatma in Khatma.objects.filter(pk__in=list(khatma_ids)))
+
+
 def finalize_khatma_if_completed(current: Khatma, *, now=None) -> tuple[bool, int | None]:
+    """إغلاق الختمة تحديث مشروط على عدادها؛ ينجح لطلب واحد فقط هو صاحب الإتمام الثلاثين.
+
+    الختمة التالية تكون احتياطية جاهزة فيصير الانتقال تبديل علم، ولا نُنشئ الأجزاء هنا
+    إلا إذا لم يجهز منظف الحجوزات ختمة احتياطية بعد.
+    """
     now = now or timezone.now()
-    completed_count = Juz.objects.filter(khatma=current, completed_at__isnull=False).count()
-    if completed_count < 30 or current.is_completed:
+    finished = Khatma.objects.filter(pk=current.pk, is_completed=False, completed_count__gte=30).update(
+        is_completed=True, completed_at=now
+    )
+    if not finished:
         return False, None
-
     current.is_completed = True
     current.completed_at = now
-    current.save(update_fields=["is_completed", "completed_at"])
-    next_khatma = create_khatma_with_juz(current.number + 1)
-    return True, next_khatma.number
+    build_khatma_summary(current)
+
+    # بقية ختمات المجمع تستمر؛ لا نفتح ختمة جديدة إلا إذا لم تبقَ ختمة مفتوحة.
+    next_number = (
+        Khatma.objects.filter(open_khatma_filter()).order_by("number").values_list("number", flat=True).first()
+    )
+    if next_number is None:
+        next_number = open_next_khatma().number
+    return True, next_number
+
+
+def open_next_khatma() -> Khatma:
+    """يفتح الختمة التالية بعد إغلاق آخر ختمة مفتوحة: احتياطية جاهزة إن وُجدت، وإلا ينشئها.
+
+    الإنشاء داخل نقطة حفظ، فإذا سبقنا منظف الحجوزات أو طلب آخر إلى الرقم نفسه لا تُلغى
+    معاملة الإتمام، بل نعيد قراءة الختمة التي أنشأها (مفتوحة أو احتياطية).
+    """
+    for _ in range(3):
+        opened = Khatma.objects.filter(open_khatma_filter()).order_by("number").first() or activate_standby_khatma()
+        if opened:
+            return opened
+        try:
+            with transaction.atomic():
+                return create_khatma_with_juz(next_khatma_number())
+        except IntegrityError:
+            continue
+
+    raise RuntimeError("تعذر فتح الختمة التالية.")
+
+
+def grow_khatma_pool() -> Khatma | None:
+    """يفتح ختمة موازية جديدة عندما تمتلئ كل الختمات المفتوحة ولم يبلغ المجمع حجمه الأقصى."""
+    open_khatmas = Khatma.objects.filter(open_khatma_filter())
+    if open_khatmas.count() >= khatma_pool_size() or open_khatmas.filter(free_juz_filter("ajzaa__")).exists():
+        return None
+    standby = activate_standby_khatma()
+    if standby:
+        return standby
+    number = next_khatma_number()
+    try:
+        with transaction.atomic():
+            return create_khatma_with_juz(number)
+    except IntegrityError:
+        # طلب متزامن فتح الختمة نفسها؛ نستخدمها.
+        return Khatma.objects.filter(open_khatma_filter(), number=number).first()
+
+
+def pick_khatma_for_reservation(juz_number: int, khatma_number: int | None = None) -> Khatma:
+    open_khatmas = Khatma.objects.filter(open_khatma_filter())
+    if khatma_number is not None:
+        khatma = open_khatmas.filter(number=khatma_number).first()
+        if khatma is None:
+            raise ValueError("الختمة المطلوبة غير مفتوحة للحجز.")
+        return khatma
+
+    khatma = (
+        open_khatmas.filter(ajzaa__juz_number=juz_number, ajzaa__reserved_by__isnull=True, ajzaa__completed_at__isnull=True)
+        .order_by("number")
+        .first()
+    )
+    return khatma or grow_khatma_pool() or get_or_create_current_khatma()
+
+
+def finalize_completed_khatmas() -> int:
+    """شبكة أمان للمنظف: ختمة بلغ عدادها 30 ولم يغلقها طلب الإتمام (مثل عداد عُبئ بالترحيل)."""
+    full = Khatma.objects.filter(open_khatma_filter(), completed_count__gte=30)
+    finalized = 0
+    for khatma in full:
+        with transaction.atomic():
+            if finalize_khatma_if_completed(khatma)[0]:
+                bump_data_version("khatma")
+                grow_khatma_pool()
+                assign_waitlist()
+                finalized += 1
+    return finalized
+
+
+def claim_juz(khatma: Khatma, juz_number: int, name: str, participant: ParticipantProgress) -> tuple[Juz, list[Juz]]:
+    """يحجز الجزء بتحديث مشروط واحد بدل قفل الختمة، فلا تتزاحم إلا الطلبات على نفس الجزء.
+
+    إذا كان الجزء محجوزًا بمهلة منتهية ولم يمر عليه المنظف بعد، نحرره بتحديث مشروط آخر ثم نعيد المحاولة.
+    """
+    expired_juz: list[Juz] = []
+    for _ in range(2):
+        now = timezone.now()
+        claimed = Juz.objects.filter(
+            khatma=khatma, juz_number=juz_number, reserved_by__isnull=True, completed_at__isnull=True
+        ).update(
+            reserved_by=name,
+            reserved_by_participant=participant,
+            reserved_at=now,
+            reservation_expires_at=now + timedelta(hours=reservation_expiry_hours()),
+        )
+        if claimed:
+            return Juz.objects.get(khatma=khatma, juz_number=juz_number), expired_juz
+
+        juz = Juz.objects.filter(khatma=khatma, juz_number=juz_number).first()
+        if juz is None:
+            raise ValueError("الجزء المطلوب غير موجود في الختمة الحالية.")
+        if juz.completed_at:
+            raise ValueError("هذا الجزء تم إنجازه بالفعل.")
+        if juz.reserved_by and not juz.is_expired:
+            raise ValueError("هذا الجزء محجوز بالفعل.")
+
+        if juz.reserved_by and Juz.objects.filter(
+            pk=juz.pk, reserved_by=juz.reserved_by, reservation_expires_at=juz.reservation_expires_at
+        ).update(reserved_by=None, reserved_by_participant=None, reserved_at=None, reservation_expires_at=None):
+            juz.reserved_by = juz.reserved_at = juz.reservation_expires_at = None
+            expired_juz.append(juz)
+    raise ValueError("هذا الجزء محجوز بالفعل.")
 
 
 @transaction.atomic
-def reserve_juz(juz_number: int, name: str, *, ref_code: str = "") -> ReserveResult:
+def reserve_juz(
+    juz_number: int, name: str, *, khatma_number: int | None = None, ref_code: str = ""
+) -> ReserveResult:
     safe_name = normalize_name(name)
     if not safe_name:
         raise ValueError("الاسم مطلوب.")
 
-    current = get_or_create_current_khatma(lock=True)
-    expired_juz = release_expired_reservations(khatma=current, lock=True)
-    for expired in expired_juz:
-        create_activity_event(
-            ActivityEvent.EXPIRE,
-            f"انتهت مهلة حجز الجزء {expired.juz_number} وأصبح متاحًا من جديد.",
-            khatma_number=current.number,
-            juz_number=expired.juz_number,
-        )
+    participant = get_or_create_participant(safe_name, ref_code=ref_code)
+    current = pick_khatma_for_reservation(juz_number, khatma_number)
+    juz, expired_juz = claim_juz(current, juz_number, safe_name, participant)
+    return record_reservation(current, juz, participant, expired_juz=expired_juz)
 
-    try:
-        juz = Juz.objects.select_for_update().get(khatma=current, juz_number=juz_number)
-    except Juz.DoesNotExist as exc:
-        raise ValueError("الجزء المطلوب غير موجود في الختمة الحالية.") from exc
 
-    if juz.completed_at:
-        raise ValueError("هذا الجزء تم إنجازه بالفعل.")
-    if juz.reserved_by:
-        raise ValueError("هذا الجزء محجوز بالفعل.")
+@transaction.atomic
+def reserve_next_juz(
+    name: str, *, preferred_juz: int | None = None, khatma_number: int | None = None, ref_code: str = ""
+) -> ReserveResult:
+    """يحجز أي جزء متاح في طلب واحد بدل أن يتسابق العملاء على رقم من شبكة قد تكون قديمة.
+
+    نقرأ دفعة صغيرة من الأجزاء المتاحة (المفضل أولًا ثم بترتيب عشوائي حتى لا يتزاحم الجميع على
+    نفس الصف) ونحاول حجز كل منها بتحديث مشروط؛ أول تحديث ناجح هو الحجز.
+    """
+    safe_name = normalize_name(name)
+    if not safe_name:
+        raise ValueError("الاسم مطلوب.")
 
-    now = timezone.now()
-    juz.reserved_by = safe_name
-    juz.reserved_at = now
-    juz.reservation_expires_at = now + timedelta(hours=reservation_expiry_hours())
-    juz.save(update_fields=["reserved_by", "reserved_at", "reservation_expires_at"])
+    participant = get_or_create_participant(safe_name, ref_code=ref_code)
+    free = Juz.objects.filter(free_juz_filter(), open_khatma_filter("khatma__"))
+    if khatma_number is not None:
+        free = free.filter(khatma__number=khatma_number)
+    free = free.order_by(
+        Case(When(juz_number=preferred_juz, then=Value(0)), default=Value(1)), "khatma__number", "juz_number"
+    )
 
-    participant = bump_participant_counter(safe_name, "reservations_count", ref_code=ref_code)
+    for _ in range(RESERVE_NEXT_ATTEMPTS):
+        candidates = list(free.values_list("pk", "juz_number")[:RESERVE_NEXT_BATCH])
+        if not candidates:
+            if khatma_number is None and grow_khatma_pool():
+                continue
+            raise NoFreeJuzError("لا توجد أجزاء متاحة حاليًا، حاول بعد قليل.")
+
+        random.shuffle(candidates)
+        candidates.sort(key=lambda item: item[1] != preferred_juz)
+        for pk, _juz_number in candidates:
+            now = timezone.now()
+            claimed = Juz.objects.filter(pk=pk, reserved_by__isnull=True, completed_at__isnull=True).update(
+                reserved_by=safe_name,
+                reserved_by_participant=participant,
+                reserved_at=now,
+                reservation_expires_at=now + timedelta(hours=reservation_expiry_hours()),
+            )
+            if claimed:
+                juz = Juz.objects.select_related("khatma").get(pk=pk)
+                return record_reservation(juz.khatma, juz, participant)
+
+    raise ValueError("الأجزاء المتاحة تُحجز بسرعة الآن، حاول مرة أخرى.")
+
+
+def record_reservation(
+    current: Khatma, juz: Juz, participant: ParticipantProgress, *, expired_juz: list[Juz] | None = None
+) -> ReserveResult:
+    safe_name = juz.reserved_by
+    expired_juz = expired_juz or []
+    activity_events = record_expired_activity(current, expired_juz)
+    # إذا كان هذا آخر جزء متاح في المجمع نفتح الختمة الموازية الآن، فيجد القادم التالي أجزاء متاحة.
+    grow_khatma_pool()
+    bump_data_version("khatma")
+
+    participant = bump_participant_counter(safe_name, "reservations_count", participant=participant)
+    record_trend(TrendBucket.RESERVE)
     record_referral_action(participant, ReferralAction.RESERVE)
 
-    create_activity_event(
-        ActivityEvent.RESERVE,
-        f"{safe_name} حجز الجزء {juz.juz_number}.",
-        actor_name=safe_name,
-        khatma_number=current.number,
-        juz_number=juz.juz_number,
+    activity_events.append(
+        create_activity_event(
+            ActivityEvent.RESERVE,
+            f"{safe_name} حجز الجزء {juz.juz_number}.",
+            actor_name=safe_name,
+            khatma_number=current.number,
+            juz_number=juz.juz_number,
+        )
+    )
+
+    broadcast_live_event(
+        "khatma_reserved",
+        {
+            **build_khatma_delta(current, [*expired_juz, juz], activity_events),
+            "juz_number": juz.juz_number,
+            "reserved_by": juz.reserved_by,
+            "reservation_expires_at": juz.reservation_expires_at.isoformat(),
+        },
+        topics=[khatma_topic(current.number), participant_topic(safe_name)],
     )
 
     return {
@@ -502,59 +989,255 @@ def reserve_juz(juz_number: int, name: str, *, ref_code: str = "") -> ReserveRes
         "current_khatma": current,
         "khatma_completed_now": False,
         "next_khatma_number": None,
+        "expired_juz": expired_juz,
+        "activity_events": activity_events,
     }
 
 
 @transaction.atomic
-def complete_juz(juz_number: int, name: str, *, ref_code: str = "") -> CompleteResult:
+def complete_juz(
+    juz_number: int, name: str, *, khatma_number: int | None = None, ref_code: str = ""
+) -> CompleteResult:
     safe_name = normalize_name(name)
     if not safe_name:
         raise ValueError("الاسم مطلوب.")
 
-    current = get_or_create_current_khatma(lock=True)
-    release_expired_reservations(khatma=current, lock=True)
-
-    try:
-        juz = Juz.objects.select_for_update().get(khatma=current, juz_number=juz_number)
-    except Juz.DoesNotExist as exc:
-        raise ValueError("الجزء المطلوب غير موجود في الختمة الحالية.") from exc
-
-    if not juz.reserved_by:
-        raise ValueError("لا يمكن إتمام جزء غير محجوز.")
-    if juz.completed_at:
-        raise ValueError("تم تسجيل هذا الجزء كمكتمل بالفعل.")
-    if normalize_name(juz.reserved_by) != safe_name:
+    # الإتمام يلزمه المشارك للعداد على أي حال؛ إن فشل الإتمام تتراجع المعاملة عن إنشائه.
+    participant = get_or_create_participant(safe_name, ref_code=ref_code)
+    open_khatmas = Khatma.objects.filter(open_khatma_filter()).order_by("number")
+    if khatma_number is not None:
+        current = open_khatmas.filter(number=khatma_number).first()
+    else:
+        # بدون رقم ختمة نبحث عن الختمة المفتوحة التي حجز فيها المشارك هذا الجزء.
+        current = open_khatmas.filter(
+            ajzaa__juz_number=juz_number, ajzaa__reserved_by_participant=participant, ajzaa__completed_at__isnull=True
+        ).first()
+    current = current or get_or_create_current_khatma()
+    now = timezone.now()
+    # مثل الحجز: تحديث مشروط واحد، ولا نقرأ الصف لتحديد رسالة الخطأ إلا عند الفشل.
+    completed = Juz.objects.filter(
+        khatma=current,
+        juz_number=juz_number,
+        reserved_by_participant=participant,
+        completed_at__isnull=True,
+        reservation_expires_at__gt=now,
+    ).update(completed_by=safe_name, completed_by_participant=participant, completed_at=now)
+    juz = Juz.objects.filter(khatma=current, juz_number=juz_number).first()
+    if juz is None:
+        raise ValueError("الجزء المطلوب غير موجود في الختمة الحالية.")
+    if not completed:
+        if not juz.reserved_by or juz.is_expired:
+            raise ValueError("لا يمكن إتمام جزء غير محجوز.")
+        if juz.completed_at:
+            raise ValueError("تم تسجيل هذا الجزء كمكتمل بالفعل.")
         raise ValueError("إتمام الجزء متاح فقط لنفس الاسم الذي قام بالحجز.")
 
-    now = timezone.now()
-    juz.completed_by = safe_name
-    juz.completed_at = now
-    juz.save(update_fields=["completed_by", "completed_at"])
+    # قفل صف الختمة هنا قصير ولا يحدث إلا مع الإتمام (30 مرة لكل ختمة)، لا مع الحجز.
+    Khatma.objects.filter(pk=current.pk).update(completed_count=F("completed_count") + 1)
+    activity_events: list[ActivityEvent] = []
+    bump_data_version("khatma")
 
-    participant = bump_participant_counter(safe_name, "completions_count", ref_code=ref_code)
+    participant = bump_participant_counter(safe_name, "completions_count", participant=participant)
+    record_trend(TrendBucket.COMPLETE)
     record_referral_action(participant, ReferralAction.COMPLETE)
 
-    create_activity_event(
-        ActivityEvent.COMPLETE,
-        f"{safe_name} أتم قراءة الجزء {juz.juz_number}.",
-        actor_name=safe_name,
-        khatma_number=current.number,
-        juz_number=juz.juz_number,
+    activity_events.append(
+        create_activity_event(
+            ActivityEvent.COMPLETE,
+            f"{safe_name} أتم قراءة الجزء {juz.juz_number}.",
+            actor_name=safe_name,
+            khatma_number=current.number,
+            juz_number=juz.juz_number,
+        )
     )
 
     khatma_completed_now, next_khatma_number = finalize_khatma_if_completed(current, now=now)
     if khatma_completed_now:
-        create_activity_event(
-            ActivityEvent.COMPLETE,
-            f"تم اكتمال الختمة رقم {current.number} وبدء الختمة رقم {next_khatma_number}.",
-            khatma_number=current.number,
+        activity_events.append(
+            create_activity_event(
+                ActivityEvent.COMPLETE,
+                f"تم اكتمال الختمة رقم {current.number} وبدء الختمة رقم {next_khatma_number}.",
+                khatma_number=current.number,
+            )
         )
 
+    broadcast_live_event(
+        "juz_completed",
+        {
+            **build_khatma_delta(current, [juz], activity_events),
+            "juz_number": juz.juz_number,
+            "completed_by": juz.completed_by,
+            "khatma_completed_now": khatma_completed_now,
+            "next_khatma_number": next_khatma_number,
+        },
+        topics=[khatma_topic(current.number), participant_topic(safe_name)],
+    )
+    if khatma_completed_now:
+        # اكتمال ختمة يفسح مكانًا في المجمع لختمة جديدة يُخدم منها المنتظرون.
+        grow_khatma_pool()
+        assign_waitlist()
+
     return {
         "completed_juz": juz,
         "current_khatma": current,
         "khatma_completed_now": khatma_completed_now,
         "next_khatma_number": next_khatma_number,
+        "activity_events": activity_events,
+    }
+
+
+def join_waitlist(name: str, *, juz_number: int | None = None, ref_code: str = "") -> dict:
+    """يضع المشارك في طابور الانتظار (لجزء بعينه أو لأي جزء) ثم يحاول خدمته فورًا إن وُجد جزء متاح."""
+    safe_name = normalize_name(name)
+    if not safe_name:
+        raise ValueError("الاسم مطلوب.")
+
+    try:
+        with transaction.atomic():
+            WaitlistEntry.objects.create(
+                name=safe_name, name_key=name_key(safe_name), juz_number=juz_number, ref_code=ref_code
+            )
+    except IntegrityError:
+        raise ValueError("أنت في طابور الانتظار بالفعل.")
+
+    with transaction.atomic():
+        assign_waitlist()
+    return get_waitlist_status(safe_name)
+
+
+def leave_waitlist(name: str) -> bool:
+    return WaitlistEntry.objects.filter(name_key=name_key(normalize_name(name)), assigned_at__isnull=True).delete()[0] > 0
+
+
+def pending_waitlist():
+    return WaitlistEntry.objects.filter(assigned_at__isnull=True).order_by("id")
+
+
+def assign_waitlist() -> int:
+    """يخدم طابور الانتظار بالترتيب (FIFO) من الأجزاء المتاحة، ويُستدعى داخل معاملة التحرير نفسها.
+
+    كل محاولة حجز داخل نقطة حفظ مستقلة؛ إذا لم يبق أي جزء متاح نتوقف عند أول منتظر لـ"أي جزء"،
+    أما من ينتظر جزءًا بعينه فنتخطاه ونكمل.
+    """
+    assigned = 0
+    for entry in pending_waitlist().select_for_update(skip_locked=True):
+        try:
+            if entry.juz_number is None:
+                result = reserve_next_juz(entry.name, ref_code=entry.ref_code)
+            else:
+                result = reserve_juz(entry.juz_number, entry.name, ref_code=entry.ref_code)
+        except ValueError:
+            if entry.juz_number is None:
+                break
+            continue
+
+        juz = result["reserved_juz"]
+        entry.assigned_juz = juz
+        entry.assigned_at = timezone.now()
+        entry.save(update_fields=["assigned_juz", "assigned_at"])
+        broadcast_live_event(
+            "waitlist_assigned",
+            {
+                "juz_number": juz.juz_number,
+                "khatma_number": result["current_khatma"].number,
+                "reservation_expires_at": juz.reservation_expires_at.isoformat(),
+            },
+            topics=[participant_topic(entry.name)],
+        )
+        assigned += 1
+    return assigned
+
+
+def get_waitlist_status(name: str) -> dict:
+    safe_name = normalize_name(name)
+    if not safe_name:
+        raise ValueError("الاسم مطلوب.")
+
+    entry = (
+        WaitlistEntry.objects.select_related("assigned_juz__khatma")
+        .filter(name_key=name_key(safe_name))
+        .order_by("-id")
+        .first()
+    )
+    if entry is None:
+        return {"name": safe_name, "status": "none"}
+    if entry.assigned_at is None:
+        return {
+            "name": safe_name,
+            "status": "waiting",
+            "juz_number": entry.juz_number,
+            "position": pending_waitlist().filter(id__lte=entry.id).count(),
+            "joined_at": entry.created_at,
+        }
+
+    juz = entry.assigned_juz
+    return {
+        "name": safe_name,
+        "status": "assigned",
+        "juz_number": juz.juz_number if juz else entry.juz_number,
+        "khatma_number": juz.khatma.number if juz else None,
+        "assigned_at": entry.assigned_at,
+    }
+
+
+def trend_bucket_start(moment, resolution: str):
+    if resolution == TrendBucket.HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def record_trend(metric: str, amount: int = 1, *, stripe: int = 0, now=None) -> None:
+    """يزيد دلو الدقيقة ودلو الساعة للمقياس؛ استعلام UPDATE واحد لكل دلو في الحالة المعتادة.
+
+    التسبيح يمرر شريحة العداد نفسها حتى لا تتزاحم الطلبات المتزامنة على صف دلو واحد.
+    """
+    now = now or timezone.now()
+    for resolution in (TrendBucket.MINUTE, TrendBucket.HOUR):
+        bucket_start = trend_bucket_start(now, resolution)
+        buckets = TrendBucket.objects.filter(
+            metric=metric, resolution=resolution, bucket_start=bucket_start, stripe=stripe
+        )
+        if buckets.update(count=F("count") + amount):
+            continue
+        try:
+            with transaction.atomic():
+                TrendBucket.objects.create(
+                    metric=metric, resolution=resolution, bucket_start=bucket_start, stripe=stripe, count=amount
+                )
+        except IntegrityError:
+            buckets.update(count=F("count") + amount)
+            continue
+
+        if resolution == TrendBucket.MINUTE:
+            # دلو دقيقة جديد يُنشأ مرة في الدقيقة فقط، فهو وقت مناسب لتنظيف الدلاء القديمة.
+            TrendBucket.objects.filter(
+                resolution=TrendBucket.MINUTE, bucket_start__lt=now - TREND_MINUTE_RETENTION
+            ).delete()
+
+
+def get_trends(*, metrics: list[str], resolution: str, buckets: int, until=None) -> dict:
+    step = timedelta(hours=1) if resolution == TrendBucket.HOUR else timedelta(minutes=1)
+    buckets = max(1, min(buckets, TREND_MAX_BUCKETS[resolution]))
+    last_start = trend_bucket_start(until or timezone.now(), resolution)
+    first_start = last_start - step * (buckets - 1)
+
+    rows = (
+        TrendBucket.objects.filter(
+            metric__in=metrics, resolution=resolution, bucket_start__gte=first_start, bucket_start__lte=last_start
+        )
+        .values("metric", "bucket_start")
+        .annotate(total=Sum("count"))
+    )
+    totals = {(row["metric"], row["bucket_start"]): row["total"] for row in rows}
+    starts = [first_start + step * index for index in range(buckets)]
+    return {
+        "resolution": resolution,
+        "from": first_start,
+        "to": last_start + step,
+        "series": {
+            metric: [{"bucket": start, "count": totals.get((metric, start), 0)} for start in starts]
+            for metric in metrics
+        },
     }
 
 
@@ -565,33 +1248,262 @@ def ensure_default_tasbeeh_phrases() -> None:
         TasbeehCounter.objects.bulk_create(missing)
 
 
-def increment_tasbeeh_phrase(*, phrase: str, name: str = "", ref_code: str = "") -> TasbeehCounter:
+TASBEEH_TOTALS_CACHE_KEY = "tasbeeh:totals"
+
+
+def with_tasbeeh_total(counter: TasbeehCounter) -> TasbeehCounter:
+    shards_total = counter.shards.aggregate(total=Sum("count"))["total"] or 0
+    counter.total_count = counter.count + shards_total
+    return counter
+
+
+def get_tasbeeh_counters() -> list[TasbeehCounter]:
+    """كل العدادات مع مجموع شرائحها؛ المجاميع تُخزن لثوانٍ قليلة فالتحديث اللحظي يصل عبر البث."""
+    counters = list(TasbeehCounter.objects.all())
+    totals = cache.get(TASBEEH_TOTALS_CACHE_KEY)
+    if totals is None or any(counter.pk not in totals for counter in counters):
+        shard_totals = dict(
+            TasbeehCounterShard.objects.values("counter_id")
+            .annotate(total=Sum("count"))
+            .values_list("counter_id", "total")
+        )
+        totals = {counter.pk: counter.count + shard_totals.get(counter.pk, 0) for counter in counters}
+        cache.set(TASBEEH_TOTALS_CACHE_KEY, totals, settings.TASBEEH_TOTALS_CACHE_SECONDS)
+
+    for counter in counters:
+        counter.total_count = totals[counter.pk]
+    return counters
+
+
+def invalidate_tasbeeh_totals() -> None:
+    """يُحذف المجموع المخزن الآن وبعد الاعتماد، قبل رفع النسخة، فلا يُقدَّم مجموع قديم تحت ETag جديد."""
+    cache.delete(TASBEEH_TOTALS_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(TASBEEH_TOTALS_CACHE_KEY))
+
+
+def bump_tasbeeh_shard(counter: TasbeehCounter, amount: int = 1) -> int:
+    invalidate_tasbeeh_totals()
+    bump_data_version("tasbeeh")
+    stripe = random.randrange(settings.TASBEEH_COUNTER_STRIPES)
+    shards = TasbeehCounterShard.objects.filter(counter=counter, stripe=stripe)
+    if shards.update(count=F("count") + amount):
+        return stripe
+    try:
+        with transaction.atomic():
+            TasbeehCounterShard.objects.create(counter=counter, stripe=stripe, count=amount)
+    except IntegrityError:
+        shards.update(count=F("count") + amount)
+    return stripe
+
+
+def tasbeeh_activity_prefix(phrase: str, actor_name: str) -> str:
+    if actor_name:
+        return f"{actor_name} شارك في الذكر: {phrase}"
+    return f"تمت زيادة الذكر: {phrase}"
+
+
+def tasbeeh_activity_message(phrase: str, actor_name: str, count: int) -> str:
+    suffix = f" (×{count})" if count > 1 else ""
+    return f"{tasbeeh_activity_prefix(phrase, actor_name)}{suffix}."
+
+
+def record_tasbeeh_activity(phrase: str, actor_name: str, count: int) -> ActivityEvent:
+    """يدمج نشاط التسبيح لنفس (المشارك، الذكر) داخل نافذة زمنية في صف واحد يُحدّث مكانه.
+
+    الدمج زيادة ذرية بلا قفل مسبق، والنقرات المجهولة تُدمج كلها في صف واحد لكل ذكر.
+    """
+    window_minutes = settings.TASBEEH_ACTIVITY_ROLLUP_MINUTES
+    message = tasbeeh_activity_message(phrase, actor_name, count)
+    bump_data_version("activity")
+    if window_minutes <= 0:
+        return ActivityEvent.objects.create(
+            event_type=ActivityEvent.TASBEEH, message=message, actor_name=actor_name, count=count
+        )
+
+    now = timezone.now()
+    bucket = int(now.timestamp() // (window_minutes * 60))
+    actor = name_key(actor_name) if actor_name else "~anon"
+    rollup_key = f"tasbeeh:{bucket}:{actor}:{phrase}"[:255]
+    total = F("count") + count
+    updates = {
+        "count": total,
+        "actor_name": actor_name,
+        "message": Concat(
+            Value(f"{tasbeeh_activity_prefix(phrase, actor_name)} (×"),
+            Cast(total, output_field=CharField()),
+            Value(")."),
+            output_field=CharField(),
+        ),
+        "created_at": now,
+    }
+    rollup = ActivityEvent.objects.filter(rollup_key=rollup_key)
+    event = update_returning(rollup, updates)
+    if event is not None:
+        return event
+    try:
+        with transaction.atomic():
+            return ActivityEvent.objects.create(
+                event_type=ActivityEvent.TASBEEH,
+                message=message,
+                actor_name=actor_name,
+                count=count,
+                rollup_key=rollup_key,
+            )
+    except IntegrityError:
+        event = update_returning(rollup, updates)
+    if event is None:
+        raise RuntimeError("تعذر تسجيل نشاط التسبيح.")
+    return event
+
+
+@transaction.atomic
+def increment_tasbeeh_phrase(*, phrase: str, count: int = 1, name: str = "", ref_code: str = "") -> TasbeehResult:
     phrase = phrase.strip()
     if not phrase:
         raise ValueError("الذكر مطلوب.")
+    if count < 1:
+        raise ValueError("عدد التسبيح غير صالح.")
+
+    actor_name = normalize_name(name)
+    if settings.TASBEEH_WRITE_BEHIND:
+        return tasbeeh_buffer.add(phrase=phrase, count=count, actor_name=actor_name, ref_code=ref_code)
 
+    # الدفعة كلها تُطبق مرة واحدة: زيادة شريحة واحدة، تحديث المشارك، إجراء إحالة ونشاط واحد.
     counter, _ = TasbeehCounter.objects.get_or_create(phrase=phrase)
-    counter.count = F("count") + 1
-    counter.save(update_fields=["count"])
-    counter.refresh_from_db()
+    stripe = bump_tasbeeh_shard(counter, count)
+    with_tasbeeh_total(counter)
+    record_trend(TrendBucket.TASBEEH, count, stripe=stripe)
 
-    actor_name = normalize_name(name)
     if actor_name:
-        participant = bump_participant_counter(actor_name, "tasbeeh_count", ref_code=ref_code)
+        participant = bump_participant_counter(actor_name, "tasbeeh_count", ref_code=ref_code, amount=count)
         record_referral_action(participant, ReferralAction.TASBEEH)
-        message = f"{actor_name} شارك في الذكر: {phrase}."
-    else:
-        message = f"تمت زيادة الذكر: {phrase}."
 
-    create_activity_event(
-        ActivityEvent.TASBEEH,
-        message,
-        actor_name=actor_name,
+    activity_event = record_tasbeeh_activity(phrase, actor_name, count)
+    broadcast_live_event(
+        "tasbeeh_incremented",
+        {
+            "phrase": counter.phrase,
+            "count": counter.total_count,
+            "counter": TasbeehCounterSerializer(counter).data,
+            "activity": ActivityEventSerializer([activity_event], many=True).data,
+        },
+        topics=[TASBEEH_TOPIC, *([participant_topic(actor_name)] if actor_name else [])],
     )
-    return counter
+    return {"counter": counter, "activity_event": activity_event}
 
 
-def add_dua_message(*, name: str, content: str, ref_code: str = "") -> DuaMessage:
+@transaction.atomic
+def flush_tasbeeh_increments(pending: dict[tuple[str, str], tuple[int, int, str]]) -> dict[str, int]:
+    """يكتب دفعة زيادات مجمعة بمفتاح (الذكر، المشارك) في معاملة واحدة ويرجع المجموع الفعلي لكل ذكر."""
+    amounts: dict[str, int] = defaultdict(int)
+    activity: dict[str, list[ActivityEvent]] = defaultdict(list)
+    actors: dict[str, list[str]] = defaultdict(list)
+
+    for (phrase, actor_name), (amount, requests, ref_code) in pending.items():
+        amounts[phrase] += amount
+        if actor_name:
+            participant = bump_participant_counter(actor_name, "tasbeeh_count", ref_code=ref_code, amount=amount)
+            record_referral_action(participant, ReferralAction.TASBEEH, times=requests)
+            actors[phrase].append(participant_topic(actor_name))
+        activity[phrase].append(record_tasbeeh_activity(phrase, actor_name, amount))
+
+    totals = {}
+    for phrase, amount in amounts.items():
+        counter, _ = TasbeehCounter.objects.get_or_create(phrase=phrase)
+        record_trend(TrendBucket.TASBEEH, amount, stripe=bump_tasbeeh_shard(counter, amount))
+        totals[phrase] = with_tasbeeh_total(counter).total_count
+        broadcast_live_event(
+            "tasbeeh_incremented",
+            {
+                "phrase": counter.phrase,
+                "count": counter.total_count,
+                "counter": TasbeehCounterSerializer(counter).data,
+                "activity": ActivityEventSerializer(activity[phrase], many=True).data,
+            },
+            topics=[TASBEEH_TOPIC, *actors[phrase]],
+        )
+    return totals
+
+
+class TasbeehWriteBehindBuffer:
+    """يجمع زيادات التسبيح في ذاكرة العملية ويكتبها دفعة واحدة (TASBEEH_WRITE_BEHIND).
+
+    الطلب يرجع فورًا بعدد تقديري = آخر مجموع مكتوب + الزيادات المعلقة لنفس الذكر.
+    الدفعة تُكتب كل TASBEEH_FLUSH_INTERVAL_MS أو عند بلوغ TASBEEH_FLUSH_BATCH زيادة،
+    وإذا فشلت الكتابة تعود الزيادات للمخزن لتُعاد مع الدفعة التالية.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._pending: dict[tuple[str, str], tuple[int, int, str]] = {}
+        self._pending_count = 0
+        self._flushed_totals: dict[str, int] = {}
+
+    def add(self, *, phrase: str, count: int = 1, actor_name: str = "", ref_code: str = "") -> TasbeehResult:
+        counter, _ = TasbeehCounter.objects.get_or_create(phrase=phrase)
+        with self._lock:
+            amount, requests, previous_ref = self._pending.get((phrase, actor_name), (0, 0, ""))
+            self._pending[(phrase, actor_name)] = (amount + count, requests + 1, ref_code or previous_ref)
+            self._pending_count += count
+            flush_now = self._pending_count >= settings.TASBEEH_FLUSH_BATCH
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(settings.TASBEEH_FLUSH_INTERVAL_MS / 1000, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if flush_now:
+            self.flush()
+
+        if phrase not in self._flushed_totals:
+            self._flushed_totals[phrase] = with_tasbeeh_total(counter).total_count
+        with self._lock:
+            pending = sum(amount for (key, _), (amount, _, _) in self._pending.items() if key == phrase)
+            counter.total_count = self._flushed_totals[phrase] + pending
+        return {"counter": counter, "activity_event": None}
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_count = 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        try:
+            totals = flush_tasbeeh_increments(pending)
+        except Exception:
+            with self._lock:
+                for key, (amount, requests, ref_code) in pending.items():
+                    current, current_requests, current_ref = self._pending.get(key, (0, 0, ""))
+                    self._pending[key] = (current + amount, current_requests + requests, current_ref or ref_code)
+                    self._pending_count += amount
+            raise
+
+        with self._lock:
+            self._flushed_totals.update(totals)
+        return sum(amount for amount, _, _ in pending.values())
+
+    def _flush_in_background(self) -> None:
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            # الزيادات أعيدت للمخزن، وستُكتب مع الزيادة التالية.
+            pass
+        finally:
+            connection.close()
+
+
+tasbeeh_buffer = TasbeehWriteBehindBuffer()
+atexit.register(lambda: tasbeeh_buffer.flush() if settings.TASBEEH_WRITE_BEHIND else None)
+
+
+@transaction.atomic
+def add_dua_message(*, name: str, content: str, ref_code: str = "") -> DuaResult:
     safe_name = normalize_name(name)
     safe_content = content.strip()
     if not safe_name:
@@ -600,15 +1512,28 @@ def add_dua_message(*, name: str, content: str, ref_code: str = "") -> DuaMessag
         raise ValueError("نص الدعاء مطلوب.")
 
     participant = bump_participant_counter(safe_name, "dua_count", ref_code=ref_code)
+    record_trend(TrendBucket.DUA)
+    bump_data_version("dua")
     record_referral_action(participant, ReferralAction.DUA)
 
     dua = DuaMessage.objects.create(name=safe_name, content=safe_content)
-    create_activity_event(
+    activity_event = create_activity_event(
         ActivityEvent.DUA,
         f"{safe_name} أضاف دعاءً جديدًا.",
         actor_name=safe_name,
     )
-    return dua
+    broadcast_live_event(
+        "dua_added",
+        {
+            "name": dua.name,
+            "content": dua.content,
+            "created_at": dua.created_at.isoformat(),
+            "dua": DuaMessageSerializer(dua).data,
+            "activity": ActivityEventSerializer([activity_event], many=True).data,
+        },
+        topics=[FEED_TOPIC, participant_topic(safe_name)],
+    )
+    return {"dua": dua, "activity_event": activity_event}
 
 
 def build_team_payload(team: TeamGroup, *, include_members: bool = False) -> dict:
@@ -671,13 +1596,25 @@ def create_team(*, owner_name: str, team_name: str, target_points: int = 300, re
         target_points=safe_target,
     )
     TeamMembership.objects.create(team=team, participant=owner)
+    bump_data_version("teams")
 
-    create_activity_event(
+    activity_event = create_activity_event(
         ActivityEvent.TEAM,
         f"{owner.name} أنشأ فريق {team.name} برمز {team.code}.",
         actor_name=owner.name,
     )
-    return build_team_payload(team, include_members=True)
+    payload = build_team_payload(team, include_members=True)
+    broadcast_live_event(
+        "team_created",
+        {
+            "name": payload["name"],
+            "code": payload["code"],
+            "members_count": payload["members_count"],
+            "activity": ActivityEventSerializer([activity_event], many=True).data,
+        },
+        topics=[TEAMS_TOPIC, team_topic(team.code), participant_topic(owner.name)],
+    )
+    return payload
 
 
 @transaction.atomic
@@ -702,12 +1639,24 @@ def join_team(*, name: str, team_code: str, ref_code: str = "") -> dict:
         raise ValueError(f"أنت منضم لفريق آخر: {existing_membership.team.name}.")
 
     TeamMembership.objects.create(team=team, participant=participant)
-    create_activity_event(
+    bump_data_version("teams")
+    activity_event = create_activity_event(
         ActivityEvent.TEAM,
         f"{participant.name} انضم إلى فريق {team.name}.",
         actor_name=participant.name,
     )
-    return build_team_payload(team, include_members=True)
+    payload = build_team_payload(team, include_members=True)
+    broadcast_live_event(
+        "team_joined",
+        {
+            "name": payload["name"],
+            "code": payload["code"],
+            "members_count": payload["members_count"],
+            "activity": ActivityEventSerializer([activity_event], many=True).data,
+        },
+        topics=[TEAMS_TOPIC, team_topic(team.code), participant_topic(participant.name)],
+    )
+    return payload
 
 
 def get_teams_leaderboard(limit: int = 20) -> list[dict]:
@@ -730,6 +1679,29 @@ def get_teams_leaderboard(limit: int = 20) -> list[dict]:
     return entries[:safe_limit]
 
 
+def build_topic_snapshot(topic: str) -> dict | None:
+    """لقطة مختصرة لحالة الموضوع تُرسل للعميل العائد عندما لا يمكن إعادة الأحداث الفائتة."""
+    kind, _, key = topic.partition(":")
+    if kind == "khatma":
+        khatma = Khatma.objects.filter(number=int(key)).first()
+        if not khatma:
+            return None
+        return {"khatma": KhatmaSerializer(khatma).data, "counts": get_khatma_progress_counts(khatma)}
+    if kind == "tasbeeh":
+        return {"counters": TasbeehCounterSerializer(get_tasbeeh_counters(), many=True).data}
+    if kind == "feed":
+        return {
+            "activity": ActivityEventSerializer(ActivityEvent.objects.all()[:35], many=True).data,
+            "duas": DuaMessageSerializer(DuaMessage.objects.filter(is_approved=True)[:80], many=True).data,
+        }
+    if kind == "teams":
+        return {"teams": get_teams_leaderboard(limit=15)}
+    if kind == "team":
+        team = TeamGroup.objects.filter(code__iexact=key).first()
+        return {"team": build_team_payload(team, include_members=True)} if team else None
+    return None
+
+
 def get_invite_leaderboard(limit: int = 20) -> list[dict]:
     safe_limit = max(1, min(int(limit), 100))
     participants = ParticipantProgress.objects.annotate(
@@ -784,11 +1756,9 @@ def get_profile_stats(name: str, *, ref_code: str = "") -> dict:
     now = timezone.now()
 
     pending_reservations = Juz.objects.filter(
-        reserved_by__iexact=safe_name,
-        completed_at__isnull=True,
-        reservation_expires_at__gt=now,
+        reserved_by_participant=participant, completed_at__isnull=True, reservation_expires_at__gt=now
     ).count()
-    completed_total = Juz.objects.filter(completed_by__iexact=safe_name).count()
+    completed_total = Juz.objects.filter(completed_by_participant=participant, completed_at__isnull=False).count()
 
     invite_stats = get_participant_invite_stats(participant)
     team_membership = TeamMembership.objects.select_related("team").filter(participant=participant).first()
@@ -831,12 +1801,9 @@ def get_pending_reminders(name: str) -> dict:
     now = timezone.now()
     items = []
     queryset = (
-        Juz.objects.select_related("khatma")
-        .filter(
-            reserved_by__iexact=safe_name,
-            completed_at__isnull=True,
-            reservation_expires_at__gt=now,
-        )
+        juz_by_participant("reserved_by", safe_name)
+        .select_related("khatma")
+        .filter(completed_at__isnull=True, reservation_expires_at__gt=now)
         .order_by("reservation_expires_at")
     )
 
@@ -862,27 +1829,50 @@ def get_pending_reminders(name: str) -> dict:
     }
 
 
-def get_khatma_history(limit: int = 20) -> list[dict]:
-    result = []
-    completed_khatmas = list(Khatma.objects.filter(is_completed=True).order_by("-number")[:limit])
-    for khatma in completed_khatmas:
-        completed_count = khatma.ajzaa.filter(completed_at__isnull=False).count()
-        participants_count = (
-            khatma.ajzaa.exclude(completed_by__isnull=True)
-            .exclude(completed_by="")
-            .values("completed_by")
-            .distinct()
-            .count()
-        )
-        result.append(
-            {
-                "khatma_number": khatma.number,
-                "completed_at": khatma.completed_at,
-                "completed_juz_count": completed_count,
-                "participants_count": participants_count,
-            }
-        )
-    return result
+def build_khatma_summary(khatma: Khatma) -> KhatmaSummary:
+    """يكتب ملخص الختمة المكتملة: عدد الأجزاء المنجزة كلها، ثم توزيعها على القراء المرتبطين بمشاركين."""
+    completed_juz_count = khatma.ajzaa.filter(completed_at__isnull=False).count()
+    readers = list(
+        khatma.ajzaa.filter(completed_at__isnull=False, completed_by_participant__isnull=False)
+        .values("completed_by_participant")
+        .annotate(name=Min("completed_by_participant__name"), juz_count=Count("id"))
+        .order_by("-juz_count", "name")
+    )
+    completed_at = khatma.completed_at or timezone.now()
+    summary, _ = KhatmaSummary.objects.update_or_create(
+        khatma=khatma,
+        defaults={
+            "khatma_number": khatma.number,
+            "started_at": khatma.created_at,
+            "completed_at": completed_at,
+            "duration_seconds": max(0, int((completed_at - khatma.created_at).total_seconds())),
+            "completed_juz_count": completed_juz_count,
+            "participants_count": len(readers),
+            "top_readers": [
+                {"name": reader["name"], "juz_count": reader["juz_count"]}
+                for reader in readers[:KHATMA_TOP_READERS]
+            ],
+        },
+    )
+    return summary
+
+
+def get_khatma_history(limit: int = 20, *, before: int | None = None) -> list[dict]:
+    """السجل من جدول الملخصات بترقيم keyset: before هو رقم آخر ختمة في الصفحة السابقة."""
+    summaries = KhatmaSummary.objects.order_by("-khatma_number")
+    if before is not None:
+        summaries = summaries.filter(khatma_number__lt=before)
+    return list(
+        summaries.values(
+            "khatma_number",
+            "started_at",
+            "completed_at",
+            "duration_seconds",
+            "completed_juz_count",
+            "participants_count",
+            "top_readers",
+        )[:limit]
+    )
 
 
 def get_daily_wird() -> dict:
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .realtime import DEFAULT_TOPICS, dispatcher, resolve_topics, topic_group_name
+from .subscriptions import batch_frame, parse_since, parse_topics, prepare_subscription
+
+try:
+    from channels.layers import get_channel_layer
+except Exception:
+    get_channel_layer = None
+
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
+
+
+def encode_cursor_id(cursors: dict[str, int]) -> str:
+    # المعرف يحمل نسخة كل موضوع، والمتصفح يعيده في Last-Event-ID عند إعادة الاتصال.
+    raw = json.dumps(cursors, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor_id(value: str) -> dict[str, int]:
+    if not value:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode("utf-8")
+    except ValueError:
+        return {}
+    return parse_since(raw)
+
+
+def format_sse(frame: dict, cursors: dict[str, int] | None = None) -> str:
+    lines = []
+    if cursors is not None:
+        lines.append(f"id: {encode_cursor_id(cursors)}")
+    lines.append(f"data: {json.dumps(frame, cls=DjangoJSONEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_live_events(channel_layer, topics: list[str], since: dict[str, int]):
+    """نفس إطارات LiveUpdatesConsumer لكن عبر Server-Sent Events لمن يمنع وكيلهم WebSocket."""
+    dispatcher.bind_loop(asyncio.get_running_loop())
+    channel = await channel_layer.new_channel()
+    try:
+        for topic in topics:
+            await channel_layer.group_add(topic_group_name(topic), channel)
+
+        versions, frames = await sync_to_async(prepare_subscription)(topics, since)
+        cursors = dict(versions)
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        for frame in frames:
+            yield format_sse(frame)
+        yield format_sse({"type": "subscribed", "detail": "live_updates_connected", "topics": versions}, cursors)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if message.get("type") != "live_batch":
+                continue
+
+            frame = batch_frame(message)
+            if frame["topic"] in cursors and frame["events"]:
+                cursors[frame["topic"]] = max(cursors[frame["topic"]], frame["events"][-1]["version"] or 0)
+            yield format_sse(frame, cursors)
+    finally:
+        for topic in topics:
+            await channel_layer.group_discard(topic_group_name(topic), channel)
+
+
+async def live_events_stream(request):
+    if request.method != "GET":
+        return JsonResponse({"detail": "Method not allowed."}, status=405)
+
+    channel_layer = get_channel_layer() if get_channel_layer else None
+    if channel_layer is None:
+        return JsonResponse({"detail": "التحديث المباشر غير متاح على هذا الخادم."}, status=503)
+
+    requested = parse_topics(request.GET.getlist("topics")) or DEFAULT_TOPICS
+    topics = await sync_to_async(resolve_topics)(requested)
+    since = decode_cursor_id(request.headers.get("Last-Event-ID", "")) or parse_since(request.GET.get("since", ""))
+
+    response = StreamingHttpResponse(stream_live_events(channel_layer, topics, since), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from .realtime import current_topic_versions, replay_live_events
+from .services import build_topic_snapshot
+
+
+def parse_topics(values: list[str]) -> list[str]:
+    return [topic for value in values for topic in value.split(",") if topic]
+
+
+def parse_since(value: Any) -> dict[str, int]:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    if not isinstance(value, dict):
+        return {}
+
+    cursors = {}
+    for topic, version in value.items():
+        try:
+            cursors[str(topic)] = max(0, int(version))
+        except (TypeError, ValueError):
+            continue
+    return cursors
+
+
+def batch_frame(event: dict[str, Any]) -> dict[str, Any]:
+    """يحول رسالة live_batch من طبقة القنوات إلى الإطار الذي يستلمه العميل."""
+    return {
+        "type": "batch",
+        "topic": event.get("topic"),
+        "events": [
+            {
+                "type": item.get("event_type", "update"),
+                "version": item.get("version"),
+                "payload": item.get("payload", {}),
+            }
+            for item in event.get("events", [])
+        ],
+    }
+
+
+def prepare_subscription(topics: list[str], since: dict[str, int]) -> tuple[dict[str, int], list[dict]]:
+    """يحدد نسخة كل موضوع، ويجهز للعميل العائد الأحداث الفائتة أو لقطة عند اتساع الفجوة."""
+    versions = current_topic_versions(topics)
+    frames = []
+    if not since:
+        return versions, frames
+
+    for topic, current in versions.items():
+        missed = replay_live_events(topic, since[topic], current) if topic in since else None
+        if missed is None:
+            frames.append({"type": "snapshot", "topic": topic, "version": current, "data": build_topic_snapshot(topic)})
+        elif missed:
+            frames.append(
+                {
+                    "type": "batch",
+                    "topic": topic,
+                    "replay": True,
+                    "events": [
+                        {"type": event.event_type, "version": event.version, "payload": event.payload}
+                        for event in missed
+                    ],
+                }
+            )
+    return versions, frames
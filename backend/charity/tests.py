@@ -1,17 +1,59 @@
 from __future__ import annotations
 
+import json
+from io import StringIO
 from unittest.mock import patch
+from urllib.parse import quote
 
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, TransactionTestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from .models import DuaMessage, Juz, Khatma, ParticipantProgress, ReferralAction, TasbeehCounter, TeamMembership
-from .services import create_khatma_with_juz
+from .consumers import LiveUpdatesConsumer
+from .layers import DatabaseChannelLayer
+from .models import (
+    ActivityEvent,
+    ChannelLayerMessage,
+    DuaMessage,
+    Juz,
+    Khatma,
+    LiveEvent,
+    LiveTopic,
+    OutboxEvent,
+    ParticipantProgress,
+    ReferralAction,
+    TasbeehCounter,
+    TasbeehCounterShard,
+    TeamMembership,
+)
+from .realtime import LiveEventDispatcher, broadcast_live_event, record_live_events, topic_group_name
+from .services import (
+    activate_standby_khatma,
+    bump_participant_counter,
+    create_khatma_with_juz,
+    juz_by_participant,
+    next_reservation_expiry,
+    open_next_khatma,
+    pending_reservations,
+    with_tasbeeh_total,
+)
+from .streams import decode_cursor_id, encode_cursor_id
 
 
+@override_settings(LIVE_EVENTS_COALESCE_MS=0)
 class CharityApiTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_current_khatma_is_created_automatically(self):
         self.assertEqual(Khatma.objects.count(), 0)
         response = self.client.get(reverse("current-khatma"))
@@ -19,9 +61,41 @@ class CharityApiTests(APITestCase):
         self.assertEqual(response.data["khatma"]["number"], 1)
         self.assertEqual(len(response.data["khatma"]["ajzaa"]), 30)
 
+    def test_current_khatma_snapshot_is_cached_until_a_write_bumps_its_version(self):
+        create_khatma_with_juz(1)
+        first = self.client.get(reverse("current-khatma"))
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse("current-khatma"))
+        self.assertEqual(cached.data, first.data)
+
+        self.client.post(reverse("reserve-juz"), {"juz_number": 4, "name": "سالم"}, format="json")
+        with self.assertNumQueries(1):
+            fresh = self.client.get(reverse("current-khatma"))
+        self.assertEqual(fresh.data["reserved_count"], 1)
+        self.assertEqual(fresh.data["khatma"]["ajzaa"][3]["reserved_by"], "سالم")
+
+    @override_settings(ETAG_MAX_AGE_SECONDS=10**9)
+    def test_read_endpoints_answer_304_from_data_versions_without_queries(self):
+        first = self.client.get(reverse("dua-wall"))
+        etag = first["ETag"]
+        with self.assertNumQueries(0):
+            unchanged = self.client.get(reverse("dua-wall"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unchanged.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(unchanged["ETag"], etag)
+
+        tasbeeh_etag = self.client.get(reverse("tasbeeh"))["ETag"]
+        self.client.post(reverse("dua-wall"), {"name": "داع", "content": "اللهم اغفر لنا"}, format="json")
+        changed = self.client.get(reverse("dua-wall"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(len(changed.data), 1)
+
+        still = self.client.get(reverse("tasbeeh"), HTTP_IF_NONE_MATCH=tasbeeh_etag)
+        self.assertEqual(still.status_code, status.HTTP_304_NOT_MODIFIED)
+
     def test_double_reservation_is_blocked(self):
         create_khatma_with_juz(1)
-        with patch("charity.views.broadcast_live_event"):
+        with patch("charity.services.broadcast_live_event"):
             first = self.client.post(reverse("reserve-juz"), {"juz_number": 5, "name": "محمد"}, format="json")
         self.assertEqual(first.status_code, status.HTTP_201_CREATED)
         self.assertEqual(first.data["reserved_juz"]["read_url"], "https://quran.com/juz/5")
@@ -29,6 +103,168 @@ class CharityApiTests(APITestCase):
         second = self.client.post(reverse("reserve-juz"), {"juz_number": 5, "name": "أحمد"}, format="json")
         self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_reads_are_pure_and_sweeper_releases_expired_reservations(self):
+        khatma = create_khatma_with_juz(1)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 7, "name": "سالم"}, format="json")
+        self.client.post(reverse("reserve-juz"), {"juz_number": 8, "name": "هند"}, format="json")
+        expired_at = timezone.now() - timezone.timedelta(minutes=1)
+        Juz.objects.filter(khatma=khatma, juz_number=7).update(reservation_expires_at=expired_at)
+        self.assertEqual(next_reservation_expiry(), expired_at)
+
+        self.client.get(reverse("current-khatma"))
+        self.client.get(reverse("stats"))
+        self.assertEqual(Juz.objects.get(khatma=khatma, juz_number=7).reserved_by, "سالم")
+
+        with patch("charity.services.broadcast_live_event") as broadcast:
+            call_command("sweep_reservations", "--once", stdout=StringIO())
+
+        self.assertIsNone(Juz.objects.get(khatma=khatma, juz_number=7).reserved_by)
+        self.assertEqual(Juz.objects.get(khatma=khatma, juz_number=8).reserved_by, "هند")
+        self.assertTrue(ActivityEvent.objects.filter(event_type=ActivityEvent.EXPIRE, juz_number=7).exists())
+        self.assertEqual(broadcast.call_args.args[0], "reservation_expired")
+        self.assertEqual(broadcast.call_args.args[1]["count"], 1)
+
+    def test_hot_juz_filters_use_partial_indexes_instead_of_table_scans(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("خطة الاستعلام هنا مكتوبة لصيغة EXPLAIN QUERY PLAN في SQLite.")
+
+        for number in range(1, 41):
+            create_khatma_with_juz(number)
+        now = timezone.now()
+        hot_queries = {
+            "juz_open_expiry_idx": pending_reservations().filter(reservation_expires_at__lte=now),
+            "juz_pending_reserver_idx": juz_by_participant("reserved_by", "سالم").filter(
+                completed_at__isnull=True, reservation_expires_at__gt=now
+            ),
+            "juz_completer_idx": juz_by_participant("completed_by", "سالم").filter(completed_at__isnull=False),
+        }
+        for index_name, queryset in hot_queries.items():
+            plan = queryset.explain()
+            self.assertIn(f"USING INDEX {index_name}", plan)
+            self.assertNotIn("SCAN charity_juz", plan)
+
+    def test_reservation_claims_juz_with_conditional_update_and_takes_over_expired_ones(self):
+        khatma = create_khatma_with_juz(1)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 9, "name": "سالم"}, format="json")
+        Juz.objects.filter(khatma=khatma, juz_number=9).update(
+            reservation_expires_at=timezone.now() - timezone.timedelta(minutes=1)
+        )
+
+        late = self.client.post(reverse("complete-juz"), {"juz_number": 9, "name": "سالم"}, format="json")
+        self.assertEqual(late.status_code, status.HTTP_400_BAD_REQUEST)
+
+        taken = self.client.post(reverse("reserve-juz"), {"juz_number": 9, "name": "هند"}, format="json")
+        self.assertEqual(taken.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Juz.objects.get(khatma=khatma, juz_number=9).reserved_by, "هند")
+        self.assertTrue(ActivityEvent.objects.filter(event_type=ActivityEvent.EXPIRE, juz_number=9).exists())
+
+        again = self.client.post(reverse("reserve-juz"), {"juz_number": 9, "name": "سالم"}, format="json")
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(KHATMA_POOL_SIZE=2)
+    def test_full_khatma_opens_a_parallel_one_up_to_the_pool_size(self):
+        first = create_khatma_with_juz(1)
+        Juz.objects.filter(khatma=first).update(reserved_by="قارئ", reserved_at=timezone.now())
+
+        spill = self.client.post(reverse("reserve-juz"), {"juz_number": 5, "name": "سالم"}, format="json")
+        self.assertEqual(spill.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(spill.data["khatma_number"], 2)
+
+        snapshot = self.client.get(reverse("current-khatma")).data
+        self.assertEqual(snapshot["khatma"]["number"], 2)
+        self.assertEqual([item["number"] for item in snapshot["active_khatmas"]], [1, 2])
+        pinned = self.client.get(reverse("current-khatma"), {"number": 1}).data
+        self.assertEqual(pinned["khatma"]["number"], 1)
+        self.assertEqual(pinned["reserved_count"], 30)
+
+        Juz.objects.filter(khatma__number=2, reserved_by__isnull=True).update(reserved_by="قارئ", reserved_at=timezone.now())
+        blocked = self.client.post(reverse("reserve-juz"), {"juz_number": 6, "name": "هند"}, format="json")
+        self.assertEqual(blocked.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Khatma.objects.filter(is_completed=False).count(), 2)
+
+        done = self.client.post(
+            reverse("complete-juz"), {"juz_number": 5, "name": "سالم", "khatma_number": 2}, format="json"
+        )
+        self.assertEqual(done.status_code, status.HTTP_200_OK)
+
+    @override_settings(KHATMA_POOL_SIZE=1)
+    def test_reserve_next_hands_out_the_preferred_or_any_free_juz(self):
+        khatma = create_khatma_with_juz(1)
+        Juz.objects.filter(khatma=khatma, juz_number__lte=28).update(reserved_by="قارئ", reserved_at=timezone.now())
+
+        preferred = self.client.post(reverse("reserve-next-juz"), {"name": "سالم", "juz_number": 30}, format="json")
+        self.assertEqual(preferred.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(preferred.data["reserved_juz"]["juz_number"], 30)
+
+        fallback = self.client.post(reverse("reserve-next-juz"), {"name": "هند", "juz_number": 30}, format="json")
+        self.assertEqual(fallback.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(fallback.data["reserved_juz"]["juz_number"], 29)
+        self.assertEqual(fallback.data["reserved_juz"]["reserved_by"], "هند")
+
+        exhausted = self.client.post(reverse("reserve-next-juz"), {"name": "علي"}, format="json")
+        self.assertEqual(exhausted.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(exhausted.data["code"], "no_free_juz")
+
+        invalid = self.client.post(reverse("reserve-next-juz"), {"name": ""}, format="json")
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("code", invalid.data)
+
+    @override_settings(KHATMA_POOL_SIZE=1)
+    def test_waitlist_is_served_fifo_when_a_reservation_expires(self):
+        khatma = create_khatma_with_juz(1)
+        Juz.objects.filter(khatma=khatma).update(
+            reserved_by="قارئ", reserved_at=timezone.now(), reservation_expires_at=timezone.now() + timezone.timedelta(hours=1)
+        )
+
+        first = self.client.post(reverse("waitlist"), {"name": "سالم"}, format="json")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first.data["status"], "waiting")
+        self.client.post(reverse("waitlist"), {"name": "هند"}, format="json")
+        duplicate = self.client.post(reverse("waitlist"), {"name": "سَالِم"}, format="json")
+        self.assertEqual(duplicate.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse("waitlist"), {"name": "هند"}).data["position"], 2)
+
+        Juz.objects.filter(khatma=khatma, juz_number=12).update(reservation_expires_at=timezone.now() - timezone.timedelta(minutes=1))
+        with patch("charity.services.broadcast_live_event") as broadcast:
+            call_command("sweep_reservations", "--once", stdout=StringIO())
+
+        self.assertEqual(Juz.objects.get(khatma=khatma, juz_number=12).reserved_by, "سالم")
+        assigned = self.client.get(reverse("waitlist"), {"name": "سالم"}).data
+        self.assertEqual((assigned["status"], assigned["juz_number"]), ("assigned", 12))
+        self.assertEqual(self.client.get(reverse("waitlist"), {"name": "هند"}).data["position"], 1)
+        waitlist_events = [call for call in broadcast.call_args_list if call.args[0] == "waitlist_assigned"]
+        self.assertEqual(len(waitlist_events), 1)
+        self.assertEqual(waitlist_events[0].kwargs["topics"], ["participant:سالم"])
+
+        left = self.client.delete(f"{reverse('waitlist')}?name={quote('هِنْد')}")
+        self.assertEqual(left.status_code, status.HTTP_204_NO_CONTENT)
+
+    @override_settings(KHATMA_POOL_SIZE=1, LIVE_OUTBOX_POLL_MS=50)
+    def test_sweeper_assignment_is_delivered_by_the_server_process(self):
+        khatma = create_khatma_with_juz(1)
+        Juz.objects.filter(khatma=khatma).update(
+            reserved_by="قارئ", reserved_at=timezone.now(), reservation_expires_at=timezone.now() + timezone.timedelta(hours=1)
+        )
+        self.client.post(reverse("waitlist"), {"name": "سالم"}, format="json")
+        Juz.objects.filter(khatma=khatma, juz_number=3).update(reservation_expires_at=timezone.now() - timezone.timedelta(minutes=1))
+
+        async def scenario():
+            path = f"/ws/live/?topics={quote('participant:سالم')}"
+            communicator = WebsocketCommunicator(LiveUpdatesConsumer.as_asgi(), path)
+            await communicator.connect()
+            await communicator.receive_json_from()
+            # المنظف لا يبث بنفسه؛ القراءة الدورية على حلقة المقبس هي التي تلتقط أحداثه.
+            await sync_to_async(call_command)("sweep_reservations", "--once", stdout=StringIO())
+            events = []
+            while not any(event["type"] == "waitlist_assigned" for event in events):
+                events.extend((await communicator.receive_json_from(timeout=2))["events"])
+            await communicator.disconnect()
+            return events
+
+        events = async_to_sync(scenario)()
+        assigned = next(event for event in events if event["type"] == "waitlist_assigned")
+        self.assertEqual(assigned["payload"]["juz_number"], 3)
+
     def test_juz_completion_requires_same_name_and_marks_done(self):
         create_khatma_with_juz(1)
         self.client.post(reverse("reserve-juz"), {"juz_number": 3, "name": "سالم"}, format="json")
@@ -50,6 +286,7 @@ class CharityApiTests(APITestCase):
                 completed_by="خاتم",
                 completed_at=timezone.now(),
             )
+        Khatma.objects.filter(pk=khatma.pk).update(completed_count=29)
 
         self.client.post(reverse("reserve-juz"), {"juz_number": 30, "name": "خاتم"}, format="json")
         response = self.client.post(reverse("complete-juz"), {"juz_number": 30, "name": "خاتم"}, format="json")
@@ -58,6 +295,77 @@ class CharityApiTests(APITestCase):
         self.assertEqual(response.data["next_khatma_number"], 2)
         self.assertEqual(Khatma.objects.filter(is_completed=False).count(), 1)
 
+    def test_opening_next_khatma_rereads_one_created_concurrently(self):
+        Khatma.objects.filter(pk=create_khatma_with_juz(1).pk).update(is_completed=True)
+        # منظف الحجوزات جهّز الختمة 2 بعد أن وجدنا المجمع بلا ختمة احتياطية.
+        create_khatma_with_juz(2, standby=True)
+        attempts = iter([lambda: None, activate_standby_khatma])
+
+        with patch("charity.services.next_khatma_number", return_value=2), patch(
+            "charity.services.activate_standby_khatma", side_effect=lambda: next(attempts)()
+        ), transaction.atomic():
+            opened = open_next_khatma()
+            self.assertEqual(Khatma.objects.filter(is_completed=False).count(), 1)
+
+        self.assertEqual(opened.number, 2)
+        self.assertFalse(Khatma.objects.get(number=2).is_standby)
+
+    def test_khatma_history_reads_summaries_with_keyset_pagination(self):
+        old = create_khatma_with_juz(1)
+        veteran = ParticipantProgress.objects.create(name="قديم")
+        Juz.objects.filter(khatma=old, juz_number__gt=1).update(
+            completed_by="قديم", completed_by_participant=veteran, completed_at=timezone.now()
+        )
+        # جزء أُنجز قبل ربط الأجزاء بالمشاركين يُحسب في المجموع وإن لم يظهر في توزيع القراء.
+        Juz.objects.filter(khatma=old, juz_number=1).update(completed_by="مجهول", completed_at=timezone.now())
+        Khatma.objects.filter(pk=old.pk).update(is_completed=True, completed_at=timezone.now(), completed_count=30)
+        call_command("backfill_khatma_summaries", stdout=StringIO())
+
+        current = create_khatma_with_juz(2)
+        salem = ParticipantProgress.objects.create(name="سالم")
+        Juz.objects.filter(khatma=current, juz_number__lt=30).update(
+            reserved_by="سالم",
+            reserved_at=timezone.now(),
+            completed_by="سالم",
+            completed_by_participant=salem,
+            completed_at=timezone.now(),
+        )
+        Khatma.objects.filter(pk=current.pk).update(completed_count=29)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 30, "name": "هند"}, format="json")
+        self.client.post(reverse("complete-juz"), {"juz_number": 30, "name": "هند"}, format="json")
+
+        with self.assertNumQueries(1):
+            history = self.client.get(reverse("khatma-history"), {"limit": 100}).data
+        self.assertEqual([item["khatma_number"] for item in history], [2, 1])
+        self.assertEqual((history[0]["completed_juz_count"], history[0]["participants_count"]), (30, 2))
+        self.assertEqual(history[0]["top_readers"][0], {"name": "سالم", "juz_count": 29})
+        self.assertEqual(history[1]["completed_juz_count"], 30)
+        self.assertEqual(history[1]["top_readers"], [{"name": "قديم", "juz_count": 29}])
+
+        older = self.client.get(reverse("khatma-history"), {"before": 2}).data
+        self.assertEqual([item["khatma_number"] for item in older], [1])
+
+    @override_settings(KHATMA_POOL_SIZE=1, KHATMA_STANDBY_COUNT=1)
+    def test_rollover_activates_a_standby_khatma_prepared_by_the_sweeper(self):
+        khatma = create_khatma_with_juz(1)
+        call_command("sweep_reservations", "--once", stdout=StringIO())
+        standby = Khatma.objects.get(is_standby=True)
+        self.assertEqual((standby.number, standby.ajzaa.count()), (2, 30))
+        self.assertEqual(self.client.get(reverse("current-khatma")).data["khatma"]["number"], 1)
+
+        Juz.objects.filter(khatma=khatma, juz_number__lt=30).update(
+            reserved_by="خاتم", reserved_at=timezone.now(), completed_by="خاتم", completed_at=timezone.now()
+        )
+        Khatma.objects.filter(pk=khatma.pk).update(completed_count=29)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 30, "name": "خاتم"}, format="json")
+        response = self.client.post(reverse("complete-juz"), {"juz_number": 30, "name": "خاتم"}, format="json")
+
+        self.assertTrue(response.data["khatma_completed_now"])
+        self.assertEqual(response.data["next_khatma_number"], 2)
+        self.assertEqual(Khatma.objects.get(pk=khatma.pk).completed_count, 30)
+        self.assertFalse(Khatma.objects.get(pk=standby.pk).is_standby)
+        self.assertEqual(Juz.objects.count(), 60)
+
     def test_tasbeeh_counter_increments_with_optional_name_stats(self):
         response = self.client.post(
             reverse("tasbeeh"),
@@ -65,11 +373,111 @@ class CharityApiTests(APITestCase):
             format="json",
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
         counter = TasbeehCounter.objects.get(phrase="سُبْحَانَ اللَّهِ")
-        self.assertEqual(counter.count, 1)
+        self.assertEqual(with_tasbeeh_total(counter).total_count, 1)
         progress = ParticipantProgress.objects.get(name="مشارك")
         self.assertEqual(progress.tasbeeh_count, 1)
 
+    def test_tasbeeh_increments_spread_over_shards_and_reads_sum_them(self):
+        counter = TasbeehCounter.objects.create(phrase="الحمد لله", count=10)
+        with patch("charity.services.random.randrange", side_effect=[0, 3, 3, 5]):
+            for _ in range(4):
+                response = self.client.post(reverse("tasbeeh"), {"phrase": "الحمد لله"}, format="json")
+
+        self.assertEqual(response.data, {"id": counter.id, "phrase": "الحمد لله", "count": 14})
+        self.assertEqual(
+            dict(TasbeehCounterShard.objects.filter(counter=counter).values_list("stripe", "count")),
+            {0: 1, 3: 2, 5: 1},
+        )
+        listed = {item["phrase"]: item["count"] for item in self.client.get(reverse("tasbeeh")).data}
+        self.assertEqual(listed["الحمد لله"], 14)
+
+    @override_settings(ETAG_MAX_AGE_SECONDS=10**9, TASBEEH_TOTALS_CACHE_SECONDS=60)
+    def test_tasbeeh_write_refreshes_cached_totals_along_with_the_etag(self):
+        TasbeehCounter.objects.create(phrase="الحمد لله")
+        before = self.client.get(reverse("tasbeeh"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tasbeeh"), {"phrase": "الحمد لله"}, format="json")
+        after = self.client.get(reverse("tasbeeh"), HTTP_IF_NONE_MATCH=before["ETag"])
+
+        self.assertEqual(after.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        counts = {item["phrase"]: item["count"] for item in after.data}
+        self.assertEqual(counts["الحمد لله"], 1)
+
+    def test_tasbeeh_accepts_a_bounded_batch_count_applied_once(self):
+        payload = {"phrase": "أَسْتَغْفِرُ اللَّهَ", "name": "مشارك", "count": 100}
+        response = self.client.post(reverse("tasbeeh"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 100)
+        self.assertEqual(ParticipantProgress.objects.get(name="مشارك").tasbeeh_count, 100)
+        self.assertEqual(ActivityEvent.objects.filter(event_type=ActivityEvent.TASBEEH).count(), 1)
+        self.assertEqual(TasbeehCounterShard.objects.count(), 1)
+
+        too_many = self.client.post(reverse("tasbeeh"), {**payload, "count": 501}, format="json")
+        self.assertEqual(too_many.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tasbeeh_activity_rolls_up_per_actor_and_phrase_within_window(self):
+        # نفس المشارك بتشكيل مختلف يُدمج في نفس الصف، كما في مفتاح الهوية.
+        for name, count in (("مشارك", 1), ("مُشارِك", 36)):
+            payload = {"phrase": "سُبْحَانَ اللَّهِ", "name": name, "count": count}
+            self.client.post(reverse("tasbeeh"), payload, format="json")
+        self.client.post(reverse("reserve-juz"), {"juz_number": 2, "name": "مشارك"}, format="json")
+
+        rolled_up = ActivityEvent.objects.get(event_type=ActivityEvent.TASBEEH)
+        self.assertEqual(rolled_up.count, 37)
+        self.assertEqual(rolled_up.message, "مُشارِك شارك في الذكر: سُبْحَانَ اللَّهِ (×37).")
+
+        feed = self.client.get(reverse("activity-feed")).data
+        self.assertEqual([item["event_type"] for item in feed], ["reserve", "tasbeeh"])
+        self.assertEqual(feed[1]["count"], 37)
+
+        for _ in range(3):
+            self.client.post(reverse("tasbeeh"), {"phrase": "سُبْحَانَ اللَّهِ"}, format="json")
+        anonymous = ActivityEvent.objects.get(event_type=ActivityEvent.TASBEEH, actor_name="")
+        self.assertEqual(anonymous.count, 3)
+
+        with override_settings(TASBEEH_ACTIVITY_ROLLUP_MINUTES=0):
+            self.client.post(reverse("tasbeeh"), {"phrase": "سُبْحَانَ اللَّهِ", "name": "مشارك"}, format="json")
+        self.assertEqual(ActivityEvent.objects.filter(event_type=ActivityEvent.TASBEEH).count(), 3)
+
+    @override_settings(TASBEEH_WRITE_BEHIND=True, TASBEEH_FLUSH_BATCH=3, TASBEEH_FLUSH_INTERVAL_MS=60000)
+    def test_write_behind_tasbeeh_buffers_taps_and_flushes_in_one_batch(self):
+        for name in ("مشارك", "مشارك", ""):
+            with self.captureOnCommitCallbacks(execute=True):
+                payload = {"phrase": "سُبْحَانَ اللَّهِ", "name": name}
+                response = self.client.post(reverse("tasbeeh"), payload, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(response.data["count"], 3)
+        counter = TasbeehCounter.objects.get(phrase="سُبْحَانَ اللَّهِ")
+        self.assertEqual(with_tasbeeh_total(counter).total_count, 3)
+        self.assertEqual(ParticipantProgress.objects.get(name="مشارك").tasbeeh_count, 2)
+        messages = ActivityEvent.objects.filter(event_type=ActivityEvent.TASBEEH).values_list("message", flat=True)
+        self.assertEqual(len(messages), 2)
+        self.assertTrue(any(message.startswith("مشارك") and "(×2)" in message for message in messages))
+        self.assertEqual(OutboxEvent.objects.filter(event_type="tasbeeh_incremented").count(), 1)
+
+    def test_trends_endpoint_serves_incremental_minute_buckets(self):
+        self.client.post(reverse("tasbeeh"), {"phrase": "الحمد لله", "count": 5}, format="json")
+        self.client.post(reverse("tasbeeh"), {"phrase": "الله أكبر", "count": 2}, format="json")
+        self.client.post(reverse("dua-wall"), {"name": "داع", "content": "اللهم تقبل"}, format="json")
+
+        response = self.client.get(reverse("trends"), {"resolution": "minute", "buckets": 5, "metrics": "tasbeeh,dua"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["series"]), {"tasbeeh", "dua"})
+        self.assertEqual(len(response.data["series"]["tasbeeh"]), 5)
+        self.assertEqual(response.data["series"]["tasbeeh"][-1]["count"], 7)
+        self.assertEqual(response.data["series"]["dua"][-1]["count"], 1)
+
+        hourly = self.client.get(reverse("trends"), {"resolution": "hour", "buckets": 2}).data
+        self.assertEqual(hourly["series"]["tasbeeh"][-1]["count"], 7)
+        self.assertEqual(hourly["series"]["reserve"][-1]["count"], 0)
+
+        fallback = self.client.get(reverse("trends"), {"resolution": "hour", "buckets": "all"}).data
+        self.assertEqual(len(fallback["series"]["tasbeeh"]), 48)
+
     def test_dua_wall_create_and_list(self):
         create = self.client.post(
             reverse("dua-wall"),
@@ -83,6 +491,61 @@ class CharityApiTests(APITestCase):
         self.assertEqual(listing.status_code, status.HTTP_200_OK)
         self.assertEqual(len(listing.data), 1)
 
+    def test_participant_identity_ignores_case_diacritics_and_tatweel(self):
+        create_khatma_with_juz(1)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 4, "name": "أَحْمَـد"}, format="json")
+        done = self.client.post(reverse("complete-juz"), {"juz_number": 4, "name": "احمد"}, format="json")
+        self.assertEqual(done.status_code, status.HTTP_200_OK)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 5, "name": "Ahmed"}, format="json")
+
+        profile = self.client.get(reverse("profile-stats"), {"name": "إحمد"}).data
+        self.assertEqual((profile["reservations_count"], profile["completed_total"]), (1, 1))
+        self.assertEqual(ParticipantProgress.objects.get(name_key="احمد").name, "أَحْمَـد")
+        reminders = self.client.get(reverse("reminders"), {"name": "AHMED"}).data
+        self.assertEqual([item["juz_number"] for item in reminders["items"]], [5])
+
+    def test_juz_rows_link_reservers_and_completers_by_foreign_key(self):
+        create_khatma_with_juz(1)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 2, "name": "سالم"}, format="json")
+        self.client.post(reverse("reserve-juz"), {"juz_number": 3, "name": "هند"}, format="json")
+        self.client.post(reverse("complete-juz"), {"juz_number": 2, "name": "سالم"}, format="json")
+
+        salem = ParticipantProgress.objects.get(name="سالم")
+        juz = Juz.objects.get(juz_number=2)
+        self.assertEqual((juz.reserved_by_participant_id, juz.completed_by_participant_id), (salem.pk, salem.pk))
+        self.assertEqual(self.client.get(reverse("stats")).data["total_participants"], 2)
+        # المقياس يعد أصحاب الأجزاء، لا عدادات الحجز: صف مرحّل بلا عداد يُحسب، وعداد بلا جزء لا يُحسب.
+        ParticipantProgress.objects.create(name="عداد بلا جزء", reservations_count=3)
+        migrated = ParticipantProgress.objects.create(name="مرحّل")
+        Juz.objects.filter(juz_number=7).update(
+            reserved_by="مرحّل", reserved_by_participant=migrated, reserved_at=timezone.now()
+        )
+        self.assertEqual(self.client.get(reverse("stats")).data["total_participants"], 3)
+        profile = self.client.get(reverse("profile-stats"), {"name": "هند"}).data
+        self.assertEqual((profile["pending_reservations"], profile["completed_total"]), (1, 0))
+
+    def test_participant_counter_bump_is_one_statement_returning_the_row(self):
+        today = timezone.localdate()
+        ParticipantProgress.objects.create(
+            name="سالم",
+            referral_code="SALEM234",
+            streak_days=2,
+            best_streak_days=2,
+            last_activity_date=today - timezone.timedelta(days=1),
+        )
+
+        with self.assertNumQueries(1):
+            participant = bump_participant_counter("سَالم", "tasbeeh_count", amount=5)
+        self.assertEqual((participant.tasbeeh_count, participant.streak_days, participant.best_streak_days), (5, 3, 3))
+        self.assertEqual(participant.last_activity_date, today)
+        self.assertTrue(timezone.is_aware(participant.updated_at))
+
+        again = bump_participant_counter("سالم", "dua_count")
+        self.assertEqual((again.dua_count, again.streak_days), (1, 3))
+        newcomer = bump_participant_counter("هند", "dua_count")
+        self.assertEqual((newcomer.dua_count, newcomer.streak_days), (1, 1))
+        self.assertTrue(newcomer.referral_code)
+
     def test_profile_stats_returns_badges(self):
         create_khatma_with_juz(1)
         self.client.post(reverse("reserve-juz"), {"juz_number": 1, "name": "حسن"}, format="json")
@@ -174,3 +637,260 @@ class CharityApiTests(APITestCase):
         response = self.client.get(reverse("juz-content", kwargs={"juz_number": 7}))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["juz_number"], 7)
+
+    def test_live_events_carry_versioned_deltas(self):
+        create_khatma_with_juz(1)
+        with patch("charity.realtime.async_to_sync") as mock_async_to_sync:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("reserve-juz"), {"juz_number": 4, "name": "ياسر"}, format="json")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("tasbeeh"), {"phrase": "سُبْحَانَ اللَّهِ"}, format="json")
+
+        frames = [call.args[1] for call in mock_async_to_sync.return_value.call_args_list]
+        by_topic: dict[str, list[dict]] = {}
+        for frame in frames:
+            by_topic.setdefault(frame["topic"], []).extend(frame["events"])
+        self.assertEqual(set(by_topic), {"khatma:1", "participant:ياسر", "tasbeeh", "feed"})
+        self.assertEqual([event["version"] for event in by_topic["feed"]], [1, 2])
+        self.assertEqual(by_topic["tasbeeh"][0]["version"], 1)
+        self.assertEqual(LiveEvent.objects.count(), 5)
+
+        reserved = by_topic["khatma:1"][0]["payload"]
+        self.assertEqual(by_topic["khatma:1"][0]["event_type"], "khatma_reserved")
+        self.assertEqual(reserved["ajzaa"][0]["juz_number"], 4)
+        self.assertEqual(reserved["ajzaa"][0]["reserved_by"], "ياسر")
+        self.assertEqual(reserved["counts"], {"reserved_count": 1, "completed_count": 0})
+        self.assertNotIn("activity", reserved)
+        self.assertEqual(by_topic["feed"][0]["payload"]["activity"][0]["event_type"], "reserve")
+        self.assertEqual(by_topic["tasbeeh"][0]["payload"]["counter"]["count"], 1)
+
+    def test_database_channel_layer_fans_out_group_sends_between_layers(self):
+        publisher = DatabaseChannelLayer()
+        subscriber = DatabaseChannelLayer()
+
+        async def scenario():
+            channel = await subscriber.new_channel()
+            await InMemoryChannelLayer.group_add(subscriber, "live_updates", channel)
+            await subscriber.deliver_pending()
+            await publisher.group_send("live_updates", {"type": "live_event", "version": 7})
+            delivered = await subscriber.deliver_pending()
+            message = await subscriber.receive(channel)
+            return delivered, message
+
+        delivered, message = async_to_sync(scenario)()
+        self.assertEqual(delivered, 1)
+        self.assertEqual(message["version"], 7)
+        self.assertEqual(ChannelLayerMessage.objects.count(), 1)
+
+    def test_database_channel_layer_picks_up_rows_committed_below_the_high_water_mark(self):
+        layer = DatabaseChannelLayer()
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await InMemoryChannelLayer.group_add(layer, "live_updates", channel)
+            await layer.deliver_pending()
+            # معاملة أبطأ حجزت المعرّف 5 لكنها اعتُمدت بعد أن قرأنا المعرّف 10.
+            await sync_to_async(ChannelLayerMessage.objects.create)(id=10, group="live_updates", payload={"version": 2})
+            first = await layer.deliver_pending()
+            await sync_to_async(ChannelLayerMessage.objects.create)(id=5, group="live_updates", payload={"version": 1})
+            late = await layer.deliver_pending()
+            again = await layer.deliver_pending()
+            messages = [await layer.receive(channel) for _ in range(2)]
+            return first, late, again, messages
+
+        first, late, again, messages = async_to_sync(scenario)()
+        self.assertEqual((first, late, again), (1, 1, 0))
+        self.assertEqual([message["version"] for message in messages], [2, 1])
+
+    def test_dispatcher_coalesces_pending_outbox_events_into_one_frame_per_topic(self):
+        for count in (1, 3, 2):
+            broadcast_live_event(
+                "tasbeeh_incremented",
+                {"phrase": "سُبْحَانَ اللَّهِ", "count": count, "activity": [{"id": count}]},
+                topics=["tasbeeh"],
+            )
+        broadcast_live_event("dua_added", {"name": "داع", "activity": [{"id": 4}]}, topics=["feed"])
+
+        with patch("charity.realtime.async_to_sync") as mock_async_to_sync:
+            self.assertEqual(LiveEventDispatcher().flush(), 4)
+
+        self.assertEqual(mock_async_to_sync.return_value.call_count, 2)
+        frames = {call.args[1]["topic"]: call.args[1] for call in mock_async_to_sync.return_value.call_args_list}
+        tasbeeh_events = frames["tasbeeh"]["events"]
+        self.assertEqual(len(tasbeeh_events), 1)
+        self.assertEqual(tasbeeh_events[0]["payload"]["count"], 3)
+
+        feed_events = frames["feed"]["events"]
+        self.assertEqual([event["event_type"] for event in feed_events], ["activity_added", "dua_added"])
+        self.assertEqual([item["id"] for item in feed_events[0]["payload"]["activity"]], [1, 3, 2, 4])
+        self.assertEqual(feed_events[1]["version"], feed_events[0]["version"] + 1)
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_outbox_is_transactional_and_retries_failed_delivery(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            broadcast_live_event("dua_added", {"name": "داع"}, topics=["feed"])
+            raise RuntimeError("rollback")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        create_khatma_with_juz(1)
+        self.client.post(reverse("reserve-juz"), {"juz_number": 9, "name": "ياسر"}, format="json")
+        self.assertEqual(OutboxEvent.objects.get().event_type, "khatma_reserved")
+
+        dispatcher = LiveEventDispatcher()
+        with patch("charity.realtime.async_to_sync", side_effect=ConnectionError("layer down")):
+            with patch.object(dispatcher, "wake"), self.assertRaises(ConnectionError):
+                dispatcher.flush()
+
+        # النسخ اعتُمدت قبل الإرسال، فالإعادة ترسل نفس الأحداث ولا تسجلها من جديد.
+        self.assertIsNotNone(OutboxEvent.objects.get().delivered_at)
+        recorded = dict(LiveEvent.objects.values_list("topic", "version"))
+        self.assertEqual(recorded["khatma:1"], 1)
+        pending = LiveTopic.objects.get(name="khatma:1")
+        self.assertEqual((pending.published_version, pending.publish_attempts), (0, 1))
+        self.assertGreater(pending.publish_after, timezone.now())
+
+        LiveTopic.objects.update(publish_after=timezone.now())
+        with patch("charity.realtime.async_to_sync") as mock_async_to_sync, patch.object(dispatcher, "wake"):
+            self.assertEqual(dispatcher.flush(), 0)
+
+        frames = {call.args[1]["topic"]: call.args[1] for call in mock_async_to_sync.return_value.call_args_list}
+        self.assertEqual({topic: frame["events"][0]["version"] for topic, frame in frames.items()}, recorded)
+        self.assertEqual(LiveEvent.objects.count(), len(recorded))
+        self.assertFalse(LiveTopic.objects.filter(publish_after__isnull=False).exists())
+
+    @override_settings(LIVE_EVENTS_COALESCE_MS=50)
+    def test_coalesced_flush_is_delivered_on_the_socket_loop(self):
+        def publish():
+            with self.captureOnCommitCallbacks(execute=True):
+                broadcast_live_event("dua_added", {"name": "داع"}, topics=["feed"])
+
+        async def scenario():
+            communicator = WebsocketCommunicator(LiveUpdatesConsumer.as_asgi(), "/ws/live/?topics=feed")
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await sync_to_async(publish)()
+            frame = await communicator.receive_json_from(timeout=1)
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual(frame["topic"], "feed")
+        self.assertEqual(frame["events"][0]["type"], "dua_added")
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+
+    def test_live_socket_only_receives_subscribed_topics(self):
+        create_khatma_with_juz(3)
+
+        async def scenario():
+            path = "/ws/live/?topics=khatma:current,team:ab12"
+            communicator = WebsocketCommunicator(LiveUpdatesConsumer.as_asgi(), path)
+            await communicator.connect()
+            subscribed = await communicator.receive_json_from()
+
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send(topic_group_name("tasbeeh"), {"type": "live_batch", "topic": "tasbeeh"})
+            await channel_layer.group_send(
+                topic_group_name("khatma:3"),
+                {"type": "live_batch", "topic": "khatma:3", "events": [{"event_type": "juz_completed", "version": 1}]},
+            )
+            frame = await communicator.receive_json_from()
+            nothing_else = await communicator.receive_nothing()
+
+            await communicator.send_json_to({"action": "unsubscribe", "topics": ["khatma:3"]})
+            unsubscribed = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return subscribed, frame, nothing_else, unsubscribed
+
+        subscribed, frame, nothing_else, unsubscribed = async_to_sync(scenario)()
+        self.assertEqual(subscribed["topics"], {"khatma:3": 0, "team:AB12": 0})
+        self.assertEqual(frame["topic"], "khatma:3")
+        self.assertEqual(frame["events"][0]["type"], "juz_completed")
+        self.assertTrue(nothing_else)
+        self.assertEqual(unsubscribed["topics"], ["khatma:3"])
+
+    def test_live_socket_resumes_from_since_cursor_or_sends_snapshot(self):
+        record_live_events("feed", [("activity_added", {"activity": [{"id": index}]}) for index in range(3)])
+        TasbeehCounter.objects.create(phrase="الحمد لله", count=4)
+        since = quote(json.dumps({"feed": 1, "tasbeeh": 9}))
+
+        async def scenario():
+            path = f"/ws/live/?topics=feed,tasbeeh&since={since}"
+            communicator = WebsocketCommunicator(LiveUpdatesConsumer.as_asgi(), path)
+            await communicator.connect()
+            frames = [await communicator.receive_json_from() for _ in range(3)]
+            await communicator.disconnect()
+            return frames
+
+        replay, snapshot, subscribed = async_to_sync(scenario)()
+        self.assertTrue(replay["replay"])
+        self.assertEqual([event["version"] for event in replay["events"]], [2, 3])
+        self.assertEqual(snapshot["type"], "snapshot")
+        self.assertEqual(snapshot["topic"], "tasbeeh")
+        self.assertEqual(snapshot["data"]["counters"][0]["count"], 4)
+        self.assertEqual(subscribed["topics"], {"feed": 3, "tasbeeh": 0})
+
+    def test_live_stream_resumes_from_last_event_id_over_sse(self):
+        record_live_events("feed", [("activity_added", {"activity": [{"id": index}]}) for index in range(3)])
+
+        async def scenario():
+            client = AsyncClient()
+            response = await client.get(
+                reverse("live-stream"),
+                {"topics": "feed"},
+                headers={"Last-Event-ID": encode_cursor_id({"feed": 2})},
+            )
+            chunks = aiter(response.streaming_content)
+            opening = [(await anext(chunks)).decode("utf-8") for _ in range(3)]
+            await get_channel_layer().group_send(
+                topic_group_name("feed"),
+                {"type": "live_batch", "topic": "feed", "events": [{"event_type": "dua_added", "version": 4}]},
+            )
+            live = (await anext(chunks)).decode("utf-8")
+            await chunks.aclose()
+            return response, opening, live
+
+        response, (retry, replay, subscribed), live = async_to_sync(scenario)()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertTrue(retry.startswith("retry:"))
+        self.assertEqual(json.loads(replay.split("data: ", 1)[1])["events"][0]["version"], 3)
+        self.assertEqual(json.loads(subscribed.split("data: ", 1)[1])["topics"], {"feed": 3})
+
+        event_id, data = live.strip().split("\n")
+        self.assertEqual(decode_cursor_id(event_id.removeprefix("id: ")), {"feed": 4})
+        self.assertEqual(json.loads(data.removeprefix("data: "))["events"][0]["type"], "dua_added")
+
+
+@override_settings(
+    LIVE_EVENTS_COALESCE_MS=0,
+    CHANNEL_LAYERS={"default": {"BACKEND": "charity.layers.DatabaseChannelLayer"}},
+)
+class DatabaseChannelLayerDeliveryTests(TransactionTestCase):
+    def test_committed_event_reaches_a_subscriber_through_the_database_layer(self):
+        subscriber = DatabaseChannelLayer()
+        publish = DatabaseChannelLayer._publish
+        publish_in_transaction = []
+
+        def spy_publish(layer, group, message):
+            # database_sync_to_async يغلق اتصال الخيط إذا وجده داخل معاملة، فيضيع الإرسال على قاعدة حقيقية.
+            publish_in_transaction.append(connection.in_atomic_block)
+            publish(layer, group, message)
+
+        async def subscribe():
+            channel = await subscriber.new_channel()
+            await InMemoryChannelLayer.group_add(subscriber, topic_group_name("feed"), channel)
+            await subscriber.deliver_pending()
+            return channel
+
+        async def receive(channel):
+            await subscriber.deliver_pending()
+            return await subscriber.receive(channel)
+
+        channel = async_to_sync(subscribe)()
+        with patch.object(DatabaseChannelLayer, "_publish", spy_publish):
+            broadcast_live_event("dua_added", {"name": "داع"}, topics=["feed"])
+        message = async_to_sync(receive)(channel)
+
+        self.assertEqual(publish_in_transaction, [False])
+        self.assertEqual([event["event_type"] for event in message["events"]], ["dua_added"])
+        topic = LiveTopic.objects.get(name="feed")
+        self.assertEqual((topic.published_version, topic.publish_after), (topic.last_version, None))
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from .streams import live_events_stream
 from .views import (
     ActivityFeedView,
     CompleteJuzView,
@@ -13,15 +14,20 @@ from .views import (
     RamadanImpactView,
     ReminderView,
     ReserveJuzView,
+    ReserveNextJuzView,
     StatsView,
     TasbeehView,
     TeamJoinView,
     TeamListCreateView,
+    TrendsView,
+    WaitlistView,
 )
 
 urlpatterns = [
     path("current-khatma/", CurrentKhatmaView.as_view(), name="current-khatma"),
     path("reserve/", ReserveJuzView.as_view(), name="reserve-juz"),
+    path("reserve/next/", ReserveNextJuzView.as_view(), name="reserve-next-juz"),
+    path("waitlist/", WaitlistView.as_view(), name="waitlist"),
     path("complete-juz/", CompleteJuzView.as_view(), name="complete-juz"),
     path("stats/", StatsView.as_view(), name="stats"),
     path("tasbeeh/", TasbeehView.as_view(), name="tasbeeh"),
@@ -30,10 +36,12 @@ urlpatterns = [
     path("profile-stats/", ProfileStatsView.as_view(), name="profile-stats"),
     path("khatma-history/", KhatmaHistoryView.as_view(), name="khatma-history"),
     path("daily-wird/", DailyWirdView.as_view(), name="daily-wird"),
+    path("trends/", TrendsView.as_view(), name="trends"),
     path("invite-leaderboard/", InviteLeaderboardView.as_view(), name="invite-leaderboard"),
     path("ramadan-impact/", RamadanImpactView.as_view(), name="ramadan-impact"),
     path("teams/", TeamListCreateView.as_view(), name="teams"),
     path("teams/join/", TeamJoinView.as_view(), name="team-join"),
     path("reminders/", ReminderView.as_view(), name="reminders"),
     path("juz/<int:juz_number>/", JuzContentView.as_view(), name="juz-content"),
+    path("live/stream/", live_events_stream, name="live-stream"),
 ]
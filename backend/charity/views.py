@@ -1,84 +1,108 @@
 from __future__ import annotations
 
 from datetime import timedelta
+from functools import wraps
 
 from django.utils import timezone
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import ActivityEvent, DuaMessage, Juz, Khatma, ParticipantProgress, TasbeehCounter, TeamGroup
-from .realtime import broadcast_live_event
+from .models import ActivityEvent, DuaMessage, Juz, Khatma, ParticipantProgress, TeamGroup, TrendBucket
 from .serializers import (
     ActivityEventSerializer,
     CompleteJuzSerializer,
     DuaMessageSerializer,
     JuzSerializer,
-    KhatmaSerializer,
     ProfileNameSerializer,
+    ReserveNextSerializer,
     ReserveSerializer,
     TeamCreateSerializer,
     TeamJoinSerializer,
     TasbeehCounterSerializer,
     TasbeehIncrementSerializer,
+    WaitlistJoinSerializer,
 )
 from .services import (
+    NoFreeJuzError,
     add_dua_message,
     complete_juz,
     create_team,
+    data_etag,
     ensure_default_tasbeeh_phrases,
     fetch_juz_content,
     get_daily_wird,
     get_invite_leaderboard,
+    get_khatma_snapshot,
     get_khatma_history,
     get_or_create_current_khatma,
     get_pending_reminders,
     get_profile_stats,
     get_ramadan_impact,
+    get_tasbeeh_counters,
     get_teams_leaderboard,
+    get_trends,
+    get_waitlist_status,
     increment_tasbeeh_phrase,
     join_team,
-    release_expired_reservations,
-    reservation_expiry_hours,
+    join_waitlist,
+    leave_waitlist,
     reserve_juz,
+    reserve_next_juz,
 )
 
 
+def conditional_get(*resources: str):
+    """يرد 304 قبل أي استعلام إذا طابق If-None-Match نسخ الموارد التي تعتمد عليها الاستجابة."""
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            etag = data_etag(resources)
+            client_etags = {tag.removeprefix("W/") for tag in parse_etags(request.headers.get("If-None-Match", ""))}
+            if etag in client_etags or "*" in client_etags:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response["ETag"] = etag
+            return response
+
+        return wrapper
+
+    return decorator
+
+
 class CurrentKhatmaView(APIView):
+    @conditional_get("khatma")
     def get(self, request):
-        khatma = get_or_create_current_khatma()
-        expired = release_expired_reservations(khatma=khatma)
-        if expired:
-            broadcast_live_event(
-                "reservation_expired",
-                {"count": len(expired), "khatma_number": khatma.number},
-            )
-
-        serializer = KhatmaSerializer(khatma)
-        reserved_count = Juz.objects.filter(khatma=khatma, reserved_by__isnull=False, completed_at__isnull=True).count()
-        completed_count = Juz.objects.filter(khatma=khatma, completed_at__isnull=False).count()
-        return Response(
-            {
-                "khatma": serializer.data,
-                "reserved_count": reserved_count,
-                "completed_count": completed_count,
-                "total_juz": 30,
-                "reservation_expiry_hours": reservation_expiry_hours(),
-            }
-        )
+        try:
+            number = int(request.query_params["number"])
+        except (KeyError, ValueError):
+            number = None
+        return Response(get_khatma_snapshot(number))
 
 
 class ReserveJuzView(APIView):
+    serializer_class = ReserveSerializer
+
+    def reserve(self, data):
+        return reserve_juz(
+            juz_number=data["juz_number"],
+            name=data["name"],
+            khatma_number=data.get("khatma_number"),
+            ref_code=data.get("ref_code", ""),
+        )
+
     def post(self, request):
-        serializer = ReserveSerializer(data=request.data)
+        serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         try:
-            result = reserve_juz(
-                juz_number=serializer.validated_data["juz_number"],
-                name=serializer.validated_data["name"],
-                ref_code=serializer.validated_data.get("ref_code", ""),
-            )
+            result = self.reserve(serializer.validated_data)
+        except NoFreeJuzError as exc:
+            return Response({"detail": str(exc), "code": exc.code}, status=status.HTTP_400_BAD_REQUEST)
         except ValueError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -88,17 +112,6 @@ class ReserveJuzView(APIView):
             ref_code=serializer.validated_data.get("ref_code", ""),
         )
 
-        broadcast_live_event(
-            "khatma_reserved",
-            {
-                "khatma_number": result["current_khatma"].number,
-                "juz_number": result["reserved_juz"].juz_number,
-                "reserved_by": result["reserved_juz"].reserved_by,
-                "reservation_expires_at": result["reserved_juz"].reservation_expires_at.isoformat()
-                if result["reserved_juz"].reservation_expires_at
-                else None,
-            },
-        )
         return Response(
             {
                 "detail": "تم حجز الجزء بنجاح.",
@@ -112,6 +125,51 @@ class ReserveJuzView(APIView):
         )
 
 
+class ReserveNextJuzView(ReserveJuzView):
+    serializer_class = ReserveNextSerializer
+
+    def reserve(self, data):
+        return reserve_next_juz(
+            name=data["name"],
+            preferred_juz=data.get("juz_number"),
+            khatma_number=data.get("khatma_number"),
+            ref_code=data.get("ref_code", ""),
+        )
+
+
+class WaitlistView(APIView):
+    """بدل أن يستطلع العميل الشبكة الممتلئة: يسجل في الطابور مرة ويصله حدث waitlist_assigned عند الحجز."""
+
+    def get(self, request):
+        serializer = ProfileNameSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = get_waitlist_status(serializer.validated_data["name"])
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+    def post(self, request):
+        serializer = WaitlistJoinSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = join_waitlist(
+                serializer.validated_data["name"],
+                juz_number=serializer.validated_data.get("juz_number"),
+                ref_code=serializer.validated_data.get("ref_code", ""),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        serializer = ProfileNameSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        if not leave_waitlist(serializer.validated_data["name"]):
+            return Response({"detail": "لست في طابور الانتظار."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class CompleteJuzView(APIView):
     def post(self, request):
         serializer = CompleteJuzSerializer(data=request.data)
@@ -121,6 +179,7 @@ class CompleteJuzView(APIView):
             result = complete_juz(
                 juz_number=serializer.validated_data["juz_number"],
                 name=serializer.validated_data["name"],
+                khatma_number=serializer.validated_data.get("khatma_number"),
                 ref_code=serializer.validated_data.get("ref_code", ""),
             )
         except ValueError as exc:
@@ -132,17 +191,6 @@ class CompleteJuzView(APIView):
             ref_code=serializer.validated_data.get("ref_code", ""),
         )
 
-        broadcast_live_event(
-            "juz_completed",
-            {
-                "khatma_number": result["current_khatma"].number,
-                "juz_number": result["completed_juz"].juz_number,
-                "completed_by": result["completed_juz"].completed_by,
-                "khatma_completed_now": result["khatma_completed_now"],
-                "next_khatma_number": result["next_khatma_number"],
-            },
-        )
-
         return Response(
             {
                 "detail": "تم تسجيل الجزء كمكتمل. جزاكم الله خيرًا.",
@@ -157,17 +205,16 @@ class CompleteJuzView(APIView):
 
 
 class StatsView(APIView):
+    @conditional_get("khatma", "participants", "teams")
     def get(self, request):
         current = get_or_create_current_khatma()
-        release_expired_reservations(khatma=current)
         now = timezone.now()
         total_completed = Khatma.objects.filter(is_completed=True).count()
         reserved_count = Juz.objects.filter(khatma=current, reserved_by__isnull=False, completed_at__isnull=True).count()
-        completed_count = Juz.objects.filter(khatma=current, completed_at__isnull=False).count()
+        # نفس مقياس اللوحة الأصلي: الأشخاص المختلفون على الأجزاء، بمفتاح المشارك بدل نص الاسم.
         total_participants = (
-            Juz.objects.exclude(reserved_by__isnull=True)
-            .exclude(reserved_by="")
-            .values("reserved_by")
+            Juz.objects.filter(reserved_by_participant__isnull=False)
+            .values("reserved_by_participant")
             .distinct()
             .count()
         )
@@ -185,7 +232,7 @@ class StatsView(APIView):
                 "total_completed_khatmas": total_completed,
                 "current_khatma_number": current.number,
                 "reserved_count": reserved_count,
-                "completed_count": completed_count,
+                "completed_count": current.completed_count,
                 "total_participants": total_participants,
                 "due_soon_count": due_soon_count,
                 "total_referred_participants": total_referred_participants,
@@ -195,10 +242,10 @@ class StatsView(APIView):
 
 
 class TasbeehView(APIView):
+    @conditional_get("tasbeeh")
     def get(self, request):
         ensure_default_tasbeeh_phrases()
-        counters = TasbeehCounter.objects.all()
-        serializer = TasbeehCounterSerializer(counters, many=True)
+        serializer = TasbeehCounterSerializer(get_tasbeeh_counters(), many=True)
         return Response(serializer.data)
 
     def post(self, request):
@@ -207,26 +254,21 @@ class TasbeehView(APIView):
         serializer.is_valid(raise_exception=True)
 
         try:
-            counter = increment_tasbeeh_phrase(
+            result = increment_tasbeeh_phrase(
                 phrase=serializer.validated_data["phrase"],
+                count=serializer.validated_data.get("count", 1),
                 name=serializer.validated_data.get("name", ""),
                 ref_code=serializer.validated_data.get("ref_code", ""),
             )
         except ValueError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        output = TasbeehCounterSerializer(counter)
-        broadcast_live_event(
-            "tasbeeh_incremented",
-            {
-                "phrase": counter.phrase,
-                "count": counter.count,
-            },
-        )
+        output = TasbeehCounterSerializer(result["counter"])
         return Response(output.data, status=status.HTTP_200_OK)
 
 
 class ActivityFeedView(APIView):
+    @conditional_get("activity")
     def get(self, request):
         try:
             limit = int(request.query_params.get("limit", 30))
@@ -239,6 +281,7 @@ class ActivityFeedView(APIView):
 
 
 class DuaWallView(APIView):
+    @conditional_get("dua")
     def get(self, request):
         messages = DuaMessage.objects.filter(is_approved=True)[:80]
         serializer = DuaMessageSerializer(messages, many=True)
@@ -249,7 +292,7 @@ class DuaWallView(APIView):
         serializer.is_valid(raise_exception=True)
 
         try:
-            dua = add_dua_message(
+            result = add_dua_message(
                 name=serializer.validated_data["name"],
                 content=serializer.validated_data["content"],
                 ref_code=serializer.validated_data.get("ref_code", ""),
@@ -257,15 +300,7 @@ class DuaWallView(APIView):
         except ValueError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        broadcast_live_event(
-            "dua_added",
-            {
-                "name": dua.name,
-                "content": dua.content,
-                "created_at": dua.created_at.isoformat(),
-            },
-        )
-        return Response(DuaMessageSerializer(dua).data, status=status.HTTP_201_CREATED)
+        return Response(DuaMessageSerializer(result["dua"]).data, status=status.HTTP_201_CREATED)
 
 
 class ProfileStatsView(APIView):
@@ -283,22 +318,46 @@ class ProfileStatsView(APIView):
 
 
 class KhatmaHistoryView(APIView):
+    @conditional_get("khatma")
     def get(self, request):
         try:
             limit = int(request.query_params.get("limit", 20))
         except ValueError:
             limit = 20
         limit = min(max(limit, 1), 100)
-        history = get_khatma_history(limit=limit)
+        try:
+            before = int(request.query_params["before"])
+        except (KeyError, ValueError):
+            before = None
+        history = get_khatma_history(limit=limit, before=before)
         return Response(history)
 
 
+class TrendsView(APIView):
+    def get(self, request):
+        resolution = request.query_params.get("resolution", TrendBucket.MINUTE)
+        if resolution not in {TrendBucket.MINUTE, TrendBucket.HOUR}:
+            return Response({"detail": "الدقة يجب أن تكون minute أو hour."}, status=status.HTTP_400_BAD_REQUEST)
+
+        available = [metric for metric, _ in TrendBucket.METRIC_CHOICES]
+        requested = [item for item in request.query_params.get("metrics", "").split(",") if item]
+        metrics = [metric for metric in requested if metric in available] or available
+
+        default_buckets = 60 if resolution == TrendBucket.MINUTE else 48
+        try:
+            buckets = int(request.query_params.get("buckets", default_buckets))
+        except ValueError:
+            buckets = default_buckets
+        return Response(get_trends(metrics=metrics, resolution=resolution, buckets=buckets))
+
+
 class DailyWirdView(APIView):
     def get(self, request):
         return Response(get_daily_wird())
 
 
 class InviteLeaderboardView(APIView):
+    @conditional_get("participants")
     def get(self, request):
         try:
             limit = int(request.query_params.get("limit", 20))
@@ -309,6 +368,7 @@ class InviteLeaderboardView(APIView):
 
 
 class RamadanImpactView(APIView):
+    @conditional_get("khatma", "participants", "teams")
     def get(self, request):
         try:
             inviters_limit = int(request.query_params.get("inviters_limit", 10))
@@ -325,6 +385,7 @@ class RamadanImpactView(APIView):
 
 
 class TeamListCreateView(APIView):
+    @conditional_get("participants", "teams")
     def get(self, request):
         try:
             limit = int(request.query_params.get("limit", 20))
@@ -347,10 +408,6 @@ class TeamListCreateView(APIView):
         except ValueError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        broadcast_live_event(
-            "team_created",
-            {"name": team["name"], "code": team["code"], "members_count": team["members_count"]},
-        )
         return Response(team, status=status.HTTP_201_CREATED)
 
 
@@ -368,10 +425,6 @@ class TeamJoinView(APIView):
         except ValueError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        broadcast_live_event(
-            "team_joined",
-            {"name": team["name"], "code": team["code"], "members_count": team["members_count"]},
-        )
         return Response(team, status=status.HTTP_200_OK)
 
 
@@ -6,6 +6,8 @@ import importlib.util
 import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -147,6 +149,8 @@ REST_FRAMEWORK = {
 
 CORS_ALLOW_ALL_ORIGINS = env_bool("CORS_ALLOW_ALL", True)
 CORS_ALLOWED_ORIGINS = env_list("CORS_ALLOWED_ORIGINS")
+CORS_ALLOW_HEADERS = (*default_headers, "if-none-match")
+CORS_EXPOSE_HEADERS = ["ETag"]
 
 CSRF_TRUSTED_ORIGINS = env_list("CSRF_TRUSTED_ORIGINS")
 for host in ALLOWED_HOSTS:
@@ -164,9 +168,59 @@ if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
     SECURE_CONTENT_TYPE_NOSNIFF = True
 
+# memory: عملية واحدة فقط. database: عدة عمليات daphne/gunicorn على نفس الخادم عبر قاعدة البيانات.
+CHANNEL_LAYER_BACKENDS = {
+    "memory": "channels.layers.InMemoryChannelLayer",
+    "database": "charity.layers.DatabaseChannelLayer",
+}
+CHANNEL_LAYER = os.getenv("CHANNEL_LAYER", "memory").strip().lower()
+
+# نافذة تجميع أحداث البث بالمللي ثانية (0 = إرسال فوري داخل الطلب).
+LIVE_EVENTS_COALESCE_MS = int(os.getenv("LIVE_EVENTS_COALESCE_MS", "250"))
+# عملية الخادم تقرأ صندوق الصادر دوريًا لتبث أحداث منظف الحجوزات الذي يعمل في عملية مستقلة.
+LIVE_OUTBOX_POLL_MS = int(os.getenv("LIVE_OUTBOX_POLL_MS", "1000"))
+
+# الذاكرة المؤقتة محلية لكل عملية افتراضيًا؛ عند تشغيل عدة عمليات يُفضل خادم مشترك
+# (مثل django.core.cache.backends.redis.RedisCache) حتى تصل أرقام النسخ لكل العمليات.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+# أقصى عمر للقطة الختمة الحالية بالثواني؛ تُبطل فورًا عند أي حجز أو إتمام أو انتهاء مهلة.
+KHATMA_SNAPSHOT_CACHE_SECONDS = int(os.getenv("KHATMA_SNAPSHOT_CACHE_SECONDS", "10"))
+
+# أقصى عدد ختمات مفتوحة في وقت واحد؛ ختمة موازية تُفتح فقط عندما تمتلئ كل الختمات المفتوحة.
+KHATMA_POOL_SIZE = max(1, int(os.getenv("KHATMA_POOL_SIZE", "3")))
+
+# عدد الختمات الاحتياطية التي ينشئها منظف الحجوزات مسبقًا حتى لا يُنشأ شيء داخل طلب الإتمام الأخير.
+KHATMA_STANDBY_COUNT = max(0, int(os.getenv("KHATMA_STANDBY_COUNT", "1")))
+
+# أقصى عمر لوسم ETag بالثواني حتى لو لم تتغير النسخ (يحد من وسم قديم إذا لم تكن الذاكرة المؤقتة مشتركة).
+ETAG_MAX_AGE_SECONDS = int(os.getenv("ETAG_MAX_AGE_SECONDS", "60"))
+
+# عدد شرائح كل عداد ذكر، ومدة تخزين مجموعها مؤقتًا بالثواني.
+TASBEEH_COUNTER_STRIPES = max(1, int(os.getenv("TASBEEH_COUNTER_STRIPES", "8")))
+TASBEEH_TOTALS_CACHE_SECONDS = int(os.getenv("TASBEEH_TOTALS_CACHE_SECONDS", "2"))
+
+# وضع الكتابة المؤجلة للتسبيح (اختياري): الزيادات تتجمع في ذاكرة العملية وتُكتب دفعة واحدة
+# كل TASBEEH_FLUSH_INTERVAL_MS أو عند بلوغ TASBEEH_FLUSH_BATCH زيادة.
+TASBEEH_WRITE_BEHIND = env_bool("TASBEEH_WRITE_BEHIND", False)
+TASBEEH_FLUSH_INTERVAL_MS = int(os.getenv("TASBEEH_FLUSH_INTERVAL_MS", "1000"))
+TASBEEH_FLUSH_BATCH = max(1, int(os.getenv("TASBEEH_FLUSH_BATCH", "200")))
+
+# نشاطات التسبيح لنفس (المشارك، الذكر) تُدمج في صف واحد داخل هذه النافذة بالدقائق (0 = صف لكل طلب).
+TASBEEH_ACTIVITY_ROLLUP_MINUTES = int(os.getenv("TASBEEH_ACTIVITY_ROLLUP_MINUTES", "10"))
+
 if HAS_CHANNELS:
     CHANNEL_LAYERS = {
         "default": {
-            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "BACKEND": CHANNEL_LAYER_BACKENDS.get(CHANNEL_LAYER, CHANNEL_LAYER_BACKENDS["memory"]),
         }
     }
+    if CHANNEL_LAYER == "database":
+        CHANNEL_LAYERS["default"]["CONFIG"] = {
+            "poll_interval": int(os.getenv("CHANNEL_LAYER_POLL_MS", "250")) / 1000,
+            "visibility_grace": int(os.getenv("CHANNEL_LAYER_VISIBILITY_GRACE_MS", "5000")) / 1000,
+        }
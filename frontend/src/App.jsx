@@ -1,4 +1,4 @@
-import { useCallback, useEffect, useMemo, useState } from "react";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import ActivityFeedSection from "./components/ActivityFeedSection";
 import DailyWirdSection from "./components/DailyWirdSection";
 import DeveloperFooter from "./components/DeveloperFooter";
@@ -35,8 +35,10 @@ import {
   getTeams,
   incrementTasbeeh,
   joinTeam,
+  joinWaitlist,
   parseApiError,
-  reserveJuz
+  reserveJuz,
+  reserveNextJuz
 } from "./services/api";
 
 const POLL_INTERVAL_MS = 10000;
@@ -44,24 +46,50 @@ const WS_RETRY_BASE_MS = 2500;
 const WS_RETRY_MAX_MS = 30000;
 const WS_MAX_RETRIES = 20;
 const REMINDER_INTERVAL_MS = 60000;
+const ACTIVITY_FEED_LIMIT = 35;
+const DUA_WALL_LIMIT = 80;
+const LIVE_BASE_TOPICS = ["khatma:current", "tasbeeh", "feed", "teams"];
 const NOTIFICATIONS_STORAGE_KEY = "sadaqah_notifications_enabled";
 const NOTIFIED_REMINDERS_KEY = "sadaqah_notified_reminders";
 const REF_CODE_STORAGE_KEY = "sadaqah_ref_code";
 
-function buildLiveWebSocketUrl() {
+function buildLiveWebSocketUrl(topics, cursors) {
   const explicit = import.meta.env.VITE_WS_BASE_URL;
-  if (explicit) {
-    return explicit;
+  const parsed = new URL(explicit || API_BASE_URL);
+  if (!explicit) {
+    parsed.protocol = parsed.protocol === "https:" ? "wss:" : "ws:";
+    parsed.pathname = "/ws/live/";
   }
-
-  const parsed = new URL(API_BASE_URL);
-  parsed.protocol = parsed.protocol === "https:" ? "wss:" : "ws:";
-  parsed.pathname = "/ws/live/";
   parsed.search = "";
   parsed.hash = "";
+  parsed.searchParams.set("topics", topics.join(","));
+  // آخر نسخة طبقناها لكل موضوع، ليعيد الخادم الأحداث الفائتة فقط بعد إعادة الاتصال.
+  if (Object.keys(cursors).length) {
+    parsed.searchParams.set("since", JSON.stringify(cursors));
+  }
   return parsed.toString();
 }
 
+// بديل Server-Sent Events لمن يمنع وكيلهم WebSocket؛ نفس الإطارات ونفس مؤشرات الاستئناف.
+function buildLiveStreamUrl(topics, cursors) {
+  const parsed = new URL(`${API_BASE_URL.replace(/\/$/, "")}/live/stream/`);
+  parsed.searchParams.set("topics", topics.join(","));
+  if (Object.keys(cursors).length) {
+    parsed.searchParams.set("since", JSON.stringify(cursors));
+  }
+  return parsed.toString();
+}
+
+function liveTopicsFor(participantName) {
+  const safeName = (participantName || "").trim();
+  return safeName ? [...LIVE_BASE_TOPICS, `participant:${safeName.toLowerCase()}`] : LIVE_BASE_TOPICS;
+}
+
+function mergeById(items, incoming, limit) {
+  const incomingIds = new Set(incoming.map((item) => item.id));
+  return [...incoming, ...items.filter((item) => !incomingIds.has(item.id))].slice(0, limit);
+}
+
 function readStorageBool(key, defaultValue = false) {
   try {
     const value = localStorage.getItem(key);
@@ -323,6 +351,9 @@ function downloadCertificateCard(profile) {
 
 export default function App() {
   const [khatma, setKhatma] = useState(null);
+  const [activeKhatmas, setActiveKhatmas] = useState([]);
+  // الختمة التي اختارها المستخدم من المجمع؛ null تعني ما يقترحه الخادم.
+  const selectedKhatmaRef = useRef(null);
   const [stats, setStats] = useState({});
   const [tasbeehCounters, setTasbeehCounters] = useState([]);
   const [activityEvents, setActivityEvents] = useState([]);
@@ -412,10 +443,10 @@ export default function App() {
         teamsRes,
         impactRes
       ] = await Promise.all([
-        getCurrentKhatma(),
+        getCurrentKhatma(selectedKhatmaRef.current),
         getStats(),
         getTasbeeh(),
-        getActivityFeed(35),
+        getActivityFeed(ACTIVITY_FEED_LIMIT),
         getDuaWall(),
         getKhatmaHistory(24),
         getDailyWird(),
@@ -425,6 +456,11 @@ export default function App() {
       ]);
 
       setKhatma(khatmaRes.khatma);
+      setActiveKhatmas(khatmaRes.active_khatmas || []);
+      if (selectedKhatmaRef.current !== khatmaRes.khatma.number) {
+        // الختمة المختارة اكتملت فعاد الخادم إلى الختمة الحالية.
+        selectedKhatmaRef.current = null;
+      }
       setStats(statsRes);
       setTasbeehCounters(tasbeehRes);
       setActivityEvents(activityRes);
@@ -444,6 +480,119 @@ export default function App() {
     }
   }, []);
 
+  const khatmaRef = useRef(null);
+  const liveSocketRef = useRef(null);
+  const liveStreamReconnectRef = useRef(null);
+  // رقم آخر نسخة مطبقة لكل موضوع مشترك فيه.
+  const liveVersionsRef = useRef({});
+
+  useEffect(() => {
+    khatmaRef.current = khatma;
+  }, [khatma]);
+
+  // يطبق فروقات البث مباشرة، ويعيد false عندما يلزم تحميل كامل (مثل بدء ختمة جديدة).
+  const applyLiveDelta = useCallback((message) => {
+    const payload = message.payload || {};
+
+    switch (message.type) {
+      case "activity_added": {
+        if (!Array.isArray(payload.activity)) {
+          return false;
+        }
+        setActivityEvents((prev) => mergeById(prev, [...payload.activity].reverse(), ACTIVITY_FEED_LIMIT));
+        return true;
+      }
+      case "khatma_reserved":
+      case "juz_completed":
+      case "reservation_expired": {
+        if (payload.khatma_completed_now || !Array.isArray(payload.ajzaa)) {
+          return false;
+        }
+        if (khatmaRef.current?.number !== payload.khatma_number) {
+          return false;
+        }
+        const changed = new Map(payload.ajzaa.map((juz) => [juz.juz_number, juz]));
+        setKhatma((prev) =>
+          prev ? { ...prev, ajzaa: prev.ajzaa.map((juz) => changed.get(juz.juz_number) || juz) } : prev
+        );
+        setStats((prev) =>
+          prev.current_khatma_number === payload.khatma_number ? { ...prev, ...payload.counts } : prev
+        );
+        return true;
+      }
+      case "waitlist_assigned": {
+        // حجز الخادم جزءًا لمنتظر؛ نعلمه ونعيد التحميل لتظهر الختمة التي فيها الجزء.
+        setLastReserved({
+          juz_number: payload.juz_number,
+          khatma_number: payload.khatma_number,
+          reservation_expires_at: payload.reservation_expires_at
+        });
+        setErrorMessage("");
+        setSuccessMessage(`تحرر جزء لك من طابور الانتظار: تم حجز الجزء ${payload.juz_number} باسمك.`);
+        return false;
+      }
+      case "tasbeeh_incremented": {
+        const updated = payload.counter;
+        if (!updated) {
+          return false;
+        }
+        setTasbeehCounters((prev) =>
+          prev.some((counter) => counter.id === updated.id)
+            ? prev.map((counter) => (counter.id === updated.id ? updated : counter))
+            : [...prev, updated]
+        );
+        return true;
+      }
+      case "dua_added": {
+        if (!payload.dua) {
+          return false;
+        }
+        setDuaMessages((prev) => mergeById(prev, [payload.dua], DUA_WALL_LIMIT));
+        return true;
+      }
+      case "team_created":
+      case "team_joined": {
+        getTeams(15)
+          .then(setTeamLeaderboard)
+          .catch(() => {});
+        return true;
+      }
+      default:
+        return false;
+    }
+  }, []);
+
+  // يطبق لقطة موضوع يرسلها الخادم عندما تكون الفجوة أكبر من مخزن الإعادة.
+  const applyLiveSnapshot = useCallback((topic, data) => {
+    if (!data) {
+      return false;
+    }
+    if (topic.startsWith("khatma:")) {
+      if (khatmaRef.current && khatmaRef.current.number !== data.khatma.number) {
+        return false;
+      }
+      setKhatma(data.khatma);
+      setStats((prev) =>
+        prev.current_khatma_number === data.khatma.number ? { ...prev, ...data.counts } : prev
+      );
+      return true;
+    }
+    switch (topic) {
+      case "tasbeeh":
+        setTasbeehCounters(data.counters);
+        return true;
+      case "feed":
+        setActivityEvents(data.activity);
+        setDuaMessages(data.duas);
+        return true;
+      case "teams":
+        setTeamLeaderboard(data.teams);
+        return true;
+      default:
+        return topic.startsWith("team:");
+    }
+  }, []);
+
   const checkRemindersAndNotify = useCallback(
     async (participantName, options = {}) => {
       const { silent = true } = options;
@@ -499,9 +648,16 @@ export default function App() {
 
   useEffect(() => {
     loadData();
+  }, [loadData]);
+
+  // الاستطلاع الدوري احتياطي فقط عندما لا يوجد اتصال مباشر (WebSocket أو SSE).
+  useEffect(() => {
+    if (liveConnected) {
+      return undefined;
+    }
     const interval = setInterval(() => loadData(true), POLL_INTERVAL_MS);
     return () => clearInterval(interval);
-  }, [loadData]);
+  }, [liveConnected, loadData]);
 
   useEffect(() => {
     const handler = setTimeout(() => {
@@ -512,13 +668,108 @@ export default function App() {
 
   useEffect(() => {
     let socket = null;
+    let stream = null;
     let retryTimer = null;
     let stopped = false;
     let retryCount = 0;
+    let socketOpened = false;
+    const topics = liveTopicsFor(name);
+
+    liveVersionsRef.current = Object.fromEntries(
+      Object.entries(liveVersionsRef.current).filter(
+        ([topic]) => topic.startsWith("khatma:") || topics.includes(topic)
+      )
+    );
+
+    const handleLiveMessage = async (rawData) => {
+      let message;
+      try {
+        message = JSON.parse(rawData);
+      } catch {
+        return;
+      }
+
+      const cursors = liveVersionsRef.current;
+
+      if (message.type === "subscribed") {
+        let missedEvents = false;
+        for (const [topic, rawVersion] of Object.entries(message.topics || {})) {
+          const version = Number(rawVersion) || 0;
+          // الخادم أرسل الفائت أو لقطة قبل هذه الرسالة؛ تبقى فجوة فقط إن لم يغطها.
+          missedEvents = missedEvents || (topic in cursors && cursors[topic] < version);
+          cursors[topic] = Math.max(cursors[topic] ?? 0, version);
+        }
+        if (missedEvents) {
+          await loadData(true);
+        }
+        return;
+      }
+
+      if (message.type === "snapshot" && message.topic) {
+        cursors[message.topic] = Number(message.version) || 0;
+        if (message.topic.startsWith("participant:")) {
+          await loadProfileData(name);
+        } else if (!applyLiveSnapshot(message.topic, message.data)) {
+          await loadData(true);
+        }
+        return;
+      }
+
+      if (message.type === "unsubscribed") {
+        for (const topic of message.topics || []) {
+          delete cursors[topic];
+        }
+        return;
+      }
+
+      if (message.type !== "batch" || !message.topic) {
+        return;
+      }
+
+      // الخادم يجمع أحداث النافذة الزمنية لكل موضوع في إطار واحد من نوع batch.
+      const topic = message.topic;
+      let needsReload = false;
+      let appliedAny = false;
+
+      for (const liveEvent of message.events || []) {
+        const version = Number(liveEvent.version) || 0;
+        const knownVersion = cursors[topic];
+        if (knownVersion !== undefined && version <= knownVersion) {
+          continue;
+        }
+        cursors[topic] = version;
+        appliedAny = true;
+
+        const inSequence = knownVersion !== undefined && version === knownVersion + 1;
+        if (!inSequence || !applyLiveDelta(liveEvent)) {
+          needsReload = true;
+        }
+      }
+
+      if (needsReload) {
+        await loadData(true);
+      }
+      if (appliedAny && topic.startsWith("participant:")) {
+        await loadProfileData(name);
+      }
+    };
+
+    const connectStream = () => {
+      if (stream) {
+        stream.close();
+      }
+      // EventSource يعيد الاتصال تلقائيًا ويرسل Last-Event-ID بمؤشرات كل موضوع.
+      stream = new EventSource(buildLiveStreamUrl(topics, liveVersionsRef.current));
+      stream.onopen = () => setLiveConnected(true);
+      stream.onerror = () => setLiveConnected(false);
+      stream.onmessage = (event) => handleLiveMessage(event.data);
+      liveStreamReconnectRef.current = connectStream;
+    };
 
     const connect = () => {
       try {
-        socket = new WebSocket(buildLiveWebSocketUrl());
+        socket = new WebSocket(buildLiveWebSocketUrl(topics, liveVersionsRef.current));
+        liveSocketRef.current = socket;
       } catch {
         retryTimer = setTimeout(connect, WS_RETRY_BASE_MS);
         return;
@@ -526,15 +777,11 @@ export default function App() {
 
       socket.onopen = () => {
         setLiveConnected(true);
+        socketOpened = true;
         retryCount = 0;
       };
 
-      socket.onmessage = async () => {
-        await loadData(true);
-        if (name.trim()) {
-          await loadProfileData(name);
-        }
-      };
+      socket.onmessage = (event) => handleLiveMessage(event.data);
 
       socket.onerror = () => {
         socket?.close();
@@ -542,7 +789,15 @@ export default function App() {
 
       socket.onclose = () => {
         setLiveConnected(false);
+        if (liveSocketRef.current === socket) {
+          liveSocketRef.current = null;
+        }
         if (!stopped) {
+          // الوكيل يغلق WebSocket قبل أن يفتح أصلًا: ننتقل إلى SSE بدل الاستطلاع.
+          if (!socketOpened && retryCount >= 1 && typeof EventSource !== "undefined") {
+            connectStream();
+            return;
+          }
           if (retryCount >= WS_MAX_RETRIES) {
             return;
           }
@@ -561,11 +816,36 @@ export default function App() {
       if (retryTimer) {
         clearTimeout(retryTimer);
       }
+      liveStreamReconnectRef.current = null;
+      if (stream) {
+        stream.close();
+      }
       if (socket && (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING)) {
         socket.close();
       }
     };
-  }, [loadData, loadProfileData, name]);
+  }, [applyLiveDelta, applyLiveSnapshot, loadData, loadProfileData, name]);
+
+  // عند بدء ختمة جديدة ننقل الاشتراك إلى موضوعها دون إعادة فتح الاتصال.
+  const khatmaNumber = khatma?.number;
+  useEffect(() => {
+    const socket = liveSocketRef.current;
+    const topic = `khatma:${khatmaNumber}`;
+    const subscribed = Object.keys(liveVersionsRef.current);
+    if (!khatmaNumber || subscribed.includes(topic)) {
+      return;
+    }
+    if (!socket || socket.readyState !== WebSocket.OPEN) {
+      // اتصال SSE لا يقبل تعديل المواضيع، فنعيد فتحه ليحل khatma:current من جديد.
+      liveStreamReconnectRef.current?.();
+      return;
+    }
+    const stale = subscribed.filter((item) => item.startsWith("khatma:"));
+    if (stale.length) {
+      socket.send(JSON.stringify({ action: "unsubscribe", topics: stale }));
+    }
+    socket.send(JSON.stringify({ action: "subscribe", topics: [topic] }));
+  }, [khatmaNumber]);
 
   useEffect(() => {
     writeStorageBool(NOTIFICATIONS_STORAGE_KEY, notificationEnabled);
@@ -585,7 +865,8 @@ export default function App() {
     return () => clearInterval(interval);
   }, [checkRemindersAndNotify, notificationEnabled, name]);
 
-  const handleReserve = async (juzNumber) => {
+  // juzNumber = null مع auto يطلب من الخادم حجز أي جزء متاح في طلب واحد.
+  const handleReserve = async (juzNumber, { auto = false } = {}) => {
     const trimmedName = name.trim();
     if (!trimmedName) {
       setErrorMessage("يرجى إدخال الاسم قبل حجز الجزء.");
@@ -593,11 +874,17 @@ export default function App() {
       return;
     }
 
-    setReserveLoadingJuz(juzNumber);
+    setReserveLoadingJuz(auto ? "next" : juzNumber);
     setErrorMessage("");
 
     try {
-      const response = await reserveJuz({ juz_number: juzNumber, name: trimmedName, ref_code: refCode });
+      const request = auto ? reserveNextJuz : reserveJuz;
+      const response = await request({
+        juz_number: juzNumber,
+        name: trimmedName,
+        ref_code: refCode,
+        khatma_number: selectedKhatmaRef.current
+      });
       setLastReserved({
         ...response.reserved_juz,
         khatma_number: response.khatma_number
@@ -609,6 +896,25 @@ export default function App() {
       await loadProfileData(trimmedName);
       await checkRemindersAndNotify(trimmedName, { silent: true });
     } catch (error) {
+      if (auto && error?.response?.data?.code === "no_free_juz") {
+        // لا أجزاء متاحة: ننضم لطابور الانتظار مرة واحدة بدل الاستطلاع، ويصلنا waitlist_assigned عند الحجز.
+        // أي 400 آخر (اسم غير صالح مثلًا) يُعرض كخطأ عادي.
+        try {
+          const waitlist = await joinWaitlist({ name: trimmedName, ref_code: refCode });
+          setErrorMessage("");
+          setSuccessMessage(
+            waitlist.status === "assigned"
+              ? `تم حجز الجزء ${waitlist.juz_number} باسمك.`
+              : `لا توجد أجزاء متاحة الآن، أنت رقم ${waitlist.position} في طابور الانتظار.`
+          );
+          if (waitlist.status === "assigned") {
+            await loadData(true);
+          }
+          return;
+        } catch (waitlistError) {
+          error = waitlistError;
+        }
+      }
       setSuccessMessage("");
       setErrorMessage(parseApiError(error));
     } finally {
@@ -627,7 +933,12 @@ export default function App() {
     setCompleteLoadingJuz(juzNumber);
     setErrorMessage("");
     try {
-      const response = await completeJuz({ juz_number: juzNumber, name: trimmedName, ref_code: refCode });
+      const response = await completeJuz({
+        juz_number: juzNumber,
+        name: trimmedName,
+        ref_code: refCode,
+        khatma_number: khatma?.number
+      });
       setLastCompleted({
         ...response.completed_juz,
         khatma_number: response.khatma_number
@@ -653,11 +964,11 @@ export default function App() {
     }
   };
 
-  const handleTasbeehIncrement = async (phrase) => {
+  const handleTasbeehIncrement = async (phrase, count = 1) => {
     setActiveTasbeehPhrase(phrase);
 
     try {
-      const updatedCounter = await incrementTasbeeh({ phrase, name: name.trim(), ref_code: refCode });
+      const updatedCounter = await incrementTasbeeh({ phrase, count, name: name.trim(), ref_code: refCode });
       setTasbeehCounters((prev) =>
         prev.map((counter) => (counter.id === updatedCounter.id ? updatedCounter : counter))
       );
@@ -921,6 +1232,16 @@ export default function App() {
     }
   };
 
+  const handleSelectKhatma = (number) => {
+    selectedKhatmaRef.current = number;
+    getCurrentKhatma(number)
+      .then((data) => {
+        setKhatma(data.khatma);
+        setActiveKhatmas(data.active_khatmas || []);
+      })
+      .catch((error) => setErrorMessage(parseApiError(error)));
+  };
+
   const sortedAjzaa = useMemo(() => {
     return [...(khatma?.ajzaa || [])].sort((a, b) => a.juz_number - b.juz_number);
   }, [khatma]);
@@ -1091,10 +1412,14 @@ export default function App() {
                 ajzaa={sortedAjzaa}
                 participantName={name}
                 onReserve={handleReserve}
+                onReserveNext={() => handleReserve(null, { auto: true })}
                 onComplete={handleComplete}
                 onOpenReader={setSelectedJuzForReading}
                 reserveLoadingJuz={reserveLoadingJuz}
                 completeLoadingJuz={completeLoadingJuz}
+                khatmaNumber={khatma?.number}
+                activeKhatmas={activeKhatmas}
+                onSelectKhatma={handleSelectKhatma}
               />
               <ActivityFeedSection events={activityEvents} />
             </div>
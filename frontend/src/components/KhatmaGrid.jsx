@@ -125,10 +125,14 @@ export default function KhatmaGrid({
   ajzaa,
   participantName,
   onReserve,
+  onReserveNext,
   onComplete,
   onOpenReader,
   reserveLoadingJuz,
-  completeLoadingJuz
+  completeLoadingJuz,
+  khatmaNumber,
+  activeKhatmas = [],
+  onSelectKhatma
 }) {
   return (
     <section className="space-y-4">
@@ -137,9 +141,38 @@ export default function KhatmaGrid({
           أجزاء الختمة الحالية
           <span className="absolute -bottom-1 right-0 h-[2px] w-20 rounded-full bg-goldLight/70" />
         </h2>
-        <p className="text-sm text-slate-300">حجز، ثم قراءة، ثم اضغط تم الإنجاز</p>
+        <div className="flex flex-wrap items-center gap-2">
+          <p className="text-sm text-slate-300">حجز، ثم قراءة، ثم اضغط تم الإنجاز</p>
+          <button
+            type="button"
+            onClick={onReserveNext}
+            disabled={reserveLoadingJuz === "next"}
+            className="rounded-full border border-goldLight/50 bg-goldLight/15 px-3 py-1 text-xs font-bold text-goldSoft transition hover:bg-goldLight/25 disabled:opacity-60"
+          >
+            {reserveLoadingJuz === "next" ? "جارٍ الحجز..." : "احجز لي أي جزء متاح"}
+          </button>
+        </div>
       </div>
 
+      {activeKhatmas.length > 1 ? (
+        <div className="flex flex-wrap gap-2">
+          {activeKhatmas.map((item) => (
+            <button
+              key={item.number}
+              type="button"
+              onClick={() => onSelectKhatma(item.number)}
+              className={`rounded-full border px-3 py-1 text-xs font-bold transition ${
+                item.number === khatmaNumber
+                  ? "border-goldLight bg-goldLight/25 text-goldSoft"
+                  : "border-goldLight/30 bg-emeraldNight/60 text-slate-200 hover:border-goldLight/60"
+              }`}
+            >
+              الختمة {item.number} · متاح {item.free_count}
+            </button>
+          ))}
+        </div>
+      ) : null}
+
       <div className="grid grid-cols-2 gap-2.5 sm:grid-cols-3 sm:gap-3 lg:grid-cols-5">
         {ajzaa.map((juz) => (
           <JuzCard
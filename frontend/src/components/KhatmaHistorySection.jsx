@@ -33,6 +33,11 @@ export default function KhatmaHistorySection({ history }) {
               <p className="mt-1 text-xs text-slate-300">اكتملت في: {formatDateTime(item.completed_at)}</p>
               <p className="mt-1 text-sm text-slate-100">الأجزاء المكتملة: {item.completed_juz_count} / 30</p>
               <p className="text-sm text-slate-100">عدد المتمّين: {item.participants_count}</p>
+              {item.top_readers?.length ? (
+                <p className="mt-1 text-xs text-slate-300">
+                  الأكثر إتمامًا: {item.top_readers.map((reader) => `${reader.name} (${reader.juz_count})`).join("، ")}
+                </p>
+              ) : null}
             </article>
           ))
         )}
@@ -1,3 +1,9 @@
+import { useCallback, useEffect, useRef, useState } from "react";
+
+const TAP_FLUSH_MS = 2000;
+// يطابق الحد الأعلى الذي يقبله الخادم في الطلب الواحد.
+const TAP_BATCH_MAX = 500;
+
 function TasbeehButton({ phrase, count, onClick, active }) {
   return (
     <button
@@ -17,6 +23,51 @@ function TasbeehButton({ phrase, count, onClick, active }) {
 }
 
 export default function TasbeehSection({ counters, onIncrement, activePhrase }) {
+  // الضغطات تُجمع محليًا وتُرسل دفعة واحدة لكل ذكر بدل طلب لكل ضغطة.
+  const [pendingTaps, setPendingTaps] = useState({});
+  const queuedRef = useRef({});
+  const timerRef = useRef(null);
+  const onIncrementRef = useRef(onIncrement);
+
+  useEffect(() => {
+    onIncrementRef.current = onIncrement;
+  }, [onIncrement]);
+
+  const flushTaps = useCallback(() => {
+    if (timerRef.current) {
+      clearTimeout(timerRef.current);
+      timerRef.current = null;
+    }
+    const batch = queuedRef.current;
+    queuedRef.current = {};
+
+    for (const [phrase, count] of Object.entries(batch)) {
+      Promise.resolve(onIncrementRef.current(phrase, count)).finally(() => {
+        setPendingTaps((prev) => ({ ...prev, [phrase]: Math.max(0, (prev[phrase] || 0) - count) }));
+      });
+    }
+  }, []);
+
+  useEffect(() => {
+    window.addEventListener("pagehide", flushTaps);
+    return () => {
+      window.removeEventListener("pagehide", flushTaps);
+      flushTaps();
+    };
+  }, [flushTaps]);
+
+  const handleTap = (phrase) => {
+    const queued = (queuedRef.current[phrase] || 0) + 1;
+    queuedRef.current = { ...queuedRef.current, [phrase]: queued };
+    setPendingTaps((prev) => ({ ...prev, [phrase]: (prev[phrase] || 0) + 1 }));
+
+    if (queued >= TAP_BATCH_MAX) {
+      flushTaps();
+    } else if (!timerRef.current) {
+      timerRef.current = setTimeout(flushTaps, TAP_FLUSH_MS);
+    }
+  };
+
   return (
     <section className="space-y-4">
       <h2 className="relative inline-flex text-xl font-bold text-goldSoft sm:text-2xl">
@@ -28,9 +79,9 @@ export default function TasbeehSection({ counters, onIncrement, activePhrase })
           <TasbeehButton
             key={counter.id}
             phrase={counter.phrase}
-            count={counter.count}
+            count={counter.count + (pendingTaps[counter.phrase] || 0)}
             active={activePhrase === counter.phrase}
-            onClick={() => onIncrement(counter.phrase)}
+            onClick={() => handleTap(counter.phrase)}
           />
         ))}
       </div>
@@ -19,8 +19,43 @@ const api = axios.create({
   timeout: 12000
 });
 
-export const getCurrentKhatma = async () => {
-  const { data } = await api.get("/current-khatma/");
+// طلبات GET مشروطة: نحفظ آخر ETag وبياناته لكل رابط ونرسل If-None-Match،
+// فيرد الخادم 304 دون جسم ونعيد نفس البيانات المحفوظة.
+const conditionalCache = new Map();
+
+const isGetRequest = (config) => (config.method || "get").toLowerCase() === "get";
+
+api.interceptors.request.use((config) => {
+  if (isGetRequest(config)) {
+    const cached = conditionalCache.get(api.getUri(config));
+    if (cached) {
+      config.headers.set("If-None-Match", cached.etag);
+    }
+    config.validateStatus = (status) => (status >= 200 && status < 300) || status === 304;
+  }
+  return config;
+});
+
+api.interceptors.response.use((response) => {
+  if (!isGetRequest(response.config)) {
+    return response;
+  }
+
+  const key = api.getUri(response.config);
+  const cached = conditionalCache.get(key);
+  if (response.status === 304 && cached) {
+    return { ...response, status: 200, data: cached.data };
+  }
+
+  const etag = response.headers?.etag;
+  if (etag) {
+    conditionalCache.set(key, { etag, data: response.data });
+  }
+  return response;
+});
+
+export const getCurrentKhatma = async (number = null) => {
+  const { data } = await api.get("/current-khatma/", { params: number ? { number } : {} });
   return data;
 };
 
@@ -29,6 +64,21 @@ export const reserveJuz = async (payload) => {
   return data;
 };
 
+export const reserveNextJuz = async (payload) => {
+  const { data } = await api.post("/reserve/next/", payload);
+  return data;
+};
+
+export const joinWaitlist = async (payload) => {
+  const { data } = await api.post("/waitlist/", payload);
+  return data;
+};
+
+export const getWaitlist = async (name) => {
+  const { data } = await api.get("/waitlist/", { params: { name } });
+  return data;
+};
+
 export const completeJuz = async (payload) => {
   const { data } = await api.post("/complete-juz/", payload);
   return data;
@@ -78,8 +128,9 @@ export const getProfileStats = async (name, refCode = "") => {
   return data;
 };
 
-export const getKhatmaHistory = async (limit = 20) => {
-  const { data } = await api.get("/khatma-history/", { params: { limit } });
+// before = رقم آخر ختمة في الصفحة السابقة (ترقيم keyset).
+export const getKhatmaHistory = async (limit = 20, before = null) => {
+  const { data } = await api.get("/khatma-history/", { params: before ? { limit, before } : { limit } });
   return data;
 };
 